@@ -0,0 +1,343 @@
+import asyncio
+import itertools
+import time
+
+from collections import Counter
+from types import SimpleNamespace
+
+import discord
+
+# Snowflake-like ids, later than any in utils.data. discord.py hashes models
+# by the timestamp bits so every fake id gets its own.
+_timestamps = itertools.count(1 << 38)
+
+
+def snowflake() -> int:
+    return next(_timestamps) << 22
+
+
+class Recorder:
+    """Counts the Discord API calls made through the fakes by route.
+
+    Every call sleeps for `latency` seconds first, like a request would.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def call(self, route: str) -> None:
+        self.calls[route] += 1
+        await asyncio.sleep(self.latency)
+
+
+# The fakes subclass the real discord.py types so `isinstance` checks in the
+# bot see them as the real thing. The real types keep their state in slots
+# behind properties; shadowing those names with plain class attributes lets
+# the fakes store them as ordinary instance attributes instead.
+
+
+class FakeRole:
+    def __init__(self, guild, name: str, role_id: int | None = None):
+        self.id = role_id or snowflake()
+        self.name = name
+        self.guild = guild
+        self.members = set()
+
+    @property
+    def mention(self) -> str:
+        return f"<@&{self.id}>"
+
+    async def edit(self, **kwargs):
+        await self.guild.recorder.call("role.edit")
+        self.name = kwargs.get("name", self.name)
+        return self
+
+    async def delete(self, **kwargs):
+        await self.guild.recorder.call("role.delete")
+        self.guild.roles.pop(self.id, None)
+
+
+class FakeMember(discord.Member):
+    id = name = guild = display_name = None
+
+    def __init__(self, guild, name: str, member_id: int | None = None, dms=True):
+        self.id = member_id or snowflake()
+        self.name = name
+        self.display_name = name
+        self.guild = guild
+        self.dms = dms  # whether the member accepts DMs from the bot
+        self._fake_roles = []
+
+    def __hash__(self):
+        return self.id >> 22
+
+    def __repr__(self):
+        return f"<FakeMember id={self.id} name={self.name!r}>"
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    @property
+    def roles(self) -> list:
+        return list(self._fake_roles)
+
+    @property
+    def bot(self) -> bool:
+        return False
+
+    async def add_roles(self, *roles, reason=None, atomic=True):
+        for role in roles:
+            await self.guild.recorder.call("member.add_role")
+            if role not in self._fake_roles:
+                self._fake_roles.append(role)
+                role.members.add(self)
+
+    async def remove_roles(self, *roles, reason=None, atomic=True):
+        for role in roles:
+            await self.guild.recorder.call("member.remove_role")
+            if role in self._fake_roles:
+                self._fake_roles.remove(role)
+                role.members.discard(self)
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.recorder.call("dm.send")
+        if not self.dms:
+            raise discord.Forbidden(
+                SimpleNamespace(status=403, reason="Forbidden"),
+                {"code": 50007, "message": "Cannot send messages to this user"},
+            )
+        return FakeMessage(None, self.guild.me, content)
+
+
+class FakeTextChannel(discord.TextChannel):
+    id = name = guild = topic = None
+
+    def __init__(self, guild, name: str, topic=None, overwrites=None, channel_id=None):
+        self.id = channel_id or snowflake()
+        self.name = name
+        self.guild = guild
+        self.topic = topic
+        # Prefix for this channel's routes in the recorder, so batched log
+        # messages can be told apart from a handler's own calls
+        self.route = "channel"
+        self._fake_overwrites = dict(overwrites or {})
+        self.messages = {}  # id -> FakeMessage
+        self.pins = set()
+
+    def __repr__(self):
+        return f"<FakeTextChannel id={self.id} name={self.name!r}>"
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    @property
+    def overwrites(self) -> dict:
+        return dict(self._fake_overwrites)
+
+    @property
+    def members(self) -> list:
+        return list(self.guild.members.values())
+
+    def overwrites_for(self, target) -> discord.PermissionOverwrite:
+        overwrite = self._fake_overwrites.get(target)
+        return discord.PermissionOverwrite(**dict(overwrite or ()))
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.recorder.call(f"{self.route}.send")
+        message = FakeMessage(self, self.guild.me, content)
+        self.messages[message.id] = message
+        return message
+
+    async def edit(self, **kwargs):
+        await self.guild.recorder.call("channel.edit")
+        if "overwrites" in kwargs:
+            self._fake_overwrites = dict(kwargs.pop("overwrites"))
+        self.name = kwargs.get("name", self.name)
+        self.topic = kwargs.get("topic", self.topic)
+        return self
+
+    async def set_permissions(
+        self, target, *, overwrite=discord.utils.MISSING, **kwargs
+    ):
+        await self.guild.recorder.call("channel.set_permissions")
+        if overwrite is None:
+            self._fake_overwrites.pop(target, None)
+        else:
+            if overwrite is discord.utils.MISSING:
+                overwrite = discord.PermissionOverwrite(**kwargs)
+            self._fake_overwrites[target] = overwrite
+
+    async def delete(self, **kwargs):
+        await self.guild.recorder.call("channel.delete")
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeVoiceChannel(discord.VoiceChannel):
+    id = name = guild = None
+
+    def __init__(self, guild, name: str, overwrites=None):
+        self.id = snowflake()
+        self.name = name
+        self.guild = guild
+        self._fake_overwrites = dict(overwrites or {})
+        self.voice_members = []
+
+    def __repr__(self):
+        return f"<FakeVoiceChannel id={self.id} name={self.name!r}>"
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    @property
+    def overwrites(self) -> dict:
+        return dict(self._fake_overwrites)
+
+    @property
+    def members(self) -> list:
+        return list(self.voice_members)
+
+    async def delete(self, **kwargs):
+        await self.guild.recorder.call("channel.delete")
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content=None):
+        self.id = snowflake()
+        self.channel = channel
+        self.author = author
+        self.content = content or ""
+        self.pinned = False
+
+    @property
+    def jump_url(self) -> str:
+        guild_id = self.channel.guild.id if self.channel else "@me"
+        channel_id = self.channel.id if self.channel else 0
+        return f"https://discord.com/channels/{guild_id}/{channel_id}/{self.id}"
+
+    async def _recorder_call(self, route):
+        await self.channel.guild.recorder.call(route)
+
+    async def delete(self, **kwargs):
+        await self._recorder_call("message.delete")
+        self.channel.messages.pop(self.id, None)
+
+    async def pin(self, **kwargs):
+        await self._recorder_call("message.pin")
+        self.pinned = True
+        self.channel.pins.add(self.id)
+
+    async def unpin(self, **kwargs):
+        await self._recorder_call("message.unpin")
+        self.pinned = False
+        self.channel.pins.discard(self.id)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, recorder: Recorder):
+        self.id = guild_id
+        self.recorder = recorder
+        self.roles = {}
+        self.channels = {}
+        self.members = {}
+        self.chunked = True  # every member is cached
+        self.default_role = self._add_role(FakeRole(self, "@everyone", guild_id))
+        self.me = FakeMember(self, "Club Bot")
+
+    def _add_role(self, role: FakeRole) -> FakeRole:
+        self.roles[role.id] = role
+        return role
+
+    def add_channel(self, channel):
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_member(self, member: FakeMember) -> FakeMember:
+        self.members[member.id] = member
+        return member
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    async def create_role(self, name: str, **kwargs) -> FakeRole:
+        await self.recorder.call("guild.create_role")
+        return self._add_role(FakeRole(self, name))
+
+    async def create_text_channel(
+        self, name: str, topic=None, overwrites=None, **kwargs
+    ):
+        await self.recorder.call("guild.create_channel")
+        return self.add_channel(FakeTextChannel(self, name, topic, overwrites))
+
+    async def create_voice_channel(self, name: str, overwrites=None, **kwargs):
+        await self.recorder.call("guild.create_channel")
+        return self.add_channel(FakeVoiceChannel(self, name, overwrites))
+
+
+class FakeResponse:
+    """`Interaction.response`, each response is one API call"""
+
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+        self.responded_at = None  # perf_counter() once the response went out
+        self.sent = []  # (content, kwargs) of the messages sent
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _respond(self):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        await self._interaction.guild.recorder.call("interaction.response")
+        self.responded_at = time.perf_counter()
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond()
+        self.sent.append((content, kwargs))
+
+    async def send_modal(self, modal):
+        await self._respond()
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+    async def autocomplete(self, choices):
+        await self._respond()
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self._interaction.guild.recorder.call("interaction.followup")
+        return FakeMessage(self._interaction.channel, self._interaction.client, content)
+
+
+class FakeInteraction:
+    def __init__(self, guild: FakeGuild, user: FakeMember, channel=None, data=None):
+        self.id = snowflake()
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id if channel else None
+        self.client = guild.me
+        self.data = data or {}
+        self.extras = {}
+        self.command = None
+        self.namespace = SimpleNamespace()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
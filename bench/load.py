@@ -0,0 +1,247 @@
+"""Fires concurrent simulated interactions at the command tree.
+
+    python -m bench.load --interactions 5000 --rate 1000 --db-latency 2 --api-latency 20
+
+Interactions arrive at `--rate` per second (all at once if 0) in the
+proportions given by `--mix`, and run concurrently like they would in the
+bot. Reports throughput, latency until each interaction was responded to,
+event loop lag and how often lookups were served from the cache.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from collections import Counter, defaultdict
+
+import discord
+
+from bench.fakes import FakeMessage
+from bench.run import percentile
+from bench.world import World, build_world, install
+
+# The bot's modules must be imported after bench.world has set up the environment
+import main
+
+from utils.actions import actions
+from utils.cache import cache, club_cache
+
+DEFAULT_MIX = "join=30,leave=20,autocomplete=35,delete=10,mute=5"
+LAG_INTERVAL = 0.01  # seconds between event loop lag samples
+
+
+def command(name: str, kind=discord.AppCommandType.chat_input):
+    return main.client.tree.get_command(name, type=kind).callback
+
+
+# Each scenario picks its arguments up front and returns the interaction along
+# with the call to make
+
+
+def join(rng, world):
+    interaction = world.interaction(rng.choice(world.members))
+    club = str(rng.choice(world.clubs)["_id"])
+    return interaction, lambda: command("join")(interaction, club)
+
+
+def leave(rng, world):
+    member = rng.choice(world.members)
+    joined = world.joined(member) or [rng.choice(world.clubs)["_id"]]
+    interaction = world.interaction(member)
+    club = str(rng.choice(joined))
+    return interaction, lambda: command("leave")(interaction, club)
+
+
+def autocomplete(rng, world):
+    interaction = world.interaction(rng.choice(world.members))
+    name = rng.choice(world.clubs)["name"].lower()
+    current = name[: rng.randint(1, 6)]
+    choices = rng.choice((main.join_club_choices, main.leave_club_choices))
+
+    async def call():
+        await interaction.response.autocomplete(await choices(interaction, current))
+
+    return interaction, call
+
+
+def delete(rng, world):
+    club = rng.choice(world.clubs)
+    channel = world.channel(club)
+    message = FakeMessage(channel, rng.choice(world.members), "spam")
+    channel.messages[message.id] = message
+    interaction = world.interaction(world.owner(club), channel)
+    callback = command("Delete message", discord.AppCommandType.message)
+    return interaction, lambda: callback(interaction, message)
+
+
+def mute(rng, world):
+    club = rng.choice(world.clubs)
+    interaction = world.interaction(world.owner(club), world.channel(club))
+    user = rng.choice(world.members)
+    time = rng.choice((0, 10, 60))
+    return interaction, lambda: command("mute")(interaction, user=user, time=time)
+
+
+def approve(rng, world):
+    if world.unverified:
+        club = world.unverified.pop()
+    else:
+        # Every request has been handled, this one has already been approved
+        club = rng.choice(world.clubs)
+    interaction = world.interaction(world.server_mod)
+    return interaction, lambda: command("approve")(interaction, str(club["_id"]))
+
+
+SCENARIOS = {
+    "join": join,
+    "leave": leave,
+    "autocomplete": autocomplete,
+    "delete": delete,
+    "mute": mute,
+    "approve": approve,
+}
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown interaction {name!r}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+async def monitor(lags: list, depths: list) -> None:
+    """Samples how late the event loop wakes up and the action queue depth"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(loop.time() - start - LAG_INTERVAL)
+        depths.append(actions.depth)
+
+
+async def fire(world, name, scenario, rng, latencies, errors) -> None:
+    interaction, call = scenario(rng, world)
+    start = time.perf_counter()
+    try:
+        await call()
+    except Exception as e:
+        errors[name][type(e).__name__] += 1
+    responded = interaction.response.responded_at or time.perf_counter()
+    latencies[name].append(responded - start)
+
+
+def hit_rate(hits: int, total: int) -> str:
+    return f"{hits / total:.1%} of {total}" if total else "n/a"
+
+
+def report(world: World, latencies, errors, elapsed, drained, lags, depths) -> None:
+    total = sum(len(values) for values in latencies.values())
+    print(
+        f"{total} interactions in {elapsed:.2f}s: {total / elapsed:.1f}/s, "
+        f"queued actions drained {drained:.2f}s later\n"
+    )
+    print(
+        f"{'latency (ms)':<16}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+        f"{'errors':>8}"
+    )
+    every = [latency for values in latencies.values() for latency in values]
+    for name, values in [*sorted(latencies.items()), ("all", every)]:
+        values = [value * 1000 for value in values]
+        failed = sum(errors[name].values()) if name in errors else ""
+        print(
+            f"{name:<16}{len(values):>7}"
+            + "".join(f"{percentile(values, p):>9.2f}" for p in (50, 95, 99, 100))
+            + f"{failed:>8}"
+        )
+    for name, counts in errors.items():
+        for error, count in counts.items():
+            print(f"  {name}: {count} x {error}")
+
+    lags = [lag * 1000 for lag in lags]
+    print(
+        f"\nEvent loop lag (ms): p50 {percentile(lags, 50):.2f}, "
+        f"p99 {percentile(lags, 99):.2f}, max {max(lags, default=0):.2f}"
+    )
+    print(f"Action queue depth: peak {max(depths, default=0)}")
+
+    clubs, users = cache["clubs"], cache["users"]
+    cache_hits = clubs.hits + users.hits + club_cache.hits
+    db_reads = sum(
+        count
+        for (_, op), count in world.mongo.round_trips.items()
+        if op in ("find_one", "find")
+    )
+    print(
+        f"Cache hit rate: clubs {hit_rate(clubs.hits, clubs.hits + clubs.misses)}, "
+        f"users {hit_rate(users.hits, users.hits + users.misses)}, "
+        f"club_cache {hit_rate(club_cache.hits, club_cache.hits + club_cache.misses)}"
+        " lookups"
+    )
+    print(
+        f"Reads served from the cache: {hit_rate(cache_hits, cache_hits + db_reads)}"
+        f" ({db_reads} went to the database)"
+    )
+    print(f"Database round trips: {dict(world.mongo.round_trips.most_common())}")
+
+
+async def run(args) -> None:
+    world = build_world(
+        clubs=args.clubs,
+        users=args.users,
+        db_latency=args.db_latency / 1000,
+        api_latency=args.api_latency / 1000,
+        seed=args.seed,
+    )
+    await install(world)
+    rng = random.Random(args.seed)
+    names, weights = zip(*parse_mix(args.mix).items())
+
+    latencies, errors = defaultdict(list), defaultdict(Counter)
+    lags, depths = [], []
+    sampler = asyncio.create_task(monitor(lags, depths))
+
+    start = time.perf_counter()
+    tasks = []
+    for name in rng.choices(names, weights, k=args.interactions):
+        tasks.append(
+            asyncio.create_task(
+                fire(world, name, SCENARIOS[name], rng, latencies, errors)
+            )
+        )
+        if args.rate:
+            # Poisson arrivals
+            await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    await actions.join()
+    drained = time.perf_counter() - start - elapsed
+    sampler.cancel()
+
+    report(world, latencies, errors, elapsed, drained, lags, depths)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interactions", type=int, default=5000)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="per second, 0 fires them all at once"
+    )
+    parser.add_argument(
+        "--mix",
+        default=DEFAULT_MIX,
+        help=f"weights per interaction (default {DEFAULT_MIX})",
+    )
+    parser.add_argument("--clubs", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--db-latency", type=float, default=0, help="milliseconds")
+    parser.add_argument("--api-latency", type=float, default=0, help="milliseconds")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
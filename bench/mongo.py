@@ -0,0 +1,467 @@
+import asyncio
+import copy
+
+from collections import Counter
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+_MISSING = object()
+
+
+class MemoryClient:
+    """In-memory stand-in for the parts of AsyncIOMotorClient the bot uses.
+
+    Every operation that would be a round trip to the server sleeps for
+    `latency` seconds and is counted in `round_trips` by (collection, op).
+    Filters and updates support the operators used in `utils`, not the
+    whole query language.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = Counter()
+        self._databases = {}
+        self.admin = MemoryDatabase(self, "admin")
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def _round_trip(self, collection: str, op: str) -> None:
+        self.round_trips[(collection, op)] += 1
+        await asyncio.sleep(self.latency)
+
+
+class MemoryDatabase:
+    def __init__(self, client: MemoryClient, name: str):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, command, *args, **kwargs):
+        await self.client._round_trip(self.name, "command")
+        return {"ok": 1.0}
+
+
+class MemoryCollection:
+    def __init__(self, database: MemoryDatabase, name: str):
+        self.database = database
+        self.name = name
+        self._documents = {}  # _id -> document
+        self._indexes = {"_id_": {"key": [("_id", 1)]}}
+        # Index name -> field list of a unique index, with its filter
+        self._unique = {}
+
+    async def _round_trip(self, op: str) -> None:
+        await self.database.client._round_trip(self.name, op)
+
+    def insert_many_sync(self, documents) -> None:
+        """Loads documents without counting round trips, for seeding datasets"""
+        for document in documents:
+            document = copy.deepcopy(document)
+            document.setdefault("_id", ObjectId())
+            self._documents[document["_id"]] = document
+
+    def _matching(self, query):
+        query = query or {}
+        document_id = query.get("_id", _MISSING)
+        if document_id is not _MISSING and not isinstance(document_id, dict):
+            # Point lookup, like the _id index
+            document = self._documents.get(document_id)
+            return iter([document] if document and matches(document, query) else [])
+        return (doc for doc in self._documents.values() if matches(doc, query))
+
+    def _check_unique(self, document) -> None:
+        for fields, partial in self._unique.values():
+            if not matches(document, partial):
+                continue
+            key = [get_path(document, field) for field in fields]
+            for other in self._documents.values():
+                if (
+                    other["_id"] != document["_id"]
+                    and matches(other, partial)
+                    and [get_path(other, field) for field in fields] == key
+                ):
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key {dict(zip(fields, key))}"
+                    )
+
+    async def find_one(self, query=None, projection=None, **kwargs):
+        await self._round_trip("find_one")
+        document = next(self._matching(query), None)
+        return project(document, projection) if document else None
+
+    def find(self, query=None, projection=None, **kwargs):
+        return MemoryCursor(self, query, projection)
+
+    async def count_documents(self, query, **kwargs):
+        await self._round_trip("count_documents")
+        return sum(1 for _ in self._matching(query))
+
+    async def insert_one(self, document, **kwargs):
+        await self._round_trip("insert_one")
+        document = copy.deepcopy(document)
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(f"E11000 duplicate key _id {document['_id']}")
+        self._check_unique(document)
+        self._documents[document["_id"]] = document
+        return InsertOneResult(document["_id"], True)
+
+    def _update(self, query, update, upsert, many):
+        matched = modified = 0
+        upserted_id = None
+        before = None
+        for document in list(self._matching(query)):
+            matched += 1
+            if before is None:
+                before = copy.deepcopy(document)
+            updated = copy.deepcopy(document)
+            apply_update(updated, update)
+            if updated != document:
+                if any(
+                    get_path(updated, field) != get_path(document, field)
+                    for fields, _ in self._unique.values()
+                    for field in fields
+                ):
+                    self._check_unique(updated)
+                self._documents[document["_id"]] = updated
+                modified += 1
+            if not many:
+                break
+
+        if not matched and upsert:
+            document = {
+                key: value
+                for key, value in query.items()
+                if not key.startswith("$") and not isinstance(value, dict)
+            }
+            apply_update(document, update, insert=True)
+            document.setdefault("_id", ObjectId())
+            self._check_unique(document)
+            self._documents[document["_id"]] = document
+            upserted_id = document["_id"]
+
+        raw = {"n": matched + (upserted_id is not None), "nModified": modified}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return raw, before
+
+    async def update_one(self, query, update, upsert=False, **kwargs):
+        await self._round_trip("update_one")
+        raw, _ = self._update(query, update, upsert, many=False)
+        return UpdateResult(raw, True)
+
+    async def update_many(self, query, update, upsert=False, **kwargs):
+        await self._round_trip("update_many")
+        raw, _ = self._update(query, update, upsert, many=True)
+        return UpdateResult(raw, True)
+
+    async def find_one_and_update(
+        self,
+        query,
+        update,
+        projection=None,
+        upsert=False,
+        return_document=False,
+        **kwargs,
+    ):
+        await self._round_trip("find_one_and_update")
+        raw, before = self._update(query, update, upsert, many=False)
+        if return_document:
+            document_id = raw.get("upserted") or (before and before["_id"])
+            document = self._documents.get(document_id)
+        else:
+            document = before
+        return project(document, projection) if document else None
+
+    async def delete_one(self, query, **kwargs):
+        await self._round_trip("delete_one")
+        document = next(self._matching(query), None)
+        if document:
+            del self._documents[document["_id"]]
+        return DeleteResult({"n": int(document is not None)}, True)
+
+    async def delete_many(self, query, **kwargs):
+        await self._round_trip("delete_many")
+        ids = [document["_id"] for document in self._matching(query)]
+        for document_id in ids:
+            del self._documents[document_id]
+        return DeleteResult({"n": len(ids)}, True)
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        await self._round_trip("bulk_write")
+        result = {
+            "writeErrors": [],
+            "writeConcernErrors": [],
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+        }
+        for index, request in enumerate(requests):
+            # pymongo's write models don't expose their fields publicly
+            many = type(request).__name__ == "UpdateMany"
+            raw, _ = self._update(
+                request._filter, request._doc, bool(request._upsert), many=many
+            )
+            if "upserted" in raw:
+                result["nUpserted"] += 1
+                result["upserted"].append({"index": index, "_id": raw["upserted"]})
+            else:
+                result["nMatched"] += raw["n"]
+            result["nModified"] += raw["nModified"]
+        return BulkWriteResult(result, True)
+
+    async def index_information(self):
+        await self._round_trip("index_information")
+        return copy.deepcopy(self._indexes)
+
+    async def create_indexes(self, indexes, **kwargs):
+        await self._round_trip("create_indexes")
+        names = []
+        for index in indexes:
+            document = index.document
+            name = document["name"]
+            if name in self._indexes:
+                if self._indexes[name] != index_information(document):
+                    raise OperationFailure(
+                        f"An existing index has the same name as the requested "
+                        f"index: {name}",
+                        code=86,
+                    )
+                continue
+            self._indexes[name] = index_information(document)
+            if document.get("unique"):
+                self._unique[name] = (
+                    list(document["key"]),
+                    document.get("partialFilterExpression", {}),
+                )
+            names.append(name)
+        return names
+
+    async def drop_index(self, name: str, **kwargs):
+        await self._round_trip("drop_index")
+        if name not in self._indexes:
+            raise OperationFailure(f"index not found with name [{name}]", code=27)
+        del self._indexes[name]
+        self._unique.pop(name, None)
+
+    def watch(self, *args, **kwargs):
+        # Behave like a standalone mongod so the cache falls back to polling
+        raise OperationFailure(
+            "The $changeStream stage is only supported on replica sets", code=40573
+        )
+
+
+class MemoryCursor:
+    def __init__(self, collection: MemoryCollection, query, projection):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = []
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key, direction=1):
+        self._sort = [(key, direction)] if isinstance(key, str) else list(key)
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    async def _fetch(self):
+        if self._results is None:
+            await self._collection._round_trip("find")
+            documents = list(self._collection._matching(self._query))
+            for key, direction in reversed(self._sort):
+                documents.sort(
+                    key=lambda doc: sort_key(get_path(doc, key)), reverse=direction < 0
+                )
+            if self._limit:
+                documents = documents[: self._limit]
+            self._results = [project(doc, self._projection) for doc in documents]
+        return self._results
+
+    async def to_list(self, length=None):
+        results = await self._fetch()
+        return results if length is None else results[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in await self._fetch():
+            yield document
+
+
+def index_information(document) -> dict:
+    """How `index_information()` describes an index created from `document`"""
+    information = {"key": list(document["key"].items())}
+    for option in ("unique", "partialFilterExpression"):
+        if option in document:
+            information[option] = document[option]
+    return information
+
+
+def get_path(document, path: str):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def set_path(document, path: str, value) -> None:
+    """Sets a dotted path like MongoDB does, creating the documents on the way"""
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def sort_key(value):
+    # Missing and null sort first, like in MongoDB
+    if value is _MISSING or value is None:
+        return (0,)
+    return (1, value)
+
+
+def _compare(value, condition) -> bool:
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            match operator:
+                case "$exists":
+                    if (value is not _MISSING) != bool(operand):
+                        return False
+                case "$eq":
+                    if not _equals(value, operand):
+                        return False
+                case "$ne":
+                    if _equals(value, operand):
+                        return False
+                case "$in":
+                    if not any(_equals(value, item) for item in operand):
+                        return False
+                case "$nin":
+                    if any(_equals(value, item) for item in operand):
+                        return False
+                case "$lt" | "$lte" | "$gt" | "$gte":
+                    if value is _MISSING or value is None:
+                        return False
+                    try:
+                        if not {
+                            "$lt": value < operand,
+                            "$lte": value <= operand,
+                            "$gt": value > operand,
+                            "$gte": value >= operand,
+                        }[operator]:
+                            return False
+                    except TypeError:
+                        return False
+                case _:
+                    raise NotImplementedError(f"Unsupported query operator {operator}")
+        return True
+    return _equals(value, condition)
+
+
+def _equals(value, expected) -> bool:
+    if value is _MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+
+def matches(document, query) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif not _compare(get_path(document, key), condition):
+            return False
+    return True
+
+
+def apply_update(document, update, insert: bool = False) -> None:
+    for operator, fields in update.items():
+        if operator == "$setOnInsert" and not insert:
+            continue
+        for field, value in fields.items():
+            match operator:
+                case "$set" | "$setOnInsert":
+                    set_path(document, field, copy.deepcopy(value))
+                case "$unset":
+                    document.pop(field, None)
+                case "$inc":
+                    document[field] = document.get(field, 0) + value
+                case "$currentDate":
+                    document[field] = datetime.utcnow()
+                case "$addToSet":
+                    items = document.setdefault(field, [])
+                    for item in value["$each"] if isinstance(value, dict) else [value]:
+                        if item not in items:
+                            items.append(item)
+                case "$push":
+                    document.setdefault(field, []).append(value)
+                case "$pull":
+                    if field in document:
+                        document[field] = [
+                            item
+                            for item in document[field]
+                            if not _compare(item, value)
+                        ]
+                case _:
+                    raise NotImplementedError(f"Unsupported update operator {operator}")
+
+
+def project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    if isinstance(projection, (list, tuple)):
+        projection = dict.fromkeys(projection, 1)
+    if any(value for key, value in projection.items() if key != "_id"):
+        projected = {
+            key: copy.deepcopy(document[key])
+            for key, value in projection.items()
+            if value and key in document
+        }
+        if projection.get("_id", 1):
+            projected["_id"] = document["_id"]
+        return projected
+    return {
+        key: copy.deepcopy(value)
+        for key, value in document.items()
+        if projection.get(key, 1)
+    }
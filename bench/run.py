@@ -0,0 +1,211 @@
+"""Benchmarks the command handlers against a synthetic guild and database.
+
+    python -m bench.run --clubs 1000 --users 5000 --db-latency 2 --api-latency 20
+
+Each handler runs `--iterations` times one after another. Latency is the time
+until the handler returns; database round trips and Discord API calls include
+work the handler queued, which is waited for before the next iteration.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from collections import Counter
+
+from bench.world import World, build_world, install
+
+# The bot's modules must be imported after bench.world has set up the environment
+import main
+
+from utils import db
+from utils.actions import actions
+from utils.cache import cache
+from utils.logs import log_sink
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def query(rng: random.Random, world: World) -> str:
+    """What someone has typed so far: a name prefix, a later word or a typo"""
+    name = rng.choice(world.clubs)["name"].lower()
+    match rng.randrange(3):
+        case 0:
+            return name[: rng.randint(1, 6)]
+        case 1:
+            return rng.choice(name.split())[: rng.randint(2, 6)]
+        case _:
+            word = rng.choice(name.split())
+            i = rng.randrange(len(word))
+            return word[:i] + word[i + 1 :]
+
+
+def club_member(rng: random.Random, world: World, club):
+    """A regular member who may be sanctioned in `club`"""
+    while True:
+        member = rng.choice(world.members)
+        if member.id not in club["mods"]:
+            return member
+
+
+# Each scenario sets up one call outside the timed section and returns it
+
+
+def join(rng, world):
+    member = rng.choice(world.members)
+    club = rng.choice(world.clubs)
+    return lambda: db.join_club(str(club["_id"]), world.interaction(member))
+
+
+def leave(rng, world):
+    member = rng.choice(world.members)
+    joined = world.joined(member) or [rng.choice(world.clubs)["_id"]]
+    club_id = rng.choice(joined)
+    return lambda: db.leave_club(str(club_id), world.interaction(member))
+
+
+def mute(rng, world):
+    club = rng.choice(world.clubs)
+    interaction = world.interaction(world.owner(club), world.channel(club))
+    user = club_member(rng, world, club)
+    time = rng.choice((0, 10, 60))
+    return lambda: db.mute(interaction, user, time)
+
+
+def ban(rng, world):
+    club = rng.choice(world.clubs)
+    interaction = world.interaction(world.owner(club), world.channel(club))
+    user = club_member(rng, world, club)
+    duration = rng.choice((True, 0, 60))
+    return lambda: db.ban(interaction, user, duration)
+
+
+def verify(rng, world):
+    if world.unverified:
+        club = world.unverified.pop()
+    else:
+        # Every request has been handled, this one has already been verified
+        club = rng.choice(world.clubs)
+    interaction = world.interaction(world.server_mod)
+    approve = rng.random() < 0.8
+    return lambda: db.verify_club(approve, str(club["_id"]), interaction)
+
+
+def join_choices(rng, world):
+    interaction = world.interaction(rng.choice(world.members))
+    current = query(rng, world)
+    return lambda: main.join_club_choices(interaction, current)
+
+
+def leave_choices(rng, world):
+    interaction = world.interaction(rng.choice(world.members))
+    current = query(rng, world)[:2]
+    return lambda: main.leave_club_choices(interaction, current)
+
+
+def verify_choices(rng, world):
+    interaction = world.interaction(world.server_mod)
+    current = query(rng, world)
+    return lambda: main.verify_club_choices(interaction, current)
+
+
+SCENARIOS = {
+    "join_club": join,
+    "leave_club": leave,
+    "mute": mute,
+    "ban": ban,
+    "verify_club": verify,
+    "join_club_choices": join_choices,
+    "leave_club_choices": leave_choices,
+    "verify_club_choices": verify_choices,
+}
+
+
+async def measure(world: World, scenario, iterations: int, rng: random.Random):
+    latencies, errors = [], Counter()
+    db_before, api_before = world.db_round_trips, world.api_calls
+    for _ in range(iterations):
+        call = scenario(rng, world)
+        start = time.perf_counter()
+        try:
+            await call()
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - start)
+        await actions.join()
+    return {
+        "latencies": latencies,
+        "db": (world.db_round_trips - db_before) / iterations,
+        "api": (world.api_calls - api_before) / iterations,
+        "errors": errors,
+    }
+
+
+def report(results: dict) -> None:
+    print(
+        f"{'handler (ms)':<22}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+        f"{'db/call':>9}{'api/call':>9}"
+    )
+    for name, result in results.items():
+        latencies = [latency * 1000 for latency in result["latencies"]]
+        print(
+            f"{name:<22}"
+            f"{sum(latencies) / len(latencies):>9.2f}"
+            + "".join(f"{percentile(latencies, p):>9.2f}" for p in (50, 95, 99, 100))
+            + f"{result['db']:>9.2f}{result['api']:>9.2f}"
+        )
+        for error, count in result["errors"].items():
+            print(f"  {count} x {error}")
+
+
+async def run(args) -> dict:
+    world = build_world(
+        clubs=args.clubs,
+        users=args.users,
+        unverified=args.iterations,
+        db_latency=args.db_latency / 1000,
+        api_latency=args.api_latency / 1000,
+        seed=args.seed,
+    )
+    start = time.perf_counter()
+    await install(world)
+    print(
+        f"Loaded {len(cache['clubs'])} clubs and {len(world.guild.members)} members "
+        f"in {time.perf_counter() - start:.2f}s\n"
+    )
+
+    rng = random.Random(args.seed)
+    results = {}
+    for name in args.only or SCENARIOS:
+        results[name] = await measure(world, SCENARIOS[name], args.iterations, rng)
+    report(results)
+
+    print(
+        f"\nAPI calls by route: {dict(world.recorder.calls.most_common())}"
+        f"\nLogs: {log_sink.sent} sent, {log_sink.dropped} dropped, {log_sink.depth} queued"
+        f"\nActions: {actions.done} done, {actions.failed} failed, "
+        f"{len(actions.dead_letters)} DMs dead-lettered"
+    )
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clubs", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--db-latency", type=float, default=0, help="milliseconds")
+    parser.add_argument("--api-latency", type=float, default=0, help="milliseconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, metavar="HANDLER")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
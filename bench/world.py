@@ -0,0 +1,261 @@
+import os
+import random
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import discord
+
+from bson import ObjectId
+
+from bench.fakes import (
+    FakeGuild,
+    FakeInteraction,
+    FakeMember,
+    FakeRole,
+    FakeTextChannel,
+    Recorder,
+)
+from bench.mongo import MemoryClient
+
+# utils.db connects on import; the client is lazy, so any URI will do offline
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+# Logs must go to the fake logs channel, not a real webhook
+os.environ.pop("LOGS_WEBHOOK_URL", None)
+
+import main  # noqa: E402
+
+from utils import db, migrate, reconcile, sync  # noqa: E402
+from utils.data import CHANNELS, GUILD_ID, ROLES  # noqa: E402
+from utils.logs import log_sink  # noqa: E402
+
+WORDS = (
+    "anime art astronomy baking board books chess coding cooking crypto design "
+    "drawing esports fantasy film fitness football gaming gardening guitar "
+    "hiking history java javascript linux manga math memes minecraft music "
+    "photography physics piano poetry python retro robotics rust science "
+    "space speedrun tabletop travel trivia web writing"
+).split()
+SUFFIXES = ("Club", "Society", "Hangout", "Corner", "Guild", "Lounge", "Fans")
+
+
+class World:
+    """A synthetic guild and database with clubs, members and sanctions.
+
+    Build one with `build_world`, then `install` it to point the bot at it.
+    """
+
+    def __init__(self, guild, mongo, recorder, members, clubs, unverified, server_mod):
+        self.guild = guild
+        self.mongo = mongo
+        self.recorder = recorder
+        self.members = members  # regular members, excluding club owners
+        self.clubs = clubs  # verified club documents as seeded
+        self.unverified = unverified  # club documents waiting for approval
+        self.server_mod = server_mod
+
+    def interaction(self, user, channel=None, data=None) -> FakeInteraction:
+        return FakeInteraction(self.guild, user, channel, data)
+
+    def channel(self, club) -> FakeTextChannel:
+        return self.guild.get_channel(club["channel"])
+
+    def owner(self, club) -> FakeMember:
+        return self.guild.get_member(club["owner"])
+
+    def joined(self, member) -> list:
+        """The ids of the clubs whose roles `member` has, read from the guild
+        so picking a club doesn't touch the bot's caches"""
+        roles = {role.id for role in member.roles}
+        return [club["_id"] for club in self.clubs if club["role"] in roles]
+
+    @property
+    def api_calls(self) -> int:
+        """API calls made so far, excluding batched log messages"""
+        return sum(
+            count
+            for route, count in self.recorder.calls.items()
+            if not route.startswith("logs.")
+        )
+
+    @property
+    def db_round_trips(self) -> int:
+        return sum(self.mongo.round_trips.values())
+
+
+def club_name(rng: random.Random, taken: set) -> str:
+    while True:
+        words = rng.sample(WORDS, rng.choice((1, 1, 2)))
+        name = " ".join(word.capitalize() for word in words)
+        name = f"{name} {rng.choice(SUFFIXES)}"
+        if name in taken:
+            name = f"{name} {len(taken)}"
+        if name not in taken:
+            taken.add(name)
+            return name
+
+
+def give_role(member: FakeMember, role: FakeRole) -> None:
+    member._fake_roles.append(role)
+    role.members.add(member)
+
+
+def build_world(
+    clubs: int = 1000,
+    users: int = 5000,
+    clubs_per_user: int = 3,
+    unverified: int = 100,
+    sanctioned: float = 0.02,
+    closed_dms: float = 0.05,
+    db_latency: float = 0.0,
+    api_latency: float = 0.0,
+    seed: int = 0,
+) -> World:
+    """Generates a guild and a matching in-memory database.
+
+    Args:
+        clubs (int): The number of verified clubs.
+        users (int): The number of regular members.
+        clubs_per_user (int): How many clubs each member joins on average.
+        unverified (int): The number of club requests waiting for approval.
+        sanctioned (float): The fraction of members with an active mute or ban.
+        closed_dms (float): The fraction of members who don't accept DMs.
+        db_latency (float): Seconds added to every database round trip.
+        api_latency (float): Seconds added to every Discord API call.
+        seed (int): Seed for the random generator, worlds are reproducible.
+    """
+    rng = random.Random(seed)
+    recorder = Recorder(api_latency)
+    mongo = MemoryClient(db_latency)
+    guild = FakeGuild(GUILD_ID, recorder)
+    now = datetime.utcnow()
+
+    for role_id in {ROLES["MODS"], ROLES["MUTE"], ROLES["CADMIN"], ROLES["ADMIN"]}:
+        guild.roles[role_id] = FakeRole(guild, str(role_id), role_id)
+    guild.add_channel(FakeTextChannel(guild, "mods", channel_id=CHANNELS["MODS"]))
+    logs = guild.add_channel(
+        FakeTextChannel(guild, "logs", channel_id=CHANNELS["LOGS"])
+    )
+    logs.route = "logs"
+
+    server_mod = guild.add_member(FakeMember(guild, "server-mod"))
+    give_role(server_mod, guild.get_role(ROLES["MODS"]))
+
+    members = [
+        guild.add_member(
+            FakeMember(guild, f"member-{i}", dms=rng.random() >= closed_dms)
+        )
+        for i in range(users)
+    ]
+
+    names = set()
+    club_docs, unverified_docs, user_clubs = [], [], {}
+    for i in range(clubs + unverified):
+        owner = guild.add_member(FakeMember(guild, f"owner-{i}"))
+        club = {
+            "_id": ObjectId(),
+            "guild": guild.id,
+            "owner": owner.id,
+            "name": club_name(rng, names),
+            "topic": "A synthetic club",
+            "verified": i < clubs,
+            "mods": [member.id for member in rng.sample(members, 2)],
+            "mod_perms": rng.sample(
+                ["delete", "pin", "mute", "ban"], rng.randint(0, 4)
+            ),
+            "bubble": None,
+            "updated_at": now,
+        }
+        user_clubs[owner.id] = [club["_id"]] if club["verified"] else []
+        if not club["verified"]:
+            unverified_docs.append(club)
+            continue
+
+        role = FakeRole(guild, f"{club['name']} Member")
+        guild.roles[role.id] = role
+        channel = guild.add_channel(
+            FakeTextChannel(
+                guild,
+                club["name"],
+                club["topic"],
+                {
+                    owner: discord.PermissionOverwrite(manage_messages=True),
+                    role: discord.PermissionOverwrite(
+                        send_messages=True, view_channel=True
+                    ),
+                },
+            )
+        )
+        club.update(role=role.id, channel=channel.id)
+        give_role(owner, role)
+        club_docs.append(club)
+
+    for member in members:
+        joined = rng.sample(
+            club_docs, min(len(club_docs), rng.randint(0, clubs_per_user * 2))
+        )
+        user_clubs[member.id] = [club["_id"] for club in joined]
+        for club in joined:
+            give_role(member, guild.get_role(club["role"]))
+
+    sanctions = []
+    for member in rng.sample(members, int(len(members) * sanctioned)):
+        kind = rng.choice(("mute", "ban"))
+        sanctions.append(
+            {
+                "user": member.id,
+                "club": rng.choice(club_docs)["_id"],
+                "kind": kind,
+                "active": True,
+                "expiration": rng.choice(
+                    (None, now + timedelta(days=rng.randint(1, 30)))
+                ),
+                "moderator": server_mod.id,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+
+    owners = {club["owner"] for club in club_docs}
+    database = mongo.data
+    database.clubs.insert_many_sync(club_docs + unverified_docs)
+    database.users.insert_many_sync(
+        {
+            "_id": user_id,
+            "clubs": joined,
+            "owns_club_in": [guild.id] if user_id in owners else [],
+            "updated_at": now,
+        }
+        for user_id, joined in user_clubs.items()
+    )
+    database.sanctions.insert_many_sync(sanctions)
+
+    return World(
+        guild, mongo, recorder, members, club_docs, unverified_docs, server_mod
+    )
+
+
+async def install(world: World) -> None:
+    """Points the bot's modules at `world` and loads their caches from it"""
+    database = world.mongo.data
+    for module in (db, main):
+        module.db_client = world.mongo
+        module.db = database
+    db.clubs, db.users, db.sanctions = (
+        database.clubs,
+        database.users,
+        database.sanctions,
+    )
+    for module in (sync, migrate, reconcile):
+        module.db = database
+    main.client.get_guild = lambda guild_id: (
+        world.guild if guild_id == GUILD_ID else None
+    )
+
+    await db.ensure_indexes()
+    await db.migrate_guilds()
+    await sync.reload()
+    await db.load_expiries()
+    log_sink.start(SimpleNamespace(get_channel=world.guild.get_channel))
+    world.mongo.round_trips.clear()
+    world.recorder.calls.clear()
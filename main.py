@@ -1,3 +1,4 @@
+import asyncio
 import os
 
 from datetime import datetime, timedelta, timezone
@@ -8,33 +9,67 @@ from discord import Interaction, PartialEmoji, TextChannel, app_commands
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
 
-from utils.data import CHANNELS, COLORS, GUILD_ID
+from utils import guilds, metrics, sync, trace
+from utils.actions import BACKGROUND, actions
+from utils.cache import cache
+from utils.commands import sync_commands
+from utils.data import BUBBLE_GRACE_PERIOD, COLORS
 from utils.db import (
+    cache_club,
     create_join_bubble,
     db,
     db_client,
     edit_club,
+    ensure_indexes,
     get_club_by_channel,
     join_club,
+    configure_guild,
+    load_expiries,
+    load_user,
+    migrate_guilds,
+    migrate_sanctions,
+    touch,
     verify_club,
     leave_club,
+    lift_sanctions,
     mute,
     ban,
+    set_muted,
 )
+from utils.expiry import Expiry, expiries
+from utils.logs import log_sink
 from utils.messages import create_embed
+from utils.migrate import import_clubs
+from utils.permissions import ClubPermission, resolve
+from utils.reconcile import reconcile
+from utils.search import MAX_CHOICES, normalize
 from utils.ui import ClubCreation
 
+# Run one process per group of shards by giving each its own SHARD_IDS, e.g.
+# SHARD_COUNT=4 with SHARD_IDS=0,1 and SHARD_IDS=2,3. Without them discord.py
+# runs every shard the gateway recommends in this process.
+SHARD_COUNT = os.environ.get("SHARD_COUNT")
+SHARD_IDS = os.environ.get("SHARD_IDS")
 
-class Client(discord.Client):
+
+class Client(discord.AutoShardedClient):
     def __init__(self):
         intents = discord.Intents.all()
 
-        super().__init__(intents=intents)
+        super().__init__(
+            intents=intents,
+            shard_count=int(SHARD_COUNT) if SHARD_COUNT else None,
+            shard_ids=(
+                [int(shard) for shard in SHARD_IDS.split(",")] if SHARD_IDS else None
+            ),
+        )
         self.tree = app_commands.CommandTree(self)
 
     async def setup_hook(self):
-        await self.tree.sync()
-        print(f"Synced slash commands for {self.user}")
+        if await sync_commands(self.tree):
+            print(f"Synced slash commands for {self.user}")
+        else:
+            print("Slash commands unchanged since the last sync, not syncing")
 
 
 client = Client()
@@ -45,6 +80,10 @@ async def handle_error(
     error,
     ephemeral: bool = False,
 ) -> None:
+    if isinstance(interaction, discord.Interaction) and interaction.command:
+        metrics.command_finished(interaction, interaction.command.qualified_name, error)
+        trace.end(interaction)
+
     if isinstance(error, commands.CommandOnCooldown):
         await interaction.response.send_message(
             embed=await create_embed(
@@ -64,34 +103,42 @@ async def handle_error(
         )
 
 
+async def interaction_check(interaction: discord.Interaction) -> bool:
+    if interaction.type is discord.InteractionType.application_command:
+        metrics.command_started(interaction)
+        trace.begin(interaction)
+    return True
+
+
 client.tree.on_error = handle_error
+client.tree.interaction_check = interaction_check
 client.on_error = handle_error
 
-cache = {"clubs": None, "users": None, "timestamp": datetime.min}
-bubbles = {}
+
+@client.event
+async def on_app_command_completion(
+    interaction: discord.Interaction, command: app_commands.Command
+) -> None:
+    metrics.command_finished(interaction, command.qualified_name)
+    trace.end(interaction)
 
 
-@tasks.loop(seconds=40)
+bubbles = {}  # bubble ID -> task popping it once the grace period is up
+
+
+# Changes are streamed into the cache by `utils.sync`, this full reload is only
+# a safety net for anything the stream or delta poll can't see
+@tasks.loop(minutes=30)
+@metrics.track_loop("update_club_cache", interval=30 * 60)
 async def update_club_cache(force_update: bool = False):
-    global cache
-    cache_stale_time = timedelta(seconds=30)
+    cache_stale_time = timedelta(minutes=25)
 
     current_time = datetime.now(timezone.utc)
-    last_updated = cache["timestamp"] or datetime.min
+    last_updated = cache["timestamp"]
 
     if force_update or (current_time - last_updated) > cache_stale_time:
         try:
-            clubs_cursor = db.clubs.find()
-            users_cursor = db.users.find()
-
-            # Retrieve all documents from the cursor
-            clubs_data = await clubs_cursor.to_list(length=None)
-            users_data = await users_cursor.to_list(length=None)
-
-            # Update the relevant cache components
-            cache["clubs"] = {"data": clubs_data, "timestamp": current_time}
-            cache["users"] = {"data": users_data, "timestamp": current_time}
-            cache["timestamp"] = current_time
+            await sync.reload()
         except Exception as e:
             print(f"[CACHE][{current_time}]: Failed to update cache: {e}")
     else:
@@ -100,134 +147,165 @@ async def update_club_cache(force_update: bool = False):
     return
 
 
-@tasks.loop(minutes=5)
-async def update_bubbles():
-    guild = client.get_guild(GUILD_ID)
-    if not guild:
-        return
-    logs = guild.get_channel(CHANNELS["LOGS"])
-    if type(logs) != TextChannel:
+async def pop_bubble(guild: discord.Guild, club) -> None:
+    bubble = guild.get_channel(club.bubble)
+    if isinstance(bubble, discord.VoiceChannel):
+        await bubble.delete(reason=f"Club {club.name} bubble popped")
+    # delete bubble
+    await db.clubs.update_one({"_id": club.id}, touch({"$set": {"bubble": None}}))
+    cache_club(club.replace(bubble=None))
+
+    embed = await create_embed(
+        "Bubble Popped",
+        f"Bubble for `{club.name}` has been popped",
+        COLORS["LEAVE_CLUB"],
+    )
+    embed.set_footer(text=f"Club ID: {club.id}")
+
+    log_sink.send(embed, guild.id)
+    channel = guild.get_channel(club.channel)
+    if isinstance(channel, TextChannel):
+        actions.send(
+            channel,
+            embed=await create_embed(
+                "Bubble Popped",
+                f"{club.name} bubble has been popped",
+                COLORS["LEAVE_CLUB"],
+            ),
+        )
+
+
+def schedule_pop(guild: discord.Guild, bubble_id: int) -> None:
+    """Pops a bubble if it's still empty after the grace period"""
+
+    async def pop_when_empty():
+        await asyncio.sleep(BUBBLE_GRACE_PERIOD)
+        bubbles.pop(bubble_id, None)
+        club = cache["clubs"].by_bubble(bubble_id)
+        bubble = guild.get_channel(bubble_id)
+        if club and (
+            not isinstance(bubble, discord.VoiceChannel) or not bubble.members
+        ):
+            await pop_bubble(guild, club)
+
+    if task := bubbles.get(bubble_id):
+        task.cancel()
+    bubbles[bubble_id] = asyncio.create_task(pop_when_empty())
+
+
+@client.event
+async def on_voice_state_update(
+    member: discord.Member, before: discord.VoiceState, after: discord.VoiceState
+) -> None:
+    if before.channel == after.channel:
         return
 
-    projection = {"bubble": 1, "channel": 1, "name": 1, "_id": 1}
-    clubs_cursor = db.clubs.find(projection=projection)
-    clubs_list = await clubs_cursor.to_list(length=None)
-
-    for club in clubs_list:
-        if club.get("bubble"):
-            bubble = guild.get_channel(club["bubble"])
-            if type(bubble) == discord.VoiceChannel and len(bubble.members) == 0:
-                await bubble.delete(reason=f"Club {club['name']} bubble popped")
-                # delete bubble
-                await db.clubs.update_one(
-                    {"_id": club["_id"]}, {"$set": {"bubble": None}}
-                )
+    # Someone joined a bubble that was about to be popped
+    if after.channel and (task := bubbles.pop(after.channel.id, None)):
+        task.cancel()
 
-                embed = await create_embed(
-                    "Bubble Popped",
-                    f"Bubble for `{club['name']}` has been popped",
-                    COLORS["LEAVE_CLUB"],
-                )
-                embed.set_footer(text=f"Club ID: {club['_id']}")
+    if (
+        before.channel
+        and not before.channel.members
+        and cache["clubs"].by_bubble(before.channel.id)
+    ):
+        schedule_pop(member.guild, before.channel.id)
 
-                await logs.send(embed=embed)
-                channel = guild.get_channel(club["channel"])
-                if isinstance(channel, TextChannel):
-                    await channel.send(
-                        embed=await create_embed(
-                            "Bubble Popped",
-                            f'{club["name"]} bubble has been popped',
-                            COLORS["LEAVE_CLUB"],
-                        )
-                    )
-    return
 
+# Bubbles are popped by `on_voice_state_update`, this only catches any that
+# were missed, e.g. while the bot was offline
+@tasks.loop(minutes=30)
+@metrics.track_loop("update_bubbles", interval=30 * 60)
+async def update_bubbles():
+    for club in cache["clubs"].with_bubbles():
+        if club.bubble in bubbles:
+            # Already due to be popped
+            continue
+        guild = client.get_guild(club.guild)
+        if not guild:
+            # On another shard
+            continue
+        bubble = guild.get_channel(club.bubble)
+        if not isinstance(bubble, discord.VoiceChannel) or not bubble.members:
+            await pop_bubble(guild, club)
+    return
 
-@tasks.loop(seconds=30)
-async def unmute_ban_users():
-    guild = client.get_guild(GUILD_ID)
-    logs = guild.get_channel(CHANNELS["LOGS"])
-    current_time = datetime.now(timezone.utc)
 
-    # get all users from db
-    projection = {"_id": 1, "mutes": 1, "bans": 1}
-    users_cursor = db.users.find(
-        {"_id": {"$in": [member.id for member in guild.members]}}, projection=projection
-    )
-    users_list = await users_cursor.to_list(length=None)
-
-    for user in users_list:
-        duser = guild.get_member(user["_id"])
-
-        # Process unmutes
-        if expired_mutes := [
-            umute
-            for umute in user.get("mutes", [])
-            if umute["expiration"] <= current_time
-        ]:
-            club_ids = [umute["club_id"] for umute in expired_mutes]
-            clubs = await db.clubs.find({"_id": {"$in": club_ids}}).to_list(length=None)
-            clubs_dict = {club["_id"]: club for club in clubs}
-
-            for umute in expired_mutes:
-                club = clubs_dict.get(umute["club_id"])
-                if not club:
-                    continue
-                channel = guild.get_channel(club["channel"])
-                if isinstance(channel, TextChannel):
-                    overwrites = channel.overwrites
-                    if duser in overwrites:
-                        del overwrites[duser]
-                    await channel.edit(overwrites=overwrites)
-                    await db.users.update_one(
-                        {"_id": user["_id"]}, {"$pull": {"mutes": umute}}
-                    )
-                    await duser.send(f"Your mute has expired in {club['name']}")
-                    await send_log(
-                        logs, "Member Unmuted (Expired)", duser, club, COLORS["UNMUTE"]
+# Each run checks the next slice of clubs, so every club is looked at about
+# once every (clubs / SLICE_SIZE) * 10 minutes
+@tasks.loop(minutes=10)
+@metrics.track_loop("reconcile_clubs", interval=10 * 60)
+async def reconcile_clubs():
+    for guild in guilds.local(client):
+        try:
+            await reconcile(guild)
+        except Exception as e:
+            print(f"[RECONCILE]: Failed to reconcile clubs in {guild.name}: {e}")
+
+
+@metrics.track_loop("expire_sanctions")
+async def expire_sanctions(expired: list[Expiry]) -> int:
+    """Lifts a batch of mutes and bans that have expired.
+
+    The sanctions are lifted with one bulk write. Each expired mute removes
+    just that member's overwrite; the channel edits and DMs go through the
+    action queue at background priority so a large batch never delays user
+    commands.
+
+    Returns:
+        int: How many database writes were saved compared to lifting them one
+            by one.
+    """
+    await lift_sanctions(expired)
+
+    edits, notifications = [], []
+    for expiry in expired:
+        club = cache["clubs"].get(expiry.club_id)
+        # Only this process's guilds have their sanctions scheduled
+        guild = client.get_guild(club.guild) if club else None
+        duser = guild.get_member(expiry.user_id) if guild else None
+        if not club or not duser:
+            continue
+
+        if expiry.kind == "mute":
+            channel = guild.get_channel(club.channel)
+            if isinstance(channel, TextChannel):
+                edits.append(
+                    actions.submit(
+                        set_muted(channel, duser, expiry.club_id, False),
+                        ("channel", channel.id),
+                        BACKGROUND,
+                        "UNMUTE",
                     )
-
-        # Process unbans
-        if expired_bans := [
-            uban
-            for uban in user.get("bans", [])
-            if uban.get("expiration") and uban["expiration"] <= current_time
-        ]:
-            club_ids = [uban["club_id"] for uban in expired_bans]
-            clubs = await db.clubs.find({"_id": {"$in": club_ids}}).to_list(length=None)
-            clubs_dict = {club["_id"]: club for club in clubs}
-
-            for uban in expired_bans:
-                club = clubs_dict.get(uban["club_id"])
-                if not club:
-                    continue
-                await db.users.update_one(
-                    {"_id": user["_id"]}, {"$pull": {"bans": uban}}
-                )
-                await send_log(
-                    logs, "Member Unbanned (Expired)", duser, club, COLORS["UNBAN"]
                 )
+            notifications.append(
+                actions.dm(duser, f"Your mute has expired in {club.name}")
+            )
+            await send_log("Member Unmuted (Expired)", duser, club, COLORS["UNMUTE"])
+        else:
+            await send_log("Member Unbanned (Expired)", duser, club, COLORS["UNBAN"])
+
+    # Failures are logged by the queue, waiting just keeps batches from piling up
+    await asyncio.gather(*edits, *notifications, return_exceptions=True)
+
+    # One by one, every sanction costs a DB write
+    mutes = sum(expiry.kind == "mute" for expiry in expired)
+    saved = max(len(expired) - 1, 0)
+    print(
+        f"[EXPIRY]: Lifted {mutes} mutes and {len(expired) - mutes} bans, "
+        f"saved {saved} database writes"
+    )
+    return saved
 
 
-async def send_log(logs_channel, title, duser, club, color):
+async def send_log(title, duser, club, color):
     log = await create_embed(
         title,
-        f"**User:** {duser.mention} (`{duser.name}`)\n**Club:** {club['name']}",
+        f"**User:** {duser.mention} (`{duser.name}`)\n**Club:** {club.name}",
         color,
     )
-    log.set_footer(text=f"Club ID: {club['_id']}")
-    await logs_channel.send(embed=log)
-
-    log = await create_embed(
-        "Member Unbanned (Expired)",
-        f"""
-**User:** {duser.mention} (`{duser.name}`) 
-**Club:** {club['name']}
-        """,
-        COLORS["UNBAN"],
-    )
-    log.set_footer(text=f"Club ID: {club['_id']}")
-    return await logs_channel.send(embed=log)
+    log.set_footer(text=f"Club ID: {club.id}")
+    log_sink.send(log, club.guild)
 
 
 @client.event
@@ -240,13 +318,21 @@ async def on_ready() -> None:
     print("Connecting to db....")
     try:
         await db_client.admin.command("ping")
+        await metrics.start()
+        await ensure_indexes()
+        await migrate_sanctions()
+        await migrate_guilds()
+        log_sink.start(client)
         print("Successfully connected to MongoDB!\nLoading cache")
         await update_club_cache(True)
         update_club_cache.start()
+        sync.start()
         print("Cache loaded\nStarting bubble popper")
         update_bubbles.start()
+        reconcile_clubs.start()
         print("Bubble popper started\nStarting unmuter")
-        unmute_ban_users.start()
+        await load_expiries({guild.id for guild in client.guilds})
+        expiries.start(expire_sanctions)
         print("Unmuter started, running bot")
         success = True
     except Exception as e:
@@ -270,17 +356,14 @@ async def start(interaction: Interaction) -> None:
     await interaction.response.send_modal(ClubCreation())
 
 
+@metrics.track_autocomplete
 async def verify_club_choices(
     interaction: Interaction, current: str
 ) -> list[app_commands.Choice]:
     # fetch unverified clubs from cached db
-
-    clubs = cache["clubs"]["data"]
-
     return [
-        app_commands.Choice(name=club["name"], value=club["_id"])
-        for club in clubs
-        if not club.get("verified")
+        app_commands.Choice(name=club.name, value=str(club.id))
+        for club in cache["clubs"].search(interaction.guild_id, current, verified=False)
     ]
 
 
@@ -298,31 +381,22 @@ async def reject(interaction: Interaction, club: str) -> None:
     await verify_club(verify=False, club_id=club, interaction=interaction)
 
 
+@metrics.track_autocomplete
 async def join_club_choices(
     interaction: discord.Interaction,
     current: str,
 ) -> list[app_commands.Choice]:
-    user = next(
-        (u for u in cache["users"]["data"] if u["_id"] == interaction.user.id), None
+    await load_user(interaction.user.id)
+    joined = cache["users"].clubs(interaction.user.id)
+    banned = cache["users"].bans(interaction.user.id)
+
+    clubs = cache["clubs"].search(
+        interaction.guild_id,
+        current,
+        predicate=lambda club_id: club_id not in joined and club_id not in banned,
     )
 
-    clubs = cache["clubs"]["data"]
-
-    return (
-        [
-            app_commands.Choice(name=club["name"], value=str(club["_id"]))
-            for club in clubs
-            if club.get("verified")
-        ]
-        if not user or not user.get("clubs")
-        else [
-            app_commands.Choice(name=club["name"], value=str(club["_id"]))
-            for club in clubs
-            if club["_id"] not in user["clubs"]
-            and club.get("verified")
-            and club["_id"] not in user["bans"]
-        ]
-    )
+    return [app_commands.Choice(name=club.name, value=str(club.id)) for club in clubs]
 
 
 @client.tree.command(name="join", description="Join a club")
@@ -332,27 +406,32 @@ async def join(interaction: Interaction, club: str) -> None:
     await join_club(club_id=club, interaction=interaction)
 
 
+@metrics.track_autocomplete
 async def leave_club_choices(
     interaction: discord.Interaction,
     current: str,
 ) -> list[app_commands.Choice[str]]:
     # We use a cache here for speed
-    # The cache is updated every half minute and should be sufficient for the bot
-    user = next(
-        (u for u in cache["users"]["data"] if u["_id"] == interaction.user.id), None
+    # Only look at the clubs the user is in rather than every club
+    await load_user(interaction.user.id)
+    joined = cache["users"].clubs(interaction.user.id)
+
+    current = normalize(current)
+    clubs = sorted(
+        (
+            club
+            for club in filter(None, map(cache["clubs"].get, joined))
+            if club.guild == interaction.guild_id
+            and club.owner != interaction.user.id
+            and current in normalize(club.name)
+        ),
+        key=lambda club: normalize(club.name),
     )
 
-    clubs = cache["clubs"]["data"]
-
-    return (
-        []
-        if not user or not user.get("clubs")
-        else [
-            app_commands.Choice(name=club["name"], value=str(club["_id"]))
-            for club in clubs
-            if club["_id"] in user["clubs"] and club["owner"] != interaction.user.id
-        ]
-    )
+    return [
+        app_commands.Choice(name=club.name, value=str(club.id))
+        for club in clubs[:MAX_CHOICES]
+    ]
 
 
 @client.tree.command(name="leave", description="Leave a club")
@@ -364,7 +443,9 @@ async def leave(interaction: Interaction, club: str) -> None:
 
 @client.tree.command(name="bubble", description="Create a bubble")
 async def bubble(interaction: Interaction):
-    await create_join_bubble(interaction=interaction)
+    if bubble := await create_join_bubble(interaction=interaction):
+        # Pop it if nobody ends up joining
+        schedule_pop(bubble.guild, bubble.id)
 
 
 async def settings_callback(interaction: discord.Interaction):
@@ -385,7 +466,7 @@ async def settings_callback(interaction: discord.Interaction):
                 discord.ui.TextInput(
                     label="Name",
                     style=discord.TextStyle.short,
-                    default=club["name"],
+                    default=club.name,
                     min_length=3,
                     max_length=50,
                     required=True,
@@ -395,7 +476,7 @@ async def settings_callback(interaction: discord.Interaction):
                 discord.ui.TextInput(
                     label="Description",
                     style=discord.TextStyle.short,
-                    default=club["topic"],
+                    default=club.topic,
                     min_length=3,
                     max_length=500,
                     required=True,
@@ -417,26 +498,25 @@ async def settings_callback(interaction: discord.Interaction):
 
                 new_name = interaction.data["components"][0]["components"][0]["value"]
                 new_topic = interaction.data["components"][1]["components"][0]["value"]
-                await edit_club(club_id=club["_id"], name=new_name, topic=new_topic)
+                await edit_club(club_id=club.id, name=new_name, topic=new_topic)
                 guild = interaction.guild
                 # rename channel
-                channel = guild.get_channel(club["channel"])
+                channel = guild.get_channel(club.channel)
                 await channel.edit(name=new_name, topic=new_topic)
-                role = guild.get_role(club["role"])
+                role = guild.get_role(club.role)
                 await role.edit(name="f{new_name} Member")
                 await interaction.followup.send("success")
                 description = f"""
-{f"**Old Name**: {club['name']}  **New Name**: {new_name}" if club['name'] != new_name else '' }
-{f"**Old Topic**: {club['topic']}  **New Topic**: {new_topic}" if club['topic'] != new_topic else '' }
+{f"**Old Name**: {club.name}  **New Name**: {new_name}" if club.name != new_name else '' }
+{f"**Old Topic**: {club.topic}  **New Topic**: {new_topic}" if club.topic != new_topic else '' }
                 """
                 logbed = await create_embed(
-                    title=f"`{club['name']}` details Updated",
+                    title=f"`{club.name}` details Updated",
                     description=description,
                     color=COLORS["SETTINGS"],
                 )
-                logbed.set_footer(text=f"Club ID: {club['_id']}")
-                channel = guild.get_channel(CHANNELS["LOGS"])
-                await channel.send(embed=logbed)
+                logbed.set_footer(text=f"Club ID: {club.id}")
+                log_sink.send(logbed, interaction.guild_id)
 
             modal.on_submit = callback
 
@@ -463,7 +543,7 @@ Your mods can use their permissions via the `Apps` section of a messages context
                 if not guild:
                     return
                 await edit_club(
-                    club_id=club["_id"],
+                    club_id=club.id,
                     mods=[
                         user.id
                         for user in options.values
@@ -483,19 +563,18 @@ Your mods can use their permissions via the `Apps` section of a messages context
                 ]
                 old_mods = [
                     f"{guild.get_member(int(user)).mention} (`{guild.get_member(int(user)).name}`)"
-                    for user in club["mods"]
+                    for user in club.mods
                 ]
                 logbed = await create_embed(
-                    title=f"`{club['name']}` Moderators Updated",
+                    title=f"`{club.name}` Moderators Updated",
                     description=f"""
 **New Mods**: {", ".join(new_mods)}
 **Old Mods**: {", ".join(old_mods)}
                     """,
                     color=COLORS["SETTINGS"],
                 )
-                logbed.set_footer(text=f"Club ID: {club['_id']}")
-                channel = guild.get_channel(CHANNELS["LOGS"])
-                await channel.send(embed=logbed)
+                logbed.set_footer(text=f"Club ID: {club.id}")
+                log_sink.send(logbed, interaction.guild_id)
 
             options.callback = callback
 
@@ -518,28 +597,28 @@ Your mods can use their permissions via the `Apps` section of a messages context
                         description="Delete messages from any user in the club",
                         value="delete",
                         emoji=PartialEmoji(name="🗑️"),
-                        default="delete" in club["mod_perms"],
+                        default="delete" in club.mod_perms,
                     ),
                     discord.SelectOption(
                         label="Pin messages",
                         description="Pin and unpin messages from any user in the club",
                         value="pin",
                         emoji=PartialEmoji(name="📌"),
-                        default="pin" in club["mod_perms"],
+                        default="pin" in club.mod_perms,
                     ),
                     discord.SelectOption(
                         label="Mute members",
                         description="Temp/perm mute any user in the club",
                         value="mute",
                         emoji=PartialEmoji(name="🤫"),
-                        default="mute" in club["mod_perms"],
+                        default="mute" in club.mod_perms,
                     ),
                     discord.SelectOption(
                         label="Ban members",
                         description="Temp/perm ban any user in the club",
                         value="ban",
                         emoji=PartialEmoji(name="🔨"),
-                        default="ban" in club["mod_perms"],
+                        default="ban" in club.mod_perms,
                     ),
                 ],
                 min_values=0,
@@ -548,7 +627,7 @@ Your mods can use their permissions via the `Apps` section of a messages context
 
             async def callback(interaction: discord.Interaction):
                 await interaction.response.defer()
-                await edit_club(club_id=club["_id"], mod_perms=options.values)
+                await edit_club(club_id=club.id, mod_perms=options.values)
                 embed = await create_embed(
                     ":shield: Updated Mod Permissions",
                     "Your mod permissions have been updated successfully.",
@@ -556,16 +635,15 @@ Your mods can use their permissions via the `Apps` section of a messages context
                 )
                 await interaction.followup.send(embed=embed)
                 logbed = await create_embed(
-                    title=f"`{club['name']}` Mod Permissions Updated",
+                    title=f"`{club.name}` Mod Permissions Updated",
                     description=f"""
 **New Mod Permissions**: {options.values}
-**Old Mod Permissions**: {club['mod_perms']}
+**Old Mod Permissions**: {sorted(club.mod_perms)}
                     """,
                     color=COLORS["SETTINGS"],
                 )
-                logbed.set_footer(text=f"Club ID: {club['_id']}")
-                channel = interaction.guild.get_channel(CHANNELS["LOGS"])
-                await channel.send(embed=logbed)
+                logbed.set_footer(text=f"Club ID: {club.id}")
+                log_sink.send(logbed, interaction.guild_id)
 
             options.callback = callback
 
@@ -587,7 +665,8 @@ async def settings(interaction: Interaction):
             )
         )
 
-    if interaction.user.id != club["owner"]:
+    # Only the owner, not club admins, can change the club's mods and name
+    if not club.permissions_of(interaction.user.id) & ClubPermission.OWNER:
         return await interaction.response.send_message(
             embed=await create_embed(
                 title="Permission Denied",
@@ -641,11 +720,11 @@ async def settings(interaction: Interaction):
 
 
 async def visual_settings(interaction: Interaction, club):
-    modal = discord.ui.Modal(title=f"{club['name']} Settings")
+    modal = discord.ui.Modal(title=f"{club.name} Settings")
     modal.add_item(
         discord.ui.TextInput(
             label="Club Name",
-            default=club["name"],
+            default=club.name,
             style=discord.TextStyle.short,
         )
     )
@@ -653,7 +732,7 @@ async def visual_settings(interaction: Interaction, club):
     modal.add_item(
         discord.ui.TextInput(
             label="Club Description",
-            default=club["topic"],
+            default=club.topic,
             style=discord.TextStyle.paragraph,
             max_length=500,
         )
@@ -664,9 +743,7 @@ async def visual_settings(interaction: Interaction, club):
 
 @client.tree.context_menu(name="Delete message")
 async def delete_msg(interaction: discord.Interaction, message: discord.Message):
-    club = next(
-        (c for c in cache["clubs"]["data"] if c["channel"] == message.channel.id), None
-    )
+    club = await get_club_by_channel(message.channel.id)
     if not club:
         return await interaction.response.send_message(
             embed=await create_embed(
@@ -677,9 +754,7 @@ async def delete_msg(interaction: discord.Interaction, message: discord.Message)
             ephemeral=True,
         )
 
-    if (
-        interaction.user.id not in club["mods"] or "delete" not in club["mod_perms"]
-    ) and interaction.user.id != club["owner"]:
+    if not resolve(club, interaction.user) & ClubPermission.DELETE:
         return await interaction.response.send_message(
             embed=await create_embed(
                 description="You are not a moderator of this club or you do not have permission :-(",
@@ -694,23 +769,19 @@ async def delete_msg(interaction: discord.Interaction, message: discord.Message)
         description=f"""
 **Message**: {message.content}
 **Author**: {message.author.mention} (`{message.author.name}`)
-**Moderator**: {':crown:' if interaction.user.id == club['owner'] else ''}{interaction.user.mention} (`{interaction.user.name}'`)
-**Club**: {club['name']}
+**Moderator**: {':crown:' if interaction.user.id == club.owner else ''}{interaction.user.mention} (`{interaction.user.name}'`)
+**Club**: {club.name}
             """,
         color=COLORS["DELETE"],
     )
-    logbed.set_footer(text=f"Club ID: {club['_id']}")
-    channel = client.get_channel(CHANNELS["LOGS"])
-    if isinstance(channel, TextChannel):
-        await channel.send(embed=logbed)
+    logbed.set_footer(text=f"Club ID: {club.id}")
+    log_sink.send(logbed, interaction.guild_id)
     return await interaction.response.send_message("Message deleted.", ephemeral=True)
 
 
 @client.tree.context_menu(name="(Un)pin message")
 async def pin_msg(interaction: discord.Interaction, message: discord.Message):
-    club = next(
-        (c for c in cache["clubs"]["data"] if c["channel"] == message.channel.id), None
-    )
+    club = await get_club_by_channel(message.channel.id)
     if not club:
         return await interaction.response.send_message(
             embed=await create_embed(
@@ -721,9 +792,7 @@ async def pin_msg(interaction: discord.Interaction, message: discord.Message):
             ephemeral=True,
         )
 
-    if (
-        interaction.user.id not in club["mods"] or "pin" not in club["mod_perms"]
-    ) and interaction.user.id != club["owner"]:
+    if not resolve(club, interaction.user) & ClubPermission.PIN:
         return await interaction.response.send_message(
             embed=await create_embed(
                 description="You are not a moderator of this club or do not have permission :-(",
@@ -752,18 +821,17 @@ async def pin_msg(interaction: discord.Interaction, message: discord.Message):
         description=f"""
 **Message**: {message.jump_url}
 **Author**: {message.author.mention} (`{message.author.name}`)
-**Moderator**: {':crown:' if interaction.user.id == club['owner'] else ''}{interaction.user.mention} (`{interaction.user.name}`)
-**Club**: {club['name']}
+**Moderator**: {':crown:' if interaction.user.id == club.owner else ''}{interaction.user.mention} (`{interaction.user.name}`)
+**Club**: {club.name}
             """,
         color=COLORS["PIN"],
     )
 
-    logbed.set_footer(text=f"Club ID: {club['_id']}")
-    channel = client.get_channel(CHANNELS["LOGS"])
-    if isinstance(channel, TextChannel):
-        await channel.send(embed=logbed)
+    logbed.set_footer(text=f"Club ID: {club.id}")
+    log_sink.send(logbed, interaction.guild_id)
 
 
+@metrics.track_autocomplete
 async def mute_choices(
     interaction: discord.Interaction,
     current: str,
@@ -800,6 +868,7 @@ async def mute_user(interaction: discord.Interaction, user: discord.Member, time
     await mute(interaction, user, time)
 
 
+@metrics.track_autocomplete
 async def ban_choices(
     interaction: discord.Interaction,
     current: str,
@@ -856,8 +925,112 @@ async def ban_user(interaction: discord.Interaction, user: discord.Member, time:
             )
 
 
-try:
-    load_dotenv()
-    client.run(os.environ["BOT_TOKEN"])
-except BaseException as e:
-    print(f"ERROR WITH LOGGING IN: {e}")
+@client.tree.command(name="migrate", description="Import clubs from Club Bot v2")
+@app_commands.describe(restart="Import every club again instead of resuming")
+async def migrate(interaction: discord.Interaction, restart: bool = False):
+    guild = interaction.guild
+    admins = guilds.role(guild, "ADMIN") if guild else None
+    if not admins or admins not in interaction.user.roles:
+        return await interaction.response.send_message(
+            embed=await create_embed(), ephemeral=True
+        )
+    await interaction.response.defer(ephemeral=True)
+
+    result = await import_clubs(guild, restart=restart)
+    embed = await create_embed(
+        "Clubs Migrated",
+        f"""
+**Clubs imported**: {result.clubs}{f' (resumed after row {result.resumed_from})' if result.resumed_from else ''}
+**Skipped**: {result.skipped} (no owner, or channel or role deleted)
+**Memberships added**: {result.memberships}
+**Roles assigned**: {result.roles}
+        """,
+        COLORS["SUCCESS"],
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+    log_sink.send(embed, guild.id)
+
+
+@client.tree.command(name="sync", description="Sync the slash commands with Discord")
+async def sync_tree(interaction: discord.Interaction):
+    guild = interaction.guild
+    admins = guilds.role(guild, "ADMIN") if guild else None
+    if not admins or admins not in interaction.user.roles:
+        return await interaction.response.send_message(
+            embed=await create_embed(), ephemeral=True
+        )
+    await interaction.response.defer(ephemeral=True)
+
+    await sync_commands(client.tree, force=True)
+    await interaction.followup.send(
+        embed=await create_embed(
+            "Commands Synced",
+            "The slash commands have been synced with Discord.",
+            COLORS["SUCCESS"],
+        ),
+        ephemeral=True,
+    )
+
+
+@client.tree.command(name="setup", description="Set up Club Bot for this server")
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(
+    mods="Server moderators, who approve clubs",
+    mute="The role that stops members talking",
+    admins="Club Bot admins, who can run /migrate",
+    club_admins="Club admins, who can moderate every club",
+    mods_channel="Where club requests are sent",
+    logs_channel="Where club logs are sent",
+    category="The category club channels are created in",
+)
+async def setup(
+    interaction: discord.Interaction,
+    mods: discord.Role,
+    mute: discord.Role,
+    admins: discord.Role,
+    club_admins: discord.Role,
+    mods_channel: discord.TextChannel,
+    logs_channel: discord.TextChannel,
+    category: discord.CategoryChannel,
+):
+    guild = interaction.guild
+    if not guild or not interaction.user.guild_permissions.administrator:
+        return await interaction.response.send_message(
+            embed=await create_embed(), ephemeral=True
+        )
+
+    await configure_guild(
+        guild.id,
+        roles={
+            "MODS": mods.id,
+            "MUTE": mute.id,
+            "ADMIN": admins.id,
+            "CADMIN": club_admins.id,
+        },
+        channels={"MODS": mods_channel.id, "LOGS": logs_channel.id},
+        category=category.id,
+    )
+    await interaction.response.send_message(
+        embed=await create_embed(
+            "Club Bot Set Up",
+            f"""
+**Mods**: {mods.mention}
+**Mute role**: {mute.mention}
+**Admins**: {admins.mention}
+**Club admins**: {club_admins.mention}
+**Club requests**: {mods_channel.mention}
+**Logs**: {logs_channel.mention}
+**Club category**: {category.mention}
+            """,
+            COLORS["SETTINGS"],
+        ),
+        ephemeral=True,
+    )
+
+
+if __name__ == "__main__":
+    try:
+        load_dotenv()
+        client.run(os.environ["BOT_TOKEN"])
+    except BaseException as e:
+        print(f"ERROR WITH LOGGING IN: {e}")
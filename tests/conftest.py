@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+
+# Sets up the environment the bot's modules are imported with
+from bench.world import build_world, install
+
+
+@pytest.fixture
+def run():
+    """Runs `test(world)` on a fresh event loop, against a small synthetic
+    guild and in-memory database installed like `bench` does"""
+
+    def run(test, **options):
+        async def main():
+            world = build_world(**{"clubs": 5, "users": 20, "unverified": 2, **options})
+            await install(world)
+            return await test(world)
+
+        return asyncio.run(main())
+
+    return run
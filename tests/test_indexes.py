@@ -0,0 +1,22 @@
+from pymongo import IndexModel
+
+from utils import db
+
+
+def test_stale_index_under_the_same_name_is_recreated(run):
+    async def test(world):
+        clubs = world.mongo.data.clubs
+        # What an older deploy could have left: same name, not unique
+        await clubs.drop_index("channel")
+        await clubs.create_indexes([IndexModel("channel", name="channel")])
+        await world.mongo.data.meta.delete_one({"_id": "indexes"})
+
+        assert await db.ensure_indexes() == ["clubs.channel"]
+        channel = (await clubs.index_information())["channel"]
+        assert channel["unique"]
+        assert channel["partialFilterExpression"] == {"channel": {"$exists": True}}
+        # Matching indexes are left alone
+        await world.mongo.data.meta.delete_one({"_id": "indexes"})
+        assert await db.ensure_indexes() == []
+
+    run(test)
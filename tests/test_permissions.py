@@ -0,0 +1,53 @@
+import discord
+
+from bench.fakes import FakeMember
+from bench.world import give_role
+from utils.data import ROLES
+from utils.permissions import ClubPermission, resolve
+
+import main
+
+
+def settings(interaction):
+    return main.client.tree.get_command("settings").callback(interaction)
+
+
+def club_admin(world):
+    admin = world.guild.add_member(FakeMember(world.guild, "club-admin"))
+    give_role(admin, world.guild.get_role(ROLES["CADMIN"]))
+    return admin
+
+
+def test_club_admin_can_moderate_but_not_manage(run):
+    async def test(world):
+        club = main.cache["clubs"].get(world.clubs[0]["_id"])
+        permissions = resolve(club, club_admin(world))
+        assert permissions & ClubPermission.CLUB_ADMIN
+        for action in ("DELETE", "PIN", "MUTE", "BAN"):
+            assert permissions & ClubPermission[action]
+        assert not permissions & ClubPermission.OWNER
+
+    run(test)
+
+
+def test_club_admin_is_refused_by_settings(run):
+    async def test(world):
+        club = world.clubs[0]
+        interaction = world.interaction(club_admin(world), world.channel(club))
+        await settings(interaction)
+        (_, kwargs), *_ = interaction.response.sent
+        assert kwargs["embed"].title == "Permission Denied"
+
+    run(test)
+
+
+def test_owner_can_open_settings(run):
+    async def test(world):
+        club = world.clubs[0]
+        interaction = world.interaction(world.owner(club), world.channel(club))
+        await settings(interaction)
+        (_, kwargs), *_ = interaction.response.sent
+        assert kwargs["embed"].title != "Permission Denied"
+        assert isinstance(kwargs["view"], discord.ui.View)
+
+    run(test)
@@ -0,0 +1,31 @@
+from utils import reconcile
+from utils.actions import actions
+
+
+def test_rebuilt_role_is_let_into_the_surviving_channel(run):
+    async def test(world):
+        guild = world.guild
+        club = world.clubs[0]
+        old = guild.get_role(club["role"])
+        holders = set(old.members)
+        channel = world.channel(club)
+        # The role is deleted, taking its overwrite and members with it
+        del guild.roles[old.id]
+        channel._fake_overwrites.pop(old)
+        for member in holders:
+            member._fake_roles.remove(old)
+
+        await reconcile.reconcile(guild, len(world.clubs))
+        await actions.join()
+
+        stored = await world.mongo.data.clubs.find_one({"_id": club["_id"]})
+        role = guild.get_role(stored["role"])
+        assert stored["channel"] == channel.id
+        overwrite = channel.overwrites_for(role)
+        assert overwrite.send_messages and overwrite.view_channel
+        assert set(role.members) == holders
+        # Nothing left for a later pass
+        reconcile._cursors.clear()
+        assert not await reconcile.plan(guild, len(world.clubs))
+
+    run(test)
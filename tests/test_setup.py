@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import discord
+
+from bench.fakes import FakeMember, FakeRole, FakeTextChannel
+from utils import guilds
+from utils.data import ROLES
+
+import main
+
+
+class Administrator(FakeMember):
+    @property
+    def guild_permissions(self):
+        return discord.Permissions.all()
+
+
+def setup(interaction, **options):
+    return main.client.tree.get_command("setup").callback(interaction, **options)
+
+
+def options(guild):
+    def role(name):
+        role = FakeRole(guild, name)
+        guild.roles[role.id] = role
+        return role
+
+    return {
+        "mods": role("mods"),
+        "mute": role("mute"),
+        "admins": role("admins"),
+        "club_admins": role("club admins"),
+        "mods_channel": guild.add_channel(FakeTextChannel(guild, "requests")),
+        "logs_channel": guild.add_channel(FakeTextChannel(guild, "logs")),
+        "category": SimpleNamespace(id=1, mention="#clubs"),
+    }
+
+
+def test_setup_keeps_roles_it_doesnt_set(run):
+    async def test(world):
+        guild = world.guild
+        # Seeded by migrate_guilds from utils.data
+        assert guilds.get(guild.id)["roles"]["CADMIN"] == ROLES["CADMIN"]
+        await world.mongo.data.guilds.update_one(
+            {"_id": guild.id}, {"$set": {"roles.EXTRA": 1234}}
+        )
+
+        chosen = options(guild)
+        admin = guild.add_member(Administrator(guild, "admin"))
+        await setup(world.interaction(admin), **chosen)
+
+        stored = await world.mongo.data.guilds.find_one({"_id": guild.id})
+        assert stored["roles"]["EXTRA"] == 1234
+        assert stored["roles"]["MODS"] == chosen["mods"].id
+        assert stored["channels"]["LOGS"] == chosen["logs_channel"].id
+        assert guilds.get(guild.id) == stored
+
+    run(test)
+
+
+def test_setup_sets_the_club_admin_role(run):
+    async def test(world):
+        guild = world.guild
+        chosen = options(guild)
+        admin = guild.add_member(Administrator(guild, "admin"))
+        await setup(world.interaction(admin), **chosen)
+
+        member = guild.add_member(FakeMember(guild, "club-admin"))
+        member._fake_roles.append(chosen["club_admins"])
+        assert guilds.is_club_admin(guild, member)
+
+    run(test)
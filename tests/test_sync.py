@@ -0,0 +1,43 @@
+import asyncio
+
+from datetime import datetime, timedelta
+
+from utils import sync
+from utils.cache import cache
+
+
+def test_poll_applies_writes_that_commit_out_of_order(run):
+    async def test(world):
+        clubs = world.mongo.data.clubs
+        first, second = world.clubs[:2]
+        applied = []
+        apply_document, interval = sync.apply_document, sync.POLL_INTERVAL
+
+        def record(collection, document):
+            applied.append(document["name"])
+            apply_document(collection, document)
+
+        sync.apply_document = record
+        sync.POLL_INTERVAL = 0.01
+        task = asyncio.create_task(sync.poll("clubs"))
+        try:
+            now = datetime.utcnow()
+            await clubs.update_one(
+                {"_id": first["_id"]}, {"$set": {"name": "Late", "updated_at": now}}
+            )
+            await asyncio.sleep(0.05)
+            # Stamped before the write above, but committed after it
+            await clubs.update_one(
+                {"_id": second["_id"]},
+                {"$set": {"name": "Later", "updated_at": now - timedelta(seconds=1)}},
+            )
+            await asyncio.sleep(0.05)
+        finally:
+            task.cancel()
+            sync.apply_document, sync.POLL_INTERVAL = apply_document, interval
+
+        assert cache["clubs"].get(second["_id"]).name == "Later"
+        # Fetched again on every poll within the margin, applied once
+        assert applied.count("Late") == applied.count("Later") == 1
+
+    run(test)
@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+
+from collections import deque
+from typing import Awaitable, Callable, NamedTuple
+
+import discord
+
+# Priority classes, lower runs first. Interaction responses themselves never
+# go through the queue, they have their own webhook rate limit and a 3 second
+# deadline.
+INTERACTION = 0  # follow-ups a user is waiting on, e.g. the role from /join
+MODERATION = 1  # mutes, bans and the channel edits they need
+BACKGROUND = 2  # DMs, announcements and expiries
+
+
+class Action(NamedTuple):
+    run: Callable[[], Awaitable]
+    future: asyncio.Future
+    priority: int
+    label: str
+    # Set for DMs, which are dead-lettered instead of retried if the user has
+    # them closed
+    recipient: int | None
+
+
+class ActionQueue:
+    """Runs outbound Discord API calls by priority, one worker per bucket.
+
+    Actions are keyed by the rate limit bucket of the route they hit (roles
+    are limited per guild, messages and edits per channel), each bucket runs
+    its actions one at a time in priority order so a burst of background work
+    queues behind a user's /join instead of racing it into the same limit.
+    At most `max_workers` actions run at once and `reserved` of those slots
+    are only ever used for INTERACTION actions.
+
+    Server errors and rate limits are retried with backoff, DMs that fail
+    because the user doesn't accept them are moved to `dead_letters`.
+    """
+
+    def __init__(self, max_workers=8, reserved=2, max_retries=3, idle_timeout=30.0):
+        self._max_workers = max_workers
+        self._reserved = reserved
+        self._max_retries = max_retries
+        self._idle_timeout = idle_timeout
+        self._buckets = {}  # bucket -> asyncio.PriorityQueue
+        self._workers = {}  # bucket -> task
+        self._order = itertools.count()  # keeps equal priorities first in, first out
+        self._running = 0
+        self._pending = set()  # futures of actions that haven't finished
+        self._slots = asyncio.Condition()
+
+        self.done = 0
+        self.failed = 0
+        self.retried = 0
+        self.dead_letters = deque(maxlen=100)  # (user_id, label) of undelivered DMs
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._buckets.values())
+
+    def submit(
+        self,
+        run: Callable[[], Awaitable],
+        bucket,
+        priority: int = BACKGROUND,
+        label: str = "ACTION",
+        recipient: int | None = None,
+    ) -> asyncio.Future:
+        """Queues `run` to be called in `bucket`'s worker.
+
+        `run` is called again on every retry, so it should build its request
+        when called rather than close over a coroutine. The returned future
+        resolves to its result; callers don't have to await it, failures are
+        logged either way.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.add(future)
+        future.add_done_callback(self._finished)
+
+        if bucket not in self._buckets:
+            self._buckets[bucket] = asyncio.PriorityQueue()
+            self._workers[bucket] = asyncio.create_task(self._work(bucket))
+        action = Action(run, future, priority, label, recipient)
+        self._buckets[bucket].put_nowait((priority, next(self._order), action))
+        return future
+
+    def _finished(self, future: asyncio.Future) -> None:
+        self._pending.discard(future)
+        if not future.cancelled():
+            # Mark exceptions as retrieved, fire and forget is the common case
+            future.exception()
+
+    async def join(self) -> None:
+        """Waits until every action submitted so far has finished"""
+        while self._pending:
+            await asyncio.wait(list(self._pending))
+
+    def add_roles(
+        self, member: discord.Member, *roles, priority=INTERACTION, reason=None
+    ):
+        return self.submit(
+            lambda: member.add_roles(*roles, reason=reason),
+            ("roles", member.guild.id),
+            priority,
+            "ROLES",
+        )
+
+    def remove_roles(
+        self, member: discord.Member, *roles, priority=INTERACTION, reason=None
+    ):
+        return self.submit(
+            lambda: member.remove_roles(*roles, reason=reason),
+            ("roles", member.guild.id),
+            priority,
+            "ROLES",
+        )
+
+    def send(self, channel, *args, priority=BACKGROUND, **kwargs):
+        return self.submit(
+            lambda: channel.send(*args, **kwargs),
+            ("channel", channel.id),
+            priority,
+            "SEND",
+        )
+
+    def dm(self, user: discord.abc.User, *args, **kwargs):
+        return self.submit(
+            lambda: user.send(*args, **kwargs),
+            ("dm", user.id),
+            BACKGROUND,
+            "DM",
+            recipient=user.id,
+        )
+
+    async def _acquire(self, priority: int) -> None:
+        limit = self._max_workers
+        if priority != INTERACTION:
+            limit -= self._reserved
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._running < limit)
+            self._running += 1
+
+    async def _release(self) -> None:
+        async with self._slots:
+            self._running -= 1
+            self._slots.notify_all()
+
+    async def _work(self, bucket) -> None:
+        queue = self._buckets[bucket]
+        while True:
+            try:
+                _, _, action = await asyncio.wait_for(queue.get(), self._idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    # Nothing can be queued between the check and here
+                    del self._buckets[bucket]
+                    del self._workers[bucket]
+                    return
+                continue
+
+            await self._acquire(action.priority)
+            try:
+                await self._run(action)
+            finally:
+                await self._release()
+
+    async def _run(self, action: Action) -> None:
+        for attempt in range(self._max_retries + 1):
+            try:
+                result = await action.run()
+            except discord.Forbidden as e:
+                if action.recipient:
+                    self.dead_letters.append((action.recipient, action.label))
+                    print(f"[ACTIONS]: DM to {action.recipient} not delivered: {e}")
+                else:
+                    print(f"[ACTIONS]: {action.label} failed: {e}")
+                return self._fail(action, e)
+            except discord.HTTPException as e:
+                # Client errors (missing access, bad request) won't succeed on retry
+                if (e.status < 500 and e.status != 429) or attempt == self._max_retries:
+                    print(f"[ACTIONS]: {action.label} failed: {e}")
+                    return self._fail(action, e)
+                self.retried += 1
+                await asyncio.sleep(2**attempt)
+            except Exception as e:
+                print(f"[ACTIONS]: {action.label} failed: {e}")
+                return self._fail(action, e)
+            else:
+                self.done += 1
+                if not action.future.done():
+                    action.future.set_result(result)
+                return
+
+    def _fail(self, action: Action, error: Exception) -> None:
+        self.failed += 1
+        if not action.future.done():
+            action.future.set_exception(error)
+
+
+actions = ActionQueue()
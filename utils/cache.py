@@ -0,0 +1,427 @@
+import os
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from utils.models import Club, UserRecord, as_id, intern_id, release_id
+from utils.search import NameIndex
+
+
+class ClubRegistry:
+    """Cached clubs, indexed by every field the bot looks clubs up by.
+
+    Names and owners are only unique within a guild, so they're indexed by
+    (guild id, name) and (guild id, owner). A full reload builds a new
+    registry and swaps it into `cache`. Between reloads, `utils.sync` keeps
+    the cached one current with `upsert` and `remove`, which update every
+    index in place for the one club that changed.
+    """
+
+    def __init__(self, clubs=()):
+        self._by_id = {}
+        self._by_channel = {}
+        self._by_role = {}
+        self._by_owner = {}
+        self._by_bubble = {}
+        self._by_name = {}
+        self._by_mod = {}
+        # Lookups by key that found / didn't find a club
+        self.hits = 0
+        self.misses = 0
+
+        clubs = list(clubs)
+        for club in clubs:
+            self._index(club)
+
+        # Autocomplete searches each guild's approved and unapproved clubs
+        # separately, keyed by (guild id, verified)
+        entries = {}
+        for club in clubs:
+            key = club.guild, club.verified
+            entries.setdefault(key, []).append((club.id, club.name))
+        self.names = {key: NameIndex(names) for key, names in entries.items()}
+
+    def _names(self, club: Club) -> NameIndex:
+        key = club.guild, club.verified
+        if key not in self.names:
+            self.names[key] = NameIndex()
+        return self.names[key]
+
+    def _index(self, club: Club):
+        self._by_id[club.id] = club
+        if club.channel:
+            self._by_channel[club.channel] = club
+        if club.role:
+            self._by_role[club.role] = club
+        if club.bubble:
+            self._by_bubble[club.bubble] = club
+        self._by_owner[club.guild, club.owner] = club
+        self._by_name[club.guild, club.name] = club
+        for mod in club.mods:
+            self._by_mod.setdefault(mod, set()).add(club.id)
+
+    def _unindex(self, club: Club):
+        for index, key in (
+            (self._by_channel, club.channel),
+            (self._by_role, club.role),
+            (self._by_bubble, club.bubble),
+            (self._by_owner, (club.guild, club.owner)),
+            (self._by_name, (club.guild, club.name)),
+        ):
+            # Only drop the entry if another club hasn't taken the key since
+            if key and index.get(key) is club:
+                del index[key]
+        for mod in club.mods:
+            clubs = self._by_mod.get(mod)
+            if clubs:
+                clubs.discard(club.id)
+                if not clubs:
+                    del self._by_mod[mod]
+
+    def upsert(self, club: Club):
+        """Adds a club, or replaces the cached copy of it"""
+        if old := self._by_id.get(club.id):
+            self._unindex(old)
+            self._names(old).remove(old.id)
+        self._index(club)
+        self._names(club).add(club.id, club.name)
+
+    def remove(self, club_id):
+        if club := self._by_id.pop(club_id, None):
+            self._unindex(club)
+            self._names(club).remove(club_id)
+            release_id(club_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def _lookup(self, index, key):
+        club = index.get(key)
+        if club is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return club
+
+    def get(self, club_id):
+        if isinstance(club_id, str):
+            if not ObjectId.is_valid(club_id):
+                self.misses += 1
+                return None
+            club_id = as_id(club_id)
+        return self._lookup(self._by_id, club_id)
+
+    def by_channel(self, channel_id):
+        return self._lookup(self._by_channel, channel_id)
+
+    def by_role(self, role_id):
+        return self._lookup(self._by_role, role_id)
+
+    def by_owner(self, guild_id, user_id):
+        return self._lookup(self._by_owner, (guild_id, user_id))
+
+    def by_bubble(self, bubble_id):
+        return self._lookup(self._by_bubble, bubble_id)
+
+    def by_name(self, guild_id, name):
+        return self._lookup(self._by_name, (guild_id, name))
+
+    def search(self, guild_id, query, verified=True, predicate=None):
+        """Returns the best matching clubs in a guild for an autocomplete query"""
+        names = self.names.get((guild_id, verified))
+        if names is None:
+            return []
+        return [self._by_id[club_id] for club_id in names.search(query, predicate)]
+
+    def with_bubbles(self):
+        """Returns every club that currently has a bubble"""
+        return list(self._by_bubble.values())
+
+    def moderated_by(self, user_id):
+        """Returns every club `user_id` is a moderator of"""
+        return [self._by_id[club_id] for club_id in self._by_mod.get(user_id, ())]
+
+
+class WriteTracker:
+    """Counts the writes to each key while a database read of it is in
+    flight, so a read that raced a write to the same key isn't cached. Keys
+    with no read in flight aren't tracked at all."""
+
+    def __init__(self):
+        self._reads = {}  # key -> [reads in flight, writes since tracked]
+
+    @contextmanager
+    def reading(self, key):
+        """Wraps a read of `key`, yielding a function that says whether the
+        key is still unwritten since the read started"""
+        entry = self._reads.setdefault(key, [0, 0])
+        entry[0] += 1
+        started = entry[1]
+        try:
+            yield lambda: entry[1] == started
+        finally:
+            entry[0] -= 1
+            if not entry[0]:
+                del self._reads[key]
+
+    def write(self, key) -> None:
+        if entry := self._reads.get(key):
+            entry[1] += 1
+
+    def write_all(self) -> None:
+        for entry in self._reads.values():
+            entry[1] += 1
+
+
+class UserRegistry:
+    """A bounded LRU of users, with each user's joined, banned and muted club
+    ids precomputed as frozensets so autocomplete can filter in O(1).
+
+    Users are loaded the first time they're needed by `utils.db.load_user`,
+    rather than every user that has ever joined a club being held in memory.
+    Lookups of a user who isn't cached return empty sets. The write paths in
+    `utils.db` update cached users directly so they're right straight away;
+    uncached users are left to be loaded fresh.
+    """
+
+    def __init__(self, size: int = 10000):
+        self.size = size
+        self._users = OrderedDict()  # user id -> UserRecord
+        # So a load that raced a write to the same user doesn't cache what
+        # it read from before it
+        self._writes = WriteTracker()
+        # Loads of a user that found / didn't find them cached
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def __iter__(self):
+        return iter(self._users.values())
+
+    def reading(self, user_id):
+        """Wraps a load of a user from the database, see `WriteTracker`"""
+        return self._writes.reading(user_id)
+
+    def fill(self, user: UserRecord) -> None:
+        """Caches a user loaded from the database"""
+        self._users[user.id] = user
+        self._users.move_to_end(user.id)
+        while len(self._users) > self.size:
+            self._users.popitem(last=False)
+            self.evictions += 1
+
+    def _entry(self, user_id):
+        entry = self._users.get(user_id)
+        if entry is not None:
+            self._users.move_to_end(user_id)
+        return entry
+
+    def upsert(self, user):
+        """Replaces the cached copy of a user changed elsewhere, if it's cached"""
+        self._writes.write(user["_id"])
+        if entry := self._users.get(user["_id"]):
+            entry.clubs = frozenset(map(intern_id, user.get("clubs", ())))
+            entry.owns_club_in = frozenset(user.get("owns_club_in", ()))
+
+    def apply_sanction(self, sanction):
+        user_id, club_id = sanction["user"], sanction["club"]
+        match sanction["kind"], sanction["active"]:
+            case "ban", True:
+                self.ban(user_id, club_id)
+            case "ban", False:
+                self.unban(user_id, club_id)
+            case "mute", True:
+                self.mute(user_id, club_id)
+            case "mute", False:
+                self.unmute(user_id, club_id)
+
+    def remove(self, user_id):
+        self._writes.write(user_id)
+        self._users.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._writes.write_all()
+        self._users.clear()
+
+    def get(self, user_id) -> UserRecord | None:
+        return self._entry(user_id)
+
+    def clubs(self, user_id) -> frozenset:
+        entry = self._entry(user_id)
+        return entry.clubs if entry else frozenset()
+
+    def bans(self, user_id) -> frozenset:
+        entry = self._entry(user_id)
+        return entry.bans if entry else frozenset()
+
+    def mutes(self, user_id) -> frozenset:
+        entry = self._entry(user_id)
+        return entry.mutes if entry else frozenset()
+
+    def _update(self, user_id, field, add=(), discard=()):
+        self._writes.write(user_id)
+        if entry := self._users.get(user_id):
+            add, discard = set(map(intern_id, add)), set(discard)
+            setattr(entry, field, (getattr(entry, field) | add) - discard)
+
+    def join(self, user_id, club_id):
+        self._update(user_id, "clubs", add={club_id})
+
+    def leave(self, user_id, club_id):
+        self._update(user_id, "clubs", discard={club_id})
+
+    def ban(self, user_id, club_id):
+        # Banning also removes the user from the club
+        self._update(user_id, "bans", add={club_id})
+        self.leave(user_id, club_id)
+
+    def unban(self, user_id, club_id):
+        self._update(user_id, "bans", discard={club_id})
+
+    def mute(self, user_id, club_id):
+        self._update(user_id, "mutes", add={club_id})
+
+    def unmute(self, user_id, club_id):
+        self._update(user_id, "mutes", discard={club_id})
+
+
+class ClubCache:
+    """A small LRU of clubs by id and channel, and of channels that have no
+    club, each kept for at most `ttl` seconds.
+
+    Catches the lookups `cache["clubs"]` misses, i.e. clubs created elsewhere
+    that haven't been synced yet and channels that aren't club channels, so
+    they don't go to Mongo every time. `utils.db` fills it on reads and
+    updates it on writes; changes made elsewhere reach it through
+    `utils.sync` or expire.
+    """
+
+    def __init__(self, size: int = 1024, ttl: float = 60.0):
+        self.size = size
+        self.ttl = ttl
+        self._clubs = OrderedDict()  # club id -> (expires at, club)
+        self._by_channel = {}  # channel id -> club id
+        self._missing = OrderedDict()  # channel id with no club -> expires at
+        # Keyed by club id and channel id, so a read that raced a write to
+        # the same club doesn't cache what it read from before it
+        self._writes = WriteTracker()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._clubs)
+
+    def _get(self, club_id):
+        entry = self._clubs.get(club_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, club = entry
+        if expires < time.monotonic():
+            self._drop(club_id)
+            self.misses += 1
+            return None
+        self._clubs.move_to_end(club_id)
+        self.hits += 1
+        return club
+
+    def get(self, club_id):
+        return self._get(club_id)
+
+    def by_channel(self, channel_id):
+        club_id = self._by_channel.get(channel_id)
+        if club_id is None:
+            self.misses += 1
+            return None
+        return self._get(club_id)
+
+    def missing(self, channel_id) -> bool:
+        """Whether the channel was recently found to have no club"""
+        expires = self._missing.get(channel_id)
+        if expires is None or expires < time.monotonic():
+            return False
+        self.hits += 1
+        return True
+
+    def fill_missing(self, channel_id) -> None:
+        """Remembers a channel that has no club"""
+        self._missing.pop(channel_id, None)
+        self._missing[channel_id] = time.monotonic() + self.ttl
+        while len(self._missing) > self.size:
+            self._missing.popitem(last=False)
+
+    def reading(self, key):
+        """Wraps a read of a club by id or channel id, see `WriteTracker`"""
+        return self._writes.reading(key)
+
+    def fill(self, club: Club) -> None:
+        """Caches a club read from the database"""
+        self._put(club)
+
+    def _written(self, club_id, channel_id=None) -> None:
+        self._writes.write(club_id)
+        self._writes.write(channel_id)
+        if entry := self._clubs.get(club_id):
+            # The club may have had another channel before the write
+            self._writes.write(entry[1].channel)
+
+    def put(self, club: Club) -> None:
+        """Caches the latest copy of a club after writing it"""
+        self._written(club.id, club.channel)
+        self._put(club)
+
+    def refresh(self, club: Club) -> None:
+        """Replaces the cached copy of a club changed elsewhere, if it's cached"""
+        self._written(club.id, club.channel)
+        if club.id in self._clubs:
+            self._put(club)
+
+    def _put(self, club: Club):
+        self._drop(club.id)
+        self._missing.pop(club.channel, None)
+        self._clubs[club.id] = (time.monotonic() + self.ttl, club)
+        if club.channel:
+            self._by_channel[club.channel] = club.id
+        while len(self._clubs) > self.size:
+            self._drop(next(iter(self._clubs)))
+
+    def _drop(self, club_id):
+        if entry := self._clubs.pop(club_id, None):
+            channel_id = entry[1].channel
+            if self._by_channel.get(channel_id) == club_id:
+                del self._by_channel[channel_id]
+
+    def discard(self, club_id, channel_id=None) -> None:
+        self._written(club_id, channel_id)
+        self._drop(club_id)
+
+    def clear(self) -> None:
+        self._writes.write_all()
+        self._clubs.clear()
+        self._by_channel.clear()
+        self._missing.clear()
+
+
+cache = {
+    "clubs": ClubRegistry(),
+    "users": UserRegistry(int(os.environ.get("USER_CACHE_SIZE", 10000))),
+    "timestamp": datetime.min.replace(tzinfo=timezone.utc),
+}
+# Read-through cache in front of Mongo, see `utils.db.get_club`
+club_cache = ClubCache(
+    int(os.environ.get("CLUB_CACHE_SIZE", 1024)),
+    float(os.environ.get("CLUB_CACHE_TTL", 60)),
+)
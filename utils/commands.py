@@ -0,0 +1,55 @@
+import hashlib
+import json
+import os
+
+from discord import app_commands
+from pymongo.errors import PyMongoError
+
+from utils.db import db
+
+# Set FORCE_SYNC to sync the command tree on startup even if it hasn't changed
+FORCE_SYNC = bool(os.environ.get("FORCE_SYNC"))
+
+
+def tree_hash(tree: app_commands.CommandTree) -> str:
+    """A hash of the global commands as they're sent to Discord, stable
+    across restarts as long as the commands don't change"""
+    payload = sorted(
+        (command.to_dict() for command in tree.get_commands()),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+async def sync_commands(tree: app_commands.CommandTree, force: bool = False) -> bool:
+    """Syncs the command tree unless it's the same as at the last sync.
+
+    Syncing is globally rate limited and slow, so restarts skip it when the
+    tree's hash matches the one stored by the previous sync.
+
+    Args:
+        tree (app_commands.CommandTree): The tree to sync.
+        force (bool): Sync even if the tree hasn't changed.
+
+    Returns:
+        bool: Whether the tree was synced.
+    """
+    digest = tree_hash(tree)
+    # Keyed by application so bots sharing a database don't skip each other's
+    key = f"commands:{tree.client.application_id}"
+    try:
+        state = await db.meta.find_one({"_id": key})
+    except PyMongoError as e:
+        print(f"[COMMANDS]: Couldn't read the last synced tree, syncing: {e}")
+        state = None
+
+    if not force and not FORCE_SYNC and state and state.get("hash") == digest:
+        return False
+
+    await tree.sync()
+    try:
+        await db.meta.update_one({"_id": key}, {"$set": {"hash": digest}}, upsert=True)
+    except PyMongoError as e:
+        print(f"[COMMANDS]: Couldn't store the synced tree's hash: {e}")
+    return True
@@ -26,6 +26,9 @@ COLORS = {
 CLUBS_CATEGORY = 1182384593140195338  # Dev
 # CLUBS_CATEGORY = 1038125721287151656 # FoR
 
+# Seconds an empty bubble is kept around before it's popped
+BUBBLE_GRACE_PERIOD = 60
+
 ROLES = {
     "MODS": 1182390311994003467,  # Dev
     # "MODS": 438855279363489812 # FoR Mods role
@@ -1,34 +1,180 @@
+import asyncio
 import os
+import time
 
-from datetime import datetime, timedelta
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
 
 import discord
 
 from bson import ObjectId
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
 from pymongo.server_api import ServerApi
-from utils.data import CHANNELS, COLORS, EMOJIS, NEW_CLUB_MESSAGE, CLUBS_CATEGORY, ROLES
+from utils.actions import MODERATION, actions
+from utils.cache import cache, club_cache
+from utils import guilds
+from utils.data import COLORS, EMOJIS, GUILD_ID, NEW_CLUB_MESSAGE
+from utils.expiry import expiries
+from utils.logs import log_sink
+from utils.metrics import MongoListener
+from utils.trace import TRACING, TracedCollection
 
 from utils.messages import create_embed
+from utils.models import Club, UserRecord, as_id
+from utils.permissions import PROTECTED, ClubPermission, resolve
 
 load_dotenv()
 
 # Set the Stable API version when creating a new client
-db_client = AsyncIOMotorClient(os.environ["MONGO_URI"], server_api=ServerApi("1"))
+db_client = AsyncIOMotorClient(
+    os.environ["MONGO_URI"],
+    server_api=ServerApi("1"),
+    event_listeners=[MongoListener()],
+)
 db = db_client.data
 clubs = db.clubs
 users = db.users
+sanctions = db.sanctions
+
+# User id -> the task loading them into `cache["users"]`, see `load_user`
+_loading = {}
+
+
+# Bump INDEXES_VERSION whenever INDEXES changes so the bootstrap runs again
+INDEXES_VERSION = 3
+INDEXES = {
+    "clubs": [
+        # Reconciliation walks each guild's verified clubs by _id
+        IndexModel(
+            [("guild", ASCENDING), ("verified", ASCENDING), ("_id", ASCENDING)],
+            name="guild",
+        ),
+        # Unapproved clubs don't have a channel yet
+        IndexModel(
+            "channel",
+            name="channel",
+            unique=True,
+            partialFilterExpression={"channel": {"$exists": True}},
+        ),
+        IndexModel("name", name="name"),
+        IndexModel("owner", name="owner"),
+        IndexModel("updated_at", name="updated_at"),
+    ],
+    "users": [
+        IndexModel("clubs", name="clubs"),
+        IndexModel("updated_at", name="updated_at"),
+    ],
+    "sanctions": [
+        # Expirations are a range scan over active sanctions only, lifted ones
+        # are kept as history
+        IndexModel(
+            [("expiration", ASCENDING), ("kind", ASCENDING)],
+            name="due",
+            partialFilterExpression={"active": True},
+        ),
+        IndexModel(
+            [("user", ASCENDING), ("club", ASCENDING), ("kind", ASCENDING)],
+            name="active",
+            unique=True,
+            partialFilterExpression={"active": True},
+        ),
+        IndexModel([("user", ASCENDING), ("created_at", DESCENDING)], name="history"),
+        IndexModel("updated_at", name="updated_at"),
+    ],
+}
+
+
+if TRACING:
+    # Record the operations each interaction makes, see utils.trace
+    clubs = TracedCollection(clubs, INDEXES["clubs"])
+    users = TracedCollection(users, INDEXES["users"])
+    sanctions = TracedCollection(sanctions, INDEXES["sanctions"])
+
+
+def _same_index(document: dict, information: dict) -> bool:
+    """Whether an index from `index_information()` is the one `document`
+    describes, in its keys and the options that change what it enforces"""
+    keys = [tuple(key) for key in information["key"]]
+    return (
+        keys == list(document["key"].items())
+        and bool(information.get("unique")) == bool(document.get("unique"))
+        and information.get("partialFilterExpression")
+        == document.get("partialFilterExpression")
+    )
+
+
+async def ensure_indexes() -> list[str]:
+    """Creates any missing indexes in INDEXES, returning the ones it created.
+    Indexes that exist under the same name but differ are recreated.
+
+    Skipped entirely once INDEXES_VERSION has been bootstrapped.
+    """
+    state = await db.meta.find_one({"_id": "indexes"})
+    if state and state.get("version") == INDEXES_VERSION:
+        return []
+
+    start = time.perf_counter()
+    created = []
+    failed = False
+    for collection, indexes in INDEXES.items():
+        existing = await db[collection].index_information()
+        for index in indexes:
+            name = index.document["name"]
+            if name in existing:
+                if _same_index(index.document, existing[name]):
+                    continue
+                # e.g. left by an older deploy without `unique`, which would
+                # otherwise never be enforced
+                print(f"[DB]: {collection}.{name} differs from INDEXES, recreating")
+            try:
+                if name in existing:
+                    await db[collection].drop_index(name)
+                await db[collection].create_indexes([index])
+                created.append(f"{collection}.{name}")
+            except OperationFailure as e:
+                # e.g. duplicate channels blocking the unique index
+                print(f"[DB]: Failed to create {collection}.{name}: {e}")
+                failed = True
+
+    if not failed:
+        await db.meta.update_one(
+            {"_id": "indexes"}, {"$set": {"version": INDEXES_VERSION}}, upsert=True
+        )
+    print(
+        f"[DB]: Created {len(created)} indexes in {time.perf_counter() - start:.2f}s"
+        + (f": {', '.join(created)}" if created else "")
+    )
+    return created
+
+
+def touch(update: dict) -> dict:
+    """Stamps `updated_at` on an update so the cache's delta poll can find it"""
+    return {**update, "$currentDate": {"updated_at": True}}
 
 
 async def create_club(name, topic, reason, interaction):
     guild = interaction.guild
     user = interaction.user
 
+    if not guilds.get(guild.id):
+        return await interaction.response.send_message(
+            embed=await create_embed(
+                "Club Creation Error",
+                "Club Bot hasn't been set up in this server yet.",
+                color=COLORS["ERROR"],
+            ),
+            ephemeral=True,
+        )
+
+    # Owners get one club per server
     user_entry = await users.find_one_and_update(
-        {"_id": user.id}, {"$set": {"owns_club": True}}, upsert=True
+        {"_id": user.id}, touch({"$addToSet": {"owns_club_in": guild.id}}), upsert=True
     )
-    if user_entry and user_entry.get("owns_club"):
+    if user_entry and guild.id in user_entry.get("owns_club_in", []):
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Club Creation Error",
@@ -40,6 +186,7 @@ async def create_club(name, topic, reason, interaction):
 
     club = await clubs.insert_one(
         {
+            "guild": guild.id,
             "owner": user.id,
             "name": name,
             "topic": topic,
@@ -47,6 +194,7 @@ async def create_club(name, topic, reason, interaction):
             "mods": [],
             "mod_perms": [],
             "bubble": None,
+            "updated_at": datetime.utcnow(),
         }
     )
 
@@ -60,12 +208,16 @@ async def create_club(name, topic, reason, interaction):
     modbed.add_field(name="Reason", value=reason)
     modbed.set_footer(text=f"Club ID: {club.inserted_id}")
 
-    channel = guild.get_channel(CHANNELS["MODS"])
+    log_sink.send(modbed, guild.id)
 
-    await channel.send(embed=modbed)
-
-    channel = guild.get_channel(CHANNELS["LOGS"])
-    await channel.send(embed=modbed)
+    await interaction.response.send_message(
+        embed=await create_embed(
+            "Requested Club Creation",
+            f"{user.display_name}, your club has been requested.",
+            color=COLORS["SUCCESS"],
+        ),
+        ephemeral=True,
+    )
 
     embed = await create_embed(
         "Requested Club Creation",
@@ -79,26 +231,21 @@ The request will be looked at by the mods and I'll let you know if your club is
     embed.add_field(name="Topic", value=topic)
     embed.add_field(name="Reason", value=reason)
     embed.set_footer(text=f"Club ID: {club.inserted_id}")
-    await user.send(embed=embed)
 
-    return await interaction.response.send_message(
-        embed=await create_embed(
-            "Requested Club Creation",
-            f"{user.display_name}, your club has been requested.",
-            color=COLORS["SUCCESS"],
-        ),
-        ephemeral=True,
-    )
+    if mods_channel := guilds.channel(guild, "MODS"):
+        actions.send(mods_channel, embed=modbed)
+    actions.dm(user, embed=embed)
 
 
 async def verify_club(verify, club_id, interaction):
     guild = interaction.guild
-    if guild.get_role(ROLES["MODS"]) not in interaction.user.roles:
+    if not guilds.is_mod(guild, interaction.user):
         return await interaction.response.send_message(embed=await create_embed())
-    club = await clubs.find_one({"_id": ObjectId(club_id)})
+    document = await clubs.find_one({"_id": ObjectId(club_id)})
+    club = Club.from_document(document) if document else None
 
-    if club:
-        if club.get("verified"):
+    if club and club.guild == guild.id:
+        if club.verified:
             return await interaction.response.send_message(
                 embed=await create_embed(
                     "Club Verification Error",
@@ -107,15 +254,18 @@ async def verify_club(verify, club_id, interaction):
                 ),
                 ephemeral=True,
             )
-        owner = guild.get_member(club["owner"])
+        owner = guild.get_member(club.owner)
+        # Creating the role and channel can take longer than Discord waits for
+        # a response
+        await interaction.response.defer()
 
         if verify:
-            role = await guild.create_role(name=f"{club['name']} Member")
-            mute = guild.get_role(ROLES["MUTE"])
+            role = await guild.create_role(name=f"{club.name} Member")
+            mute = guilds.role(guild, "MUTE")
             channel = await guild.create_text_channel(
-                name=club["name"],
-                category=guild.get_channel(CLUBS_CATEGORY),
-                topic=club["topic"],
+                name=club.name,
+                category=guilds.category(guild),
+                topic=club.topic,
                 overwrites={
                     # overwrite club owner
                     owner: discord.PermissionOverwrite(
@@ -133,69 +283,87 @@ async def verify_club(verify, club_id, interaction):
                 },
             )
 
-            await clubs.update_one(
-                {"_id": ObjectId(club_id)},
-                {"$set": {"role": role.id, "verified": True, "channel": channel.id}},
-            )
-            await users.update_one(
-                {"_id": club["owner"]},
-                {
-                    "$set": {"owns_club": verify},
-                    "$addToSet": {"clubs": ObjectId(club_id)},
-                },
+            await asyncio.gather(
+                clubs.update_one(
+                    {"_id": club.id},
+                    touch(
+                        {
+                            "$set": {
+                                "role": role.id,
+                                "verified": True,
+                                "channel": channel.id,
+                            }
+                        }
+                    ),
+                ),
+                users.update_one(
+                    {"_id": club.owner},
+                    touch(
+                        {
+                            "$addToSet": {
+                                "clubs": club.id,
+                                "owns_club_in": guild.id,
+                            },
+                        }
+                    ),
+                ),
             )
-
-            await owner.add_roles(role, reason="Club owner")
-
-            # Create club channel
+            cache["users"].join(club.owner, club.id)
+            cache_club(club.replace(role=role.id, verified=True, channel=channel.id))
         else:
             # Club rejected, delete from db
-            await clubs.delete_one({"_id": club_id})
-            await users.update_one(
-                {"_id": club["owner"]}, {"$set": {"owns_club": False}}
+            await asyncio.gather(
+                clubs.delete_one({"_id": club.id}),
+                users.update_one(
+                    {"_id": club.owner},
+                    touch({"$pull": {"owns_club_in": guild.id}}),
+                ),
             )
+            # Deletes can't be seen by the delta poll, so drop it from the cache here
+            uncache_club(club.id)
 
         word = "approved" if verify else "rejected"
         color = COLORS["SUCCESS"] if verify else COLORS["ERROR"]
 
         logbed = await create_embed(
             f"Club {word.capitalize()}",
-            f"`{club['name']}` has been {word} by {interaction.user.mention}(`{interaction.user.name}`.)",
+            f"`{club.name}` has been {word} by {interaction.user.mention}(`{interaction.user.name}`.)",
             color,
         )
         logbed.set_footer(text=f"Club ID: {club_id}")
 
-        channel = guild.get_channel(CHANNELS["LOGS"])
-        await channel.send(embed=logbed)
+        log_sink.send(logbed, guild.id)
 
         embed = await create_embed(
             f"Club {word.capitalize()}",
-            f"You have {word} the club: `{club['name']}`",
+            f"You have {word} the club: `{club.name}`",
             color=color,
         )
 
-        await interaction.response.send_message(embed=embed)
+        await interaction.followup.send(embed=embed)
 
         next_embed = await create_embed(
-            f"`{club['name']}` Club {word.capitalize()}",
+            f"`{club.name}` Club {word.capitalize()}",
             f"""
 bHi {owner.display_name}!
-Your club `{club['name']}` has been {word} by the mods.
+Your club `{club.name}` has been {word} by the mods.
 {NEW_CLUB_MESSAGE if verify else 'You may submit a new club request in the future.'}
             """,
             color=color,
         )
 
-        await owner.send(embed=next_embed)
+        actions.dm(owner, embed=next_embed)
+        if verify:
+            actions.add_roles(owner, role, priority=MODERATION, reason="Club owner")
 
         return True
     return False
 
 
 async def join_club(club_id: str, interaction):
-    club = await clubs.find_one({"_id": ObjectId(club_id)})
+    club = await get_club(club_id)
     # If the user exists, add the club to their `clubs` array
-    if not club:
+    if not club or club.guild != interaction.guild_id:
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Club Join Failed",
@@ -204,7 +372,7 @@ async def join_club(club_id: str, interaction):
             ),
             ephemeral=True,
         )
-    elif not club["verified"]:
+    elif not club.verified:
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Club Join Failed",
@@ -213,8 +381,7 @@ async def join_club(club_id: str, interaction):
             ),
             ephemeral=True,
         )
-    user = await users.find_one({"_id": interaction.user.id})
-    if any(ban.get("club_id") == club["_id"] for ban in user["bans"]):
+    if await get_sanction(interaction.user.id, club.id, "ban"):
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Club Join Failed",
@@ -226,49 +393,49 @@ async def join_club(club_id: str, interaction):
 
     update_result = await users.update_one(
         {"_id": interaction.user.id},
-        {"$addToSet": {"clubs": ObjectId(club_id)}},
+        touch({"$addToSet": {"clubs": club.id}}),
         upsert=True,
     )
-    await interaction.user.add_roles(
-        interaction.guild.get_role(club["role"]), reason="Joined club"
-    )
+    cache["users"].join(interaction.user.id, club.id)
+    role = interaction.guild.get_role(club.role)
     if update_result.modified_count or update_result.upserted_id:
         modbed = await create_embed(
             "Club Joined",
-            f"{interaction.user.mention}(`{interaction.user.name}`) has joined `{club['name']}`.",
+            f"{interaction.user.mention}(`{interaction.user.name}`) has joined `{club.name}`.",
             COLORS["JOIN_CLUB"],
         )
-        modbed.set_footer(text=f"Club ID: {club['_id']}")
-
-        channel = interaction.guild.get_channel(CHANNELS["LOGS"])
-        await channel.send(embed=modbed)
+        modbed.set_footer(text=f"Club ID: {club.id}")
 
-        channel = interaction.guild.get_channel(club["channel"])
-        await channel.send(
-            f"*{interaction.user.mention} has joined the **{club['name']}** club <:{EMOJIS['REPLJOY']['name']}:{EMOJIS['REPLJOY']['id']}>*"
-        )
+        log_sink.send(modbed, interaction.guild_id)
 
         embed = await create_embed(
             "Joined Club",
-            f"You have joined the club: `{club['name']}`",
+            f"You have joined the club: `{club.name}`",
             COLORS["SUCCESS"],
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        actions.add_roles(interaction.user, role, reason="Joined club")
+        actions.send(
+            interaction.guild.get_channel(club.channel),
+            f"*{interaction.user.mention} has joined the **{club.name}** club <:{EMOJIS['REPLJOY']['name']}:{EMOJIS['REPLJOY']['id']}>*",
+        )
         return True
     else:
         embed = await create_embed(
             "Already Joined",
-            f"You have already joined the club: `{club['name']}`",
+            f"You have already joined the club: `{club.name}`",
             COLORS["ERROR"],
         )
         await interaction.response.send_message(embed=embed)
+        actions.add_roles(interaction.user, role, reason="Joined club")
         return False
 
 
 async def leave_club(club_id: str, interaction):
-    club = await clubs.find_one({"_id": ObjectId(club_id)})
+    club = await get_club(club_id)
     # If the user exists, add the club to their `clubs` array
-    if not club:
+    if not club or club.guild != interaction.guild_id:
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Club Leave Failed",
@@ -280,35 +447,34 @@ async def leave_club(club_id: str, interaction):
 
     update_result = await users.update_one(
         {"_id": interaction.user.id},
-        {"$pull": {"clubs": ObjectId(club_id)}},
+        touch({"$pull": {"clubs": club.id}}),
         upsert=True,
     )
-    await interaction.user.remove_roles(
-        interaction.guild.get_role(club["role"]), reason="Left club"
-    )
+    cache["users"].leave(interaction.user.id, club.id)
+    role = interaction.guild.get_role(club.role)
     if update_result.modified_count or update_result.upserted_id:
         modbed = await create_embed(
             "Club Left",
-            f"{interaction.user.mention}(`{interaction.user.name}`) has left `{club['name']}`.",
+            f"{interaction.user.mention}(`{interaction.user.name}`) has left `{club.name}`.",
             COLORS["LEAVE_CLUB"],
         )
-        modbed.set_footer(text=f"Club ID: {club['_id']}")
+        modbed.set_footer(text=f"Club ID: {club.id}")
 
-        channel = interaction.guild.get_channel(CHANNELS["LOGS"])
-        await channel.send(embed=modbed)
+        log_sink.send(modbed, interaction.guild_id)
 
         embed = await create_embed(
             "Left Club",
-            f"You have left the club: `{club['name']}`",
+            f"You have left the club: `{club.name}`",
             COLORS["SUCCESS"],
         )
 
-        channel = interaction.guild.get_channel(club["channel"])
-        await channel.send(
-            f"*{interaction.user.mention} has left the **{club['name']}** club <:{EMOJIS['REPLSAD']['name']}:{EMOJIS['REPLSAD']['id']}>*"
-        )
-
         await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        actions.remove_roles(interaction.user, role, reason="Left club")
+        actions.send(
+            interaction.guild.get_channel(club.channel),
+            f"*{interaction.user.mention} has left the **{club.name}** club <:{EMOJIS['REPLSAD']['name']}:{EMOJIS['REPLSAD']['id']}>*",
+        )
         return True
     else:
         embed = await create_embed(
@@ -317,13 +483,14 @@ async def leave_club(club_id: str, interaction):
             COLORS["ERROR"],
         )
         await interaction.response.send_message(embed=embed)
+        actions.remove_roles(interaction.user, role, reason="Left club")
         return False
 
 
 async def delete_club(club_id: str, interaction):
-    club = await clubs.find_one({"_id": ObjectId(club_id)})
+    club = await get_club(club_id)
     # If the user exists, add the club to their `clubs` array
-    if not club:
+    if not club or club.guild != interaction.guild_id:
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Club Delete Failed",
@@ -338,7 +505,7 @@ async def create_join_bubble(interaction: discord.Interaction):
     # Get current channel name
 
     channel, guild = interaction.channel, interaction.guild
-    if not guild or type(channel) != discord.TextChannel:
+    if not guild or not isinstance(channel, discord.TextChannel):
         return
 
     club = await get_club_by_channel(channel.id)
@@ -346,23 +513,21 @@ async def create_join_bubble(interaction: discord.Interaction):
         return
 
     # Get current bubble if it exists, or return None
-    bubble = next(
-        (c for c in guild.channels if c.name == f"{club['name']} Bubble"), None
-    )
+    bubble = guild.get_channel(club.bubble) if club.bubble else None
 
     if bubble:
         return await interaction.response.send_message(
             f"{interaction.user.mention} You already have a bubble: {bubble.mention}!"
         )
 
-    role = guild.get_role(club["role"])
+    role = guild.get_role(club.role)
     bubble = await guild.create_voice_channel(
-        f"{club['name']} Bubble",
-        category=guild.get_channel(CLUBS_CATEGORY),
-        reason=f'{club["name"]} bubble created by {interaction.user.name}',
+        f"{club.name} Bubble",
+        category=guilds.category(guild),
+        reason=f"{club.name} bubble created by {interaction.user.name}",
         overwrites={
             role: discord.PermissionOverwrite(view_channel=True, stream=None),
-            guild.get_role(ROLES["MUTE"]): discord.PermissionOverwrite(
+            guilds.role(guild, "MUTE"): discord.PermissionOverwrite(
                 stream=False, speak=False, send_messages=False
             ),
             guild.default_role: discord.PermissionOverwrite(
@@ -372,19 +537,19 @@ async def create_join_bubble(interaction: discord.Interaction):
     )
 
     await clubs.update_one(
-        {"_id": ObjectId(club["_id"])},
-        {"$set": {"bubble": bubble.id}},
+        {"_id": club.id},
+        touch({"$set": {"bubble": bubble.id}}),
     )
+    cache_club(club.replace(bubble=bubble.id))
 
     modbed = await create_embed(
         "Bubble Created",
-        f"{interaction.user.mention}(`{interaction.user.name}`) has created a bubble for `{club['name']}`.",
+        f"{interaction.user.mention}(`{interaction.user.name}`) has created a bubble for `{club.name}`.",
         COLORS["NEW_CLUB"],
     )
-    modbed.set_footer(text=f"Club ID: {club['_id']}")
+    modbed.set_footer(text=f"Club ID: {club.id}")
 
-    channel = guild.get_channel(CHANNELS["LOGS"])
-    await channel.send(embed=modbed)
+    log_sink.send(modbed, guild.id)
 
     embed = await create_embed(
         "Bubble Created",
@@ -393,6 +558,7 @@ async def create_join_bubble(interaction: discord.Interaction):
     )
 
     await interaction.response.send_message(embed=embed)
+    return bubble
 
 
 async def mute(interaction: discord.Interaction, user: discord.Member, time: int):
@@ -408,9 +574,7 @@ async def mute(interaction: discord.Interaction, user: discord.Member, time: int
             ephemeral=True,
         )
 
-    if (
-        interaction.user.id not in club["mods"] or "mute" not in club["mod_perms"]
-    ) and interaction.user.id != club["owner"]:
+    if not resolve(club, interaction.user) & ClubPermission.MUTE:
         return await interaction.response.send_message(
             embed=await create_embed(
                 title="No Permission",
@@ -420,11 +584,7 @@ async def mute(interaction: discord.Interaction, user: discord.Member, time: int
             ephemeral=True,
         )
 
-    if (
-        user.id in club.get("mods")
-        or user.id == club.get("owner")
-        or interaction.guild.get_role(ROLES["MODS"]) in user.roles
-    ):
+    if resolve(club, user) & PROTECTED:
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Mute Failed",
@@ -434,28 +594,18 @@ async def mute(interaction: discord.Interaction, user: discord.Member, time: int
             ephemeral=False,
         )
 
-    expiry = await update_user_mutes(user.id, str(club["_id"]), duration=time)
+    expiry = await update_user_mutes(
+        user.id, str(club.id), duration=time, moderator_id=interaction.user.id
+    )
     channel = interaction.channel
-    if type(channel) != discord.TextChannel:
+    if not isinstance(channel, discord.TextChannel):
         return await interaction.response.send_message(
             embed=await create_embed(
                 description="Whoops, something went wrong :cry:",
                 color=COLORS["ERROR"],
             )
         )
-    # update channel overrides to mute user
-    overwrites = channel.overwrites
     if time > 0:
-        overwrites[user] = discord.PermissionOverwrite(
-            view_channel=True,
-            send_messages=False,
-            speak=False,
-            add_reactions=False,
-            create_public_threads=False,
-            create_private_threads=False,
-            send_messages_in_threads=False,
-        )
-        await channel.edit(overwrites=overwrites)
         await interaction.response.send_message(
             embed=await create_embed(
                 "Club Mute Success",
@@ -463,26 +613,22 @@ async def mute(interaction: discord.Interaction, user: discord.Member, time: int
                 color=COLORS["SUCCESS"],
             )
         )
-        await user.send(
-            f'You have been muted in {club["name"]} club for {time} minutes by {interaction.user.display_name}. This will expire <t:{expiry}:R>'
+        actions.dm(
+            user,
+            f"You have been muted in {club.name} club for {time} minutes by {interaction.user.display_name}. This will expire <t:{expiry}:R>",
         )
         log = await create_embed(
             "Club Mute",
             f"""
     **User:** {user.mention} (`{user.name}`)
     **Moderator:** {interaction.user.mention} (`{interaction.user.name}`)
-    **Club:** {club['name']}
+    **Club:** {club.name}
     **Duration:** {time} minutes
     **Expiry:** <t:{expiry}:R>
     """,
             COLORS["MUTE"],
         )
     else:
-        # remove the users overrides as they're unmuted
-        if user in overwrites:
-            del overwrites[user]
-        await channel.edit(overwrites=overwrites)
-
         await interaction.response.send_message(
             embed=await create_embed(
                 "Club Mute Success",
@@ -490,8 +636,9 @@ async def mute(interaction: discord.Interaction, user: discord.Member, time: int
                 color=COLORS["SUCCESS"],
             )
         )
-        await user.send(
-            f'You have been unmuted in {club["name"]} club by {interaction.user.display_name}'
+        actions.dm(
+            user,
+            f"You have been unmuted in {club.name} club by {interaction.user.display_name}",
         )
 
         log = await create_embed(
@@ -499,58 +646,90 @@ async def mute(interaction: discord.Interaction, user: discord.Member, time: int
             f"""
 **User:** {user.mention} (`{user.name}`)
 **Moderator:** {interaction.user.mention} (`{interaction.user.name}`)
-**Club:** {club['name']}
+**Club:** {club.name}
 """,
             COLORS["UNMUTE"],
         )
 
-    channel = interaction.guild.get_channel(CHANNELS["LOGS"])  # type:ignore
-    log.set_footer(text=f"Club ID: {club['_id']}")
-    await channel.send(embed=log)
+    log.set_footer(text=f"Club ID: {club.id}")
+    log_sink.send(log, interaction.guild_id)
 
+    actions.submit(
+        set_muted(channel, user, club.id, time > 0),
+        ("channel", channel.id),
+        MODERATION,
+        "MUTE",
+    )
+
+
+def set_muted(
+    channel: discord.TextChannel,
+    member: discord.Member,
+    club_id: ObjectId,
+    muted: bool,
+) -> Callable[[], Awaitable]:
+    """Mutes or unmutes a member in a club channel by editing only their own
+    overwrite, so the request is the same size however many are muted"""
+
+    async def run():
+        # Queued expiry unmutes run at a lower priority than moderators'
+        # mutes, so check the mute is still (or still not) in force when the
+        # edit runs rather than undoing a newer one
+        if bool(await get_sanction(member.id, club_id, "mute")) != muted:
+            return
+        if muted:
+            overwrite = discord.PermissionOverwrite(
+                view_channel=True,
+                send_messages=False,
+                speak=False,
+                add_reactions=False,
+                create_public_threads=False,
+                create_private_threads=False,
+                send_messages_in_threads=False,
+            )
+        elif channel.overwrites_for(member).is_empty():
+            # Checked when it runs rather than when it's queued, another
+            # unmute may have got there first
+            return
+        else:
+            # Unmuted members have no overwrite of their own
+            overwrite = None
+        await channel.set_permissions(
+            member, overwrite=overwrite, reason="Muted" if muted else "Unmuted"
+        )
 
-async def update_user_mutes(user_id: int, club_id: str, duration: int = 0):
+    return run
+
+
+async def update_user_mutes(
+    user_id: int, club_id: str, duration: int = 0, moderator_id: int | None = None
+):
     """Update a user's mute information in the database.
 
     Args:
         user_id (int): The ID of the user to update.
         club_id (str): The ID of the club the mute applies to.
         duration (int, optional): The duration of the mute in minutes. If 0 or less, the mute is removed.
+        moderator_id (int, optional): The ID of the moderator muting the user.
     Returns:
         int: The Unix time when the mute will expire, or None if the user was unmuted.
     """
     club_obj_id = ObjectId(club_id)
     if duration > 0:
         mute_expiration = datetime.utcnow() + timedelta(minutes=duration)
-        # Check if the mute already exists for this club.
-        existing_mute = await users.find_one(
-            {"_id": user_id, "mutes.club_id": club_obj_id}
-        )
-        if existing_mute:
-            # If it does, update the existing mute's expiration.
-            await users.update_one(
-                {"_id": user_id, "mutes.club_id": club_obj_id},
-                {"$set": {"mutes.$.expiration": mute_expiration}},
-            )
-        else:
-            # If not, push a new mute onto the mutes array.
-            await users.update_one(
-                {"_id": user_id},
-                {
-                    "$push": {
-                        "mutes": {"club_id": club_obj_id, "expiration": mute_expiration}
-                    }
-                },
-            )
+        # Replaces the expiration of any existing mute for this club.
+        await add_sanction(user_id, club_obj_id, "mute", mute_expiration, moderator_id)
     else:
         # If duration is 0 or less, remove the mute.
-        await users.update_one(
-            {"_id": user_id}, {"$pull": {"mutes": {"club_id": club_obj_id}}}
-        )
+        await lift_sanction(user_id, club_obj_id, "mute")
         mute_expiration = None
 
     # Return the Unix timestamp of when the mute expires or None if unmuting.
-    return int(mute_expiration.timestamp()) if mute_expiration else None
+    return (
+        int(mute_expiration.replace(tzinfo=timezone.utc).timestamp())
+        if mute_expiration
+        else None
+    )
 
 
 async def ban(
@@ -575,9 +754,7 @@ async def ban(
             ),
             ephemeral=True,
         )
-    elif (
-        interaction.user.id not in club["mods"] or "ban" not in club["mod_perms"]
-    ) and interaction.user.id != club["owner"]:
+    elif not resolve(club, interaction.user) & ClubPermission.BAN:
         return await interaction.response.send_message(
             embed=await create_embed(
                 title="No Permission",
@@ -586,11 +763,7 @@ async def ban(
             ),
             ephemeral=True,
         )
-    elif (
-        user.id in club.get("mods")
-        or user.id == club.get("owner")
-        or interaction.guild.get_role(ROLES["MODS"]) in user.roles
-    ):
+    elif resolve(club, user) & PROTECTED:
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Ban Failed",
@@ -599,9 +772,9 @@ async def ban(
             ),
             ephemeral=False,
         )
-    club_obj_id = ObjectId(club["_id"])
+    club_obj_id = club.id
 
-    if {"club_id": club_obj_id} in clubber.get("bans", []):
+    if duration and await get_sanction(user.id, club_obj_id, "ban"):
         return await interaction.response.send_message(
             embed=await create_embed(
                 "Ban Failed",
@@ -610,141 +783,477 @@ async def ban(
             )
         )
 
-    role = interaction.guild.get_role(club["role"])
+    role = interaction.guild.get_role(club.role)
 
     if isinstance(duration, bool) and duration is True:
         # Permanent ban
-        ban_expiration = None
-
-        await users.update_one(
-            {"_id": user.id},
-            {
-                "$push": {
-                    "bans": {"club_id": club_obj_id, "expiration": ban_expiration}
-                },
-                "$pull": {"clubs": club_obj_id},
-            },
+        await asyncio.gather(
+            add_sanction(user.id, club_obj_id, "ban", None, interaction.user.id),
+            users.update_one(
+                {"_id": user.id}, touch({"$pull": {"clubs": club_obj_id}})
+            ),
         )
 
-        await user.remove_roles(role)
-
-        await user.send(
-            embed=await create_embed(
-                "Permanent Club Ban",
-                f"""
+        response = await create_embed(
+            f"Permanently Banned {user.mention}",
+            f"{user.mention} has been permanently banned by {interaction.user.mention}.",
+            color=COLORS["SUCCESS"],
+        )
+        dm = await create_embed(
+            "Permanent Club Ban",
+            f"""
 Hey {user.display_name},
-Unfortunately, you have been permanently banned from {club['name']} club by {interaction.user.mention}(`{interaction.user.name}`).
+Unfortunately, you have been permanently banned from {club.name} club by {interaction.user.mention}(`{interaction.user.name}`).
 If a moderator decides to unban you in the future, I'll let you know here!
 """,
-                color=COLORS["BAN"],
-            )
-        )
-
-        await interaction.response.send_message(
-            embed=await create_embed(
-                f"Permanently Banned {user.mention}",
-                f"{user.mention} has been permanently banned by {interaction.user.mention}.",
-                color=COLORS["SUCCESS"],
-            )
+            color=COLORS["BAN"],
         )
-
         logbed = await create_embed(
             "Permanent Club Ban",
             f"""
 **User:** {user.mention} (`{user.name}`)
 **Moderator:** {interaction.user.mention} (`{interaction.user.name}`)
-**Club:** {club['name']}
+**Club:** {club.name}
 """,
             color=COLORS["BAN"],
         )
+        removes_role = True
     elif isinstance(duration, int) and duration > 0:
         # Temporary ban with expiration
         ban_expiration = datetime.utcnow() + timedelta(minutes=duration)
-        timestamp = int(ban_expiration.timestamp())
+        timestamp = int(ban_expiration.replace(tzinfo=timezone.utc).timestamp())
 
-        await user.remove_roles(role)
+        await asyncio.gather(
+            add_sanction(
+                user.id, club_obj_id, "ban", ban_expiration, interaction.user.id
+            ),
+            users.update_one(
+                {"_id": user.id}, touch({"$pull": {"clubs": club_obj_id}})
+            ),
+        )
 
-        await users.update_one(
-            {"_id": user.id},
-            {
-                "$push": {
-                    "bans": {"club_id": club_obj_id, "expiration": ban_expiration}
-                },
-                "$pull": {"clubs": club_obj_id},
-            },
+        response = await create_embed(
+            f"Temporarily Banned {user.mention}",
+            f"{user.mention} has been banned by {interaction.user.mention}. It expires <t:{timestamp}:R>",
+            color=COLORS["SUCCESS"],
         )
-        await user.send(
-            embed=await create_embed(
-                "Temporary Club Ban",
-                f"""
+        dm = await create_embed(
+            "Temporary Club Ban",
+            f"""
 Hey {user.display_name},
-Unfortunately, you have been temporarily banned from {club['name']} club by {interaction.user.mention}(`{interaction.user.name}`).
+Unfortunately, you have been temporarily banned from {club.name} club by {interaction.user.mention}(`{interaction.user.name}`).
 Your ban will expire <t:{timestamp}:R> or a moderator may decide to unban you.
 """,
-                color=COLORS["BAN"],
-            )
+            color=COLORS["BAN"],
         )
         logbed = await create_embed(
             "Temporary Club Ban",
             f"""
 **User:** {user.mention} (`{user.name}`)
 **Moderator:** {interaction.user.mention} (`{interaction.user.name}`)
-**Club:** {club['name']}
+**Club:** {club.name}
 **Duration:** {duration} minutes
 **Expiry:** <t:{timestamp}:R>
 """,
             color=COLORS["BAN"],
         )
-
+        removes_role = True
     else:
         # If duration is 0 or less, remove the ban.
-        await users.update_one(
-            {"_id": user.id}, {"$pull": {"bans": {"club_id": club_obj_id}}}
-        )
+        await lift_sanction(user.id, club_obj_id, "ban")
 
-        await user.send(
-            embed=await create_embed(
-                "Unbanned from Club",
-                f"You have been unbanned from {club['name']} club by {interaction.user.mention} (`{interaction.user.name}`)",
-                COLORS["UNBAN"],
-            )
+        response = await create_embed(
+            f"Unbanned {user.mention}",
+            f"{user.mention} has been unbanned by {interaction.user.mention}",
+            color=COLORS["SUCCESS"],
+        )
+        dm = await create_embed(
+            "Unbanned from Club",
+            f"You have been unbanned from {club.name} club by {interaction.user.mention} (`{interaction.user.name}`)",
+            COLORS["UNBAN"],
         )
         logbed = await create_embed(
             "Club Unban",
             f"""
 **User:** {user.mention} (`{user.name}`)
 **Moderator:** {interaction.user.mention} (`{interaction.user.name}`)
-**Club:** {club['name']}
+**Club:** {club.name}
             """,
             color=COLORS["UNBAN"],
         )
-        await interaction.response.send_message(
-            embed=await create_embed(
-                f"Unbanned {user.mention}",
-                f"{user.mention} has been unbanned by {interaction.user.mention}",
-                color=COLORS["SUCCESS"],
+        removes_role = False
+
+    logbed.set_footer(text=f"Club ID: {club.id}")
+    log_sink.send(logbed, interaction.guild_id)
+
+    await interaction.response.send_message(embed=response)
+    if removes_role:
+        actions.remove_roles(user, role, priority=MODERATION, reason="Banned from club")
+    actions.dm(user, embed=dm)
+
+
+def cache_club(club: Club) -> None:
+    """Writes a club we've just changed through to both caches"""
+    club_cache.put(club)
+    cache["clubs"].upsert(club)
+
+
+def uncache_club(club_id) -> None:
+    club = cache["clubs"].get(club_id)
+    club_cache.discard(club_id, club.channel if club else None)
+    cache["clubs"].remove(club_id)
+
+
+async def get_club(club_id) -> Club | None:
+    """Looks a club up by id, from `cache["clubs"]` or `club_cache` if it's
+    there"""
+    club_id = as_id(club_id)
+    if club := cache["clubs"].get(club_id) or club_cache.get(club_id):
+        return club
+    with club_cache.reading(club_id) as unwritten:
+        document = await clubs.find_one({"_id": club_id})
+        if not document:
+            return None
+        club = Club.from_document(document)
+        if unwritten():
+            club_cache.fill(club)
+    return club
+
+
+async def load_user(user_id: int) -> UserRecord:
+    """Makes sure a user is in `cache["users"]`, loading their document and
+    active sanctions on a miss"""
+    registry = cache["users"]
+    if user_id in registry:
+        registry.hits += 1
+        return registry.get(user_id)
+    registry.misses += 1
+    # Autocomplete fires on every keystroke, share one load between them
+    if pending := _loading.get(user_id):
+        return await asyncio.shield(pending)
+
+    async def load():
+        with registry.reading(user_id) as unwritten:
+            user, active = await asyncio.gather(
+                users.find_one({"_id": user_id}),
+                sanctions.find(
+                    {"user": user_id, "active": True},
+                    projection={"club": 1, "kind": 1},
+                ).to_list(length=None),
             )
+            user = UserRecord.from_document(user_id, user, active)
+            if unwritten():
+                registry.fill(user)
+        return user
+
+    _loading[user_id] = task = asyncio.create_task(load())
+    task.add_done_callback(lambda _: _loading.pop(user_id, None))
+    return await asyncio.shield(task)
+
+
+async def load_users(user_ids) -> None:
+    """Like `load_user` for many users at once, with one query for the users
+    that aren't cached and one for their sanctions"""
+    registry = cache["users"]
+    missing = [user_id for user_id in set(user_ids) if user_id not in registry]
+    if not missing:
+        return
+    with ExitStack() as reads:
+        unwritten = {
+            user_id: reads.enter_context(registry.reading(user_id))
+            for user_id in missing
+        }
+        documents, active = await asyncio.gather(
+            users.find({"_id": {"$in": missing}}).to_list(length=None),
+            sanctions.find(
+                {"user": {"$in": missing}, "active": True},
+                projection={"user": 1, "club": 1, "kind": 1},
+            ).to_list(length=None),
+        )
+        documents = {document["_id"]: document for document in documents}
+        by_user = {}
+        for sanction in active:
+            by_user.setdefault(sanction["user"], []).append(sanction)
+        for user_id in missing:
+            if unwritten[user_id]() and user_id not in registry:
+                registry.fill(
+                    UserRecord.from_document(
+                        user_id, documents.get(user_id), by_user.get(user_id, ())
+                    )
+                )
+
+
+async def get_club_by_name(guild_id: int, name: str) -> Club | None:
+    document = await clubs.find_one({"guild": guild_id, "name": name})
+    return Club.from_document(document) if document else None
+
+
+async def get_club_by_channel(channel) -> Club | None:
+    """Looks a club up by its channel's id, from `cache["clubs"]` or
+    `club_cache` if it's there"""
+    if club := cache["clubs"].by_channel(channel) or club_cache.by_channel(channel):
+        return club
+    if club_cache.missing(channel):
+        return None
+    with club_cache.reading(channel) as unwritten:
+        document = await clubs.find_one({"channel": channel})
+        if not document:
+            if unwritten():
+                # Most channels aren't club channels, don't ask every time
+                club_cache.fill_missing(channel)
+            return None
+        club = Club.from_document(document)
+        if unwritten():
+            club_cache.fill(club)
+    return club
+
+
+async def edit_club(club_id: str, **kwargs) -> Club | None:
+    """Sets fields on a club, returning the updated club"""
+    document = await clubs.find_one_and_update(
+        {"_id": ObjectId(club_id)},
+        touch({"$set": kwargs}),
+        return_document=ReturnDocument.AFTER,
+    )
+    if not document:
+        return None
+    club = Club.from_document(document)
+    cache_club(club)
+    return club
+
+
+async def add_sanction(
+    user_id: int,
+    club_id: ObjectId,
+    kind: str,
+    expiration: datetime | None,
+    moderator_id: int | None = None,
+):
+    """Mutes or bans a user in a club, replacing any active sanction of the same kind.
+
+    Args:
+        user_id (int): The ID of the sanctioned user.
+        club_id (ObjectId): The ID of the club the sanction applies to.
+        kind (str): "mute" or "ban".
+        expiration (datetime | None): When the sanction expires (naive UTC), or None if it's permanent.
+        moderator_id (int, optional): The ID of the moderator who issued it.
+    """
+    await sanctions.update_one(
+        {"user": user_id, "club": club_id, "kind": kind, "active": True},
+        touch(
+            {
+                "$set": {"expiration": expiration, "moderator": moderator_id},
+                "$setOnInsert": {"created_at": datetime.utcnow()},
+            }
+        ),
+        upsert=True,
+    )
+    if kind == "mute":
+        cache["users"].mute(user_id, club_id)
+    else:
+        cache["users"].ban(user_id, club_id)
+    if expiration:
+        expiries.schedule(kind, user_id, club_id, expiration)
+    else:
+        expiries.cancel(kind, user_id, club_id)
+
+
+async def lift_sanction(user_id: int, club_id: ObjectId, kind: str) -> bool:
+    """Ends a user's active sanction, keeping it as history.
+
+    Returns:
+        bool: Whether there was an active sanction to lift.
+    """
+    result = await sanctions.update_one(
+        {"user": user_id, "club": club_id, "kind": kind, "active": True},
+        touch({"$set": {"active": False, "lifted_at": datetime.utcnow()}}),
+    )
+    if kind == "mute":
+        cache["users"].unmute(user_id, club_id)
+    else:
+        cache["users"].unban(user_id, club_id)
+    expiries.cancel(kind, user_id, club_id)
+    return bool(result.modified_count)
+
+
+async def lift_sanctions(expired) -> int:
+    """Lifts many sanctions in one bulk write.
+
+    Args:
+        expired (Iterable[Expiry]): The sanctions to lift.
+    Returns:
+        int: The number of active sanctions that were lifted.
+    """
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {
+                "user": expiry.user_id,
+                "club": expiry.club_id,
+                "kind": expiry.kind,
+                "active": True,
+            },
+            touch({"$set": {"active": False, "lifted_at": now}}),
         )
+        for expiry in expired
+    ]
+    if not operations:
+        return 0
+    result = await sanctions.bulk_write(operations, ordered=False)
+
+    # Only once the write went through, a failed batch is retried by the
+    # scheduler and must still be cached and scheduled as active
+    for expiry in expired:
+        if expiry.kind == "mute":
+            cache["users"].unmute(expiry.user_id, expiry.club_id)
+        else:
+            cache["users"].unban(expiry.user_id, expiry.club_id)
+        expiries.cancel(expiry.kind, expiry.user_id, expiry.club_id)
+    return result.modified_count
+
+
+async def get_sanction(user_id: int, club_id: ObjectId, kind: str):
+    return await sanctions.find_one(
+        {"user": user_id, "club": club_id, "kind": kind, "active": True}
+    )
 
-        ban_expiration = None
 
-    logbed.set_footer(text=f"Club ID: {club['_id']}")
-    channel = interaction.guild.get_channel(CHANNELS["LOGS"])
-    if isinstance(channel, discord.TextChannel):
-        await channel.send(embed=logbed)
+async def get_user_sanctions(user_id: int, active: bool | None = True) -> list:
+    """Returns a user's sanctions, newest first. Pass active=None for history."""
+    query = {"user": user_id}
+    if active is not None:
+        query["active"] = active
+    return await sanctions.find(query).sort("created_at", -1).to_list(length=None)
 
 
-async def get_club(club_id):
-    return await clubs.find_one({"_id": club_id})
+async def get_due_sanctions(until: datetime) -> list:
+    """Returns every active temporary sanction expiring by `until`, soonest first"""
+    return (
+        await sanctions.find({"expiration": {"$lte": until}, "active": True})
+        .sort("expiration")
+        .to_list(length=None)
+    )
 
 
-async def get_club_by_name(name):
-    return await clubs.find_one({"name": name})
+async def load_expiries(guild_ids=None):
+    """Schedules the temporary mutes and bans in the database to expire.
 
+    Args:
+        guild_ids (set[int] | None): Only schedule the sanctions of clubs in
+            these guilds, e.g. the ones on this process's shards. Every
+            sanction if None.
+    """
+    for sanction in await get_due_sanctions(datetime.max):
+        if guild_ids is not None:
+            club = cache["clubs"].get(sanction["club"])
+            if not club or club.guild not in guild_ids:
+                continue
+        expiries.schedule(
+            sanction["kind"], sanction["user"], sanction["club"], sanction["expiration"]
+        )
 
-async def get_club_by_channel(channel):
-    return await clubs.find_one({"channel": channel})
 
+async def migrate_sanctions() -> int:
+    """Moves mutes and bans embedded in user documents into `sanctions`.
 
-async def edit_club(club_id: str, **kwargs):
-    return await clubs.update_one({"_id": ObjectId(club_id)}, {"$set": kwargs})
+    Returns:
+        int: The number of sanctions migrated.
+    """
+    state = await db.meta.find_one({"_id": "sanctions"})
+    if state and state.get("migrated"):
+        return 0
+
+    migrated = 0
+    cursor = users.find(
+        {"$or": [{"mutes": {"$exists": True}}, {"bans": {"$exists": True}}]},
+        projection={"mutes": 1, "bans": 1},
+    )
+    async for user in cursor:
+        for kind, embedded in (("mute", "mutes"), ("ban", "bans")):
+            for sanction in user.get(embedded, []):
+                await sanctions.update_one(
+                    {
+                        "user": user["_id"],
+                        "club": sanction["club_id"],
+                        "kind": kind,
+                        "active": True,
+                    },
+                    touch(
+                        {
+                            "$setOnInsert": {
+                                "expiration": sanction.get("expiration"),
+                                "moderator": None,
+                                "created_at": datetime.utcnow(),
+                            }
+                        }
+                    ),
+                    upsert=True,
+                )
+                migrated += 1
+        await users.update_one(
+            {"_id": user["_id"]}, touch({"$unset": {"mutes": "", "bans": ""}})
+        )
+
+    await db.meta.update_one(
+        {"_id": "sanctions"}, {"$set": {"migrated": True}}, upsert=True
+    )
+    print(f"[DB]: Migrated {migrated} mutes and bans to sanctions")
+    return migrated
+
+
+async def migrate_guilds() -> int:
+    """Scopes documents from before the bot supported several servers to the
+    server in `utils.data`, and stores that server's config in `guilds`.
+
+    Returns:
+        int: The number of clubs migrated.
+    """
+    state = await db.meta.find_one({"_id": "guilds"})
+    if state and state.get("migrated"):
+        return 0
+
+    config = guilds.default_config()
+    guild_id = config.pop("_id")
+    await db.guilds.update_one(
+        {"_id": guild_id}, touch({"$setOnInsert": config}), upsert=True
+    )
+    result = await clubs.update_many(
+        {"guild": {"$exists": False}}, touch({"$set": {"guild": GUILD_ID}})
+    )
+    await users.update_many(
+        {"owns_club": True},
+        touch({"$set": {"owns_club_in": [GUILD_ID]}, "$unset": {"owns_club": ""}}),
+    )
+    await users.update_many(
+        {"owns_club": {"$exists": True}}, touch({"$unset": {"owns_club": ""}})
+    )
+
+    await db.meta.update_one(
+        {"_id": "guilds"}, {"$set": {"migrated": True}}, upsert=True
+    )
+    print(f"[DB]: Scoped {result.modified_count} clubs to guild {GUILD_ID}")
+    return result.modified_count
+
+
+def _dotted(fields: dict, prefix: str = "") -> dict:
+    """Flattens nested dicts into dotted keys, e.g. {"roles.MODS": ...}"""
+    flat = {}
+    for key, value in fields.items():
+        if isinstance(value, dict):
+            flat.update(_dotted(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+async def configure_guild(guild_id: int, **config) -> dict:
+    """Sets a guild's config, returning all of it. Nested settings are set
+    key by key, so e.g. roles that aren't given are kept."""
+    document = await db.guilds.find_one_and_update(
+        {"_id": guild_id},
+        touch({"$set": _dotted(config)}),
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    guilds.configs[guild_id] = document
+    return document
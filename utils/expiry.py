@@ -0,0 +1,110 @@
+import asyncio
+import heapq
+
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from bson import ObjectId
+
+# Seconds before a batch whose handler failed is retried, doubling with each
+# failure in a row
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 300
+
+
+class Expiry(NamedTuple):
+    expiration: datetime  # naive UTC, as stored by MongoDB
+    kind: str  # "mute" or "ban"
+    user_id: int
+    club_id: ObjectId
+
+
+class ExpiryScheduler:
+    """Fires mute and ban expirations in batches as they fall due.
+
+    Pending expirations are kept in a min-heap, so the runner sleeps until
+    the earliest one instead of polling. Cancelling or rescheduling doesn't
+    touch the heap; stale entries are skipped when they're popped. A batch
+    whose handler fails is scheduled again after a backoff.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._scheduled = {}  # (kind, user_id, club_id) -> expiration
+        # Keys of the batch being handled, cancelling one drops it from retries
+        self._running = set()
+        self._failures = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def schedule(self, kind, user_id, club_id, expiration):
+        self._running.discard((kind, user_id, club_id))
+        self._scheduled[(kind, user_id, club_id)] = expiration
+        heapq.heappush(self._heap, Expiry(expiration, kind, user_id, club_id))
+        if self._heap[0].expiration == expiration:
+            # The runner may be sleeping until a later expiration
+            self._wakeup.set()
+
+    def cancel(self, kind, user_id, club_id):
+        self._running.discard((kind, user_id, club_id))
+        self._scheduled.pop((kind, user_id, club_id), None)
+
+    def _retry(self, due):
+        """Schedules the entries of a failed batch that are still wanted again,
+        after a delay that grows with each failure in a row"""
+        self._failures += 1
+        delay = min(RETRY_DELAY * 2 ** (self._failures - 1), MAX_RETRY_DELAY)
+        retry_at = datetime.utcnow() + timedelta(seconds=delay)
+        for entry in due:
+            if (entry.kind, entry.user_id, entry.club_id) in self._running:
+                self.schedule(entry.kind, entry.user_id, entry.club_id, retry_at)
+        return delay
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0].expiration <= now:
+            entry = heapq.heappop(self._heap)
+            key = (entry.kind, entry.user_id, entry.club_id)
+            if self._scheduled.get(key) == entry.expiration:
+                del self._scheduled[key]
+                due.append(entry)
+        return due
+
+    async def run(self, handler):
+        """Calls `handler` with every batch of expirations that fall due"""
+        while True:
+            self._wakeup.clear()
+            if due := self._pop_due(datetime.utcnow()):
+                self._running = {(e.kind, e.user_id, e.club_id) for e in due}
+                try:
+                    await handler(due)
+                except Exception as e:
+                    delay = self._retry(due)
+                    print(
+                        f"[EXPIRY]: Failed to process {len(due)} expirations, "
+                        f"retrying in {delay}s: {e}"
+                    )
+                else:
+                    self._failures = 0
+                self._running = set()
+                continue
+
+            timeout = (
+                (self._heap[0].expiration - datetime.utcnow()).total_seconds()
+                if self._heap
+                else None
+            )
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, handler):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(handler))
+
+
+expiries = ExpiryScheduler()
@@ -0,0 +1,63 @@
+import os
+
+import discord
+
+from utils.data import CHANNELS, CLUBS_CATEGORY, GUILD_ID, ROLES
+
+# Guild id -> its config document from the `guilds` collection, loaded by
+# `utils.sync` and kept up to date with the other caches
+configs = {}
+
+
+def default_config() -> dict:
+    """The config of the server the bot ran in before it supported several,
+    taken from `utils.data`"""
+    config = {
+        "_id": GUILD_ID,
+        "channels": dict(CHANNELS),
+        "roles": dict(ROLES),
+        "category": CLUBS_CATEGORY,
+    }
+    if url := os.environ.get("LOGS_WEBHOOK_URL"):
+        config["logs_webhook"] = url
+    return config
+
+
+def get(guild_id: int) -> dict | None:
+    return configs.get(guild_id)
+
+
+def role(guild: discord.Guild, name: str) -> discord.Role | None:
+    """The guild's role configured as `name`, e.g. "MODS" or "MUTE" """
+    if config := configs.get(guild.id):
+        return guild.get_role(config["roles"].get(name) or 0)
+    return None
+
+
+def channel(guild: discord.Guild, name: str):
+    """The guild's channel configured as `name`, "MODS" or "LOGS" """
+    if config := configs.get(guild.id):
+        return guild.get_channel(config["channels"].get(name) or 0)
+    return None
+
+
+def category(guild: discord.Guild):
+    """The category new club channels are created in"""
+    if config := configs.get(guild.id):
+        return guild.get_channel(config.get("category") or 0)
+    return None
+
+
+def is_mod(guild: discord.Guild, member) -> bool:
+    mods = role(guild, "MODS")
+    return mods is not None and mods in member.roles
+
+
+def is_club_admin(guild: discord.Guild, member) -> bool:
+    admins = role(guild, "CADMIN")
+    return admins is not None and admins in member.roles
+
+
+def local(client: discord.Client) -> list[discord.Guild]:
+    """The configured guilds on this process's shards"""
+    return [guild for guild in client.guilds if guild.id in configs]
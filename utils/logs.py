@@ -0,0 +1,123 @@
+import asyncio
+
+import discord
+
+from utils import guilds
+
+# Discord's limits on the embeds in a single message
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+
+
+class LogSink:
+    """Queues log embeds and posts them to each guild's logs channel in batches.
+
+    `send` never blocks the caller, embeds are coalesced into messages of up
+    to 10 and flushed when a message is full or `flush_interval` seconds
+    after the first embed was queued. Every guild has its own queue and
+    worker, their channels are rate limited separately. A guild whose config
+    has a `logs_webhook` gets its logs through that webhook instead of the
+    bot, which has its own rate limit.
+    """
+
+    def __init__(self, max_queue=1000, flush_interval=1.0, max_retries=3):
+        self._max_queue = max_queue
+        self._flush_interval = flush_interval
+        self._max_retries = max_retries
+        self._client = None
+        self._queues = {}  # guild id -> asyncio.Queue
+        self._tasks = {}  # guild id -> worker
+        self._held = {}  # guild id -> embed that didn't fit in the last batch
+        self._webhooks = {}  # url -> discord.Webhook
+
+        self.sent = 0
+        self.dropped = 0
+        self.retried = 0
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues.values()) + len(self._held)
+
+    def send(self, embed: discord.Embed, guild_id: int) -> None:
+        if guild_id not in self._queues:
+            self._queues[guild_id] = asyncio.Queue(maxsize=self._max_queue)
+        try:
+            self._queues[guild_id].put_nowait(embed)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"[LOGS]: Queue full, dropped {embed.title!r}")
+        if self._client is not None:
+            self._start(guild_id)
+
+    async def _next_batch(self, guild_id: int) -> list[discord.Embed]:
+        queue = self._queues[guild_id]
+        if held := self._held.pop(guild_id, None):
+            batch = [held]
+        else:
+            batch = [await queue.get()]
+        size = len(batch[0])
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._flush_interval
+        while len(batch) < MAX_EMBEDS:
+            try:
+                embed = await asyncio.wait_for(
+                    queue.get(), max(deadline - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                break
+            if size + len(embed) > MAX_EMBED_CHARS:
+                self._held[guild_id] = embed
+                break
+            batch.append(embed)
+            size += len(embed)
+        return batch
+
+    async def _post(self, guild_id: int, batch: list[discord.Embed]) -> None:
+        config = guilds.get(guild_id) or {}
+        if url := config.get("logs_webhook"):
+            if url not in self._webhooks:
+                self._webhooks[url] = discord.Webhook.from_url(url, client=self._client)
+            await self._webhooks[url].send(embeds=batch)
+            return
+        channel = self._client.get_channel(config.get("channels", {}).get("LOGS") or 0)
+        if not isinstance(channel, discord.TextChannel):
+            raise RuntimeError(f"Logs channel of guild {guild_id} not found")
+        await channel.send(embeds=batch)
+
+    async def run(self, guild_id: int) -> None:
+        while True:
+            batch = await self._next_batch(guild_id)
+            for attempt in range(self._max_retries + 1):
+                try:
+                    await self._post(guild_id, batch)
+                    self.sent += len(batch)
+                    break
+                except discord.HTTPException as e:
+                    # Client errors (bad embed, missing access) won't succeed on retry
+                    if e.status < 500 and e.status != 429:
+                        print(f"[LOGS]: Failed to send {len(batch)} logs: {e}")
+                        self.dropped += len(batch)
+                        break
+                except (discord.DiscordException, RuntimeError) as e:
+                    print(f"[LOGS]: Failed to send {len(batch)} logs: {e}")
+
+                if attempt == self._max_retries:
+                    self.dropped += len(batch)
+                else:
+                    self.retried += 1
+                    await asyncio.sleep(2**attempt)
+
+    def _start(self, guild_id: int) -> None:
+        task = self._tasks.get(guild_id)
+        if task is None or task.done():
+            self._tasks[guild_id] = asyncio.create_task(self.run(guild_id))
+
+    def start(self, client: discord.Client) -> None:
+        self._client = client
+        # Logs may have been queued before the client was ready
+        for guild_id in self._queues:
+            self._start(guild_id)
+
+
+log_sink = LogSink()
@@ -0,0 +1,382 @@
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+
+from utils.actions import actions
+from utils.cache import cache, club_cache
+from utils.logs import log_sink
+from utils.models import Club, UserRecord
+
+# Off unless a port is given, the endpoint is meant to be scraped privately
+METRICS_PORT = os.environ.get("METRICS_PORT")
+METRICS_HOST = os.environ.get("METRICS_HOST", "0.0.0.0")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOOP_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+# Documents measured per registry to estimate the cache's memory footprint
+FOOTPRINT_SAMPLE = 100
+
+_metrics = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format(value) -> str:
+    # repr keeps full precision, large counters would be rounded by :g
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """A metric in the Prometheus text format, keyed by its label values.
+
+    Safe to update from other threads, pymongo calls its listeners from its
+    own.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def samples(self):
+        """Yields (suffix, label values, extra labels, value) to render"""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", key, (), value
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, key, extra, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{_labels(self.labels, key, extra)} {_format(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, description, labels=(), function=None):
+        super().__init__(name, description, labels)
+        # Called on every scrape, returns a value or {label values: value}
+        self._function = function
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self._function is None:
+            yield from super().samples()
+            return
+        values = self._function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            yield "", key, (), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(c), t, n)) for key, (c, t, n) in self._values.items()]
+        for key, (counts, total, n) in items:
+            for bound, count in zip(self.buckets, counts):
+                yield "_bucket", key, (("le", f"{bound:g}"),), count
+            yield "_bucket", key, (("le", "+Inf"),), n
+            yield "_sum", key, (), total
+            yield "_count", key, (), n
+
+
+def _deep_size(value, depth=0) -> int:
+    size = sys.getsizeof(value)
+    if depth < 4:
+        if isinstance(value, dict):
+            size += sum(
+                _deep_size(k, depth + 1) + _deep_size(v, depth + 1)
+                for k, v in value.items()
+            )
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            size += sum(_deep_size(item, depth + 1) for item in value)
+        elif isinstance(value, (Club, UserRecord)):
+            size += sum(
+                _deep_size(getattr(value, name), depth + 1) for name in value.__slots__
+            )
+    return size
+
+
+def _footprint() -> dict:
+    """Estimates the cached clubs' and users' size from a sample, measuring
+    every one on each scrape would stall the event loop on a large cache"""
+    sizes = {}
+    for name in ("clubs", "users"):
+        registry = cache[name]
+        sample = [doc for doc, _ in zip(registry, range(FOOTPRINT_SAMPLE))]
+        average = sum(map(_deep_size, sample)) / len(sample) if sample else 0
+        sizes[(name,)] = average * len(registry)
+    return sizes
+
+
+command_duration = Histogram(
+    "clubbot_command_duration_seconds",
+    "Time taken to run an application command",
+    ["command"],
+)
+autocomplete_duration = Histogram(
+    "clubbot_autocomplete_duration_seconds",
+    "Time taken to compute autocomplete choices",
+    ["autocomplete"],
+)
+command_errors = Counter(
+    "clubbot_command_errors_total",
+    "Application commands that raised, by exception type",
+    ["command", "error"],
+)
+loop_duration = Histogram(
+    "clubbot_loop_duration_seconds",
+    "Time taken by an iteration of a background loop",
+    ["loop"],
+    LOOP_BUCKETS,
+)
+loop_overruns = Counter(
+    "clubbot_loop_overruns_total",
+    "Background loop iterations that took longer than the loop's interval",
+    ["loop"],
+)
+mongo_commands = Counter(
+    "clubbot_mongo_commands_total",
+    "MongoDB commands sent, by command and collection",
+    ["command", "collection"],
+)
+mongo_failures = Counter(
+    "clubbot_mongo_failures_total",
+    "MongoDB commands that failed",
+    ["command"],
+)
+mongo_duration = Histogram(
+    "clubbot_mongo_duration_seconds",
+    "Round trip time of MongoDB commands",
+    ["command"],
+)
+Gauge(
+    "clubbot_cache_entries",
+    "Documents in the in-memory cache",
+    ["registry"],
+    lambda: {
+        **{(name,): len(cache[name]) for name in ("clubs", "users")},
+        ("club_cache",): len(club_cache),
+    },
+)
+Gauge(
+    "clubbot_cache_age_seconds",
+    "Time since the cache was last fully reloaded",
+    function=lambda: (datetime.now(timezone.utc) - cache["timestamp"]).total_seconds(),
+)
+Gauge(
+    "clubbot_cache_bytes",
+    "Estimated memory used by the cached clubs and users",
+    ["registry"],
+    _footprint,
+)
+Gauge(
+    "clubbot_cache_lookups",
+    "Cache lookups by key and result, the registries' restart on every full reload",
+    ["registry", "result"],
+    lambda: {
+        (name, result): getattr(registry, attr)
+        for name, registry in (
+            ("clubs", cache["clubs"]),
+            ("users", cache["users"]),
+            ("club_cache", club_cache),
+        )
+        for result, attr in (("hit", "hits"), ("miss", "misses"))
+    },
+)
+Gauge(
+    "clubbot_user_cache_evictions",
+    "Users dropped from the user cache to stay within USER_CACHE_SIZE",
+    function=lambda: cache["users"].evictions,
+)
+Gauge(
+    "clubbot_actions_queued",
+    "Outbound Discord actions waiting in the action queue",
+    function=lambda: actions.depth,
+)
+Gauge(
+    "clubbot_logs_queued",
+    "Log embeds waiting to be sent",
+    function=lambda: log_sink.depth,
+)
+
+
+class MongoListener(monitoring.CommandListener):
+    """Counts the commands sent to MongoDB, pass it in `event_listeners`"""
+
+    def started(self, event):
+        # The collection is the value of the command's first field, e.g.
+        # {"find": "clubs", ...}
+        collection = next(iter(event.command.values()), "")
+        if not isinstance(collection, str):
+            collection = ""
+        mongo_commands.inc(command=event.command_name, collection=collection)
+
+    def succeeded(self, event):
+        mongo_duration.observe(
+            event.duration_micros / 1_000_000, command=event.command_name
+        )
+
+    def failed(self, event):
+        mongo_failures.inc(command=event.command_name)
+        mongo_duration.observe(
+            event.duration_micros / 1_000_000, command=event.command_name
+        )
+
+
+def track_autocomplete(callback):
+    """Records how long an autocomplete callback takes"""
+
+    @functools.wraps(callback)
+    async def wrapper(interaction, current):
+        with autocomplete_duration.time(autocomplete=callback.__name__):
+            return await callback(interaction, current)
+
+    return wrapper
+
+
+def track_loop(name: str, interval: float | None = None):
+    """Records the duration of each run of a background loop, and whether it
+    overran `interval` seconds"""
+
+    def decorator(callback):
+        @functools.wraps(callback)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                loop_duration.observe(duration, loop=name)
+                if interval is not None and duration > interval:
+                    loop_overruns.inc(loop=name)
+
+        return wrapper
+
+    return decorator
+
+
+def command_started(interaction) -> None:
+    interaction.extras["started"] = time.perf_counter()
+
+
+def command_finished(interaction, command_name: str, error=None) -> None:
+    if started := interaction.extras.get("started"):
+        command_duration.observe(time.perf_counter() - started, command=command_name)
+    if error is not None:
+        # Report what the command raised, not discord.py's wrapper around it
+        error = getattr(error, "original", error)
+        command_errors.inc(command=command_name, error=type(error).__name__)
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _metrics) + "\n"
+
+
+async def _handle(reader, writer) -> None:
+    try:
+        request = await reader.readline()
+        # Skip the headers, nothing in them matters here
+        while await reader.readline() not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.decode("latin-1").split()
+        if (
+            len(parts) >= 2
+            and parts[0] == "GET"
+            and parts[1].split("?")[0] == "/metrics"
+        ):
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, UnicodeDecodeError) as e:
+        print(f"[METRICS]: Failed to serve a scrape: {e}")
+    finally:
+        writer.close()
+
+
+_server = None
+
+
+async def start() -> None:
+    """Serves /metrics on METRICS_PORT, if it's set"""
+    global _server
+    if not METRICS_PORT or _server is not None:
+        return
+    _server = await asyncio.start_server(_handle, METRICS_HOST, int(METRICS_PORT))
+    print(f"[METRICS]: Serving metrics on {METRICS_HOST}:{METRICS_PORT}/metrics")
@@ -0,0 +1,187 @@
+import asyncio
+import csv
+import itertools
+
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple
+
+import discord
+
+from pymongo import UpdateOne
+
+from utils.actions import BACKGROUND, actions
+from utils.db import db, touch
+
+CLUBS_CSV = Path(__file__).parent.parent / "clubs.csv"
+BATCH_SIZE = 200  # clubs per bulk write and checkpoint
+WRITE_SIZE = 1000  # user updates per bulk write
+
+_lock = asyncio.Lock()
+
+
+class ImportResult(NamedTuple):
+    clubs: int  # rows imported by this run
+    skipped: int  # rows without an owner, or whose channel or role is gone
+    memberships: int  # users added to a club
+    roles: int  # roles assigned to members who were missing them
+    resumed_from: int  # rows already imported by an earlier run
+
+
+def read_rows(path: Path, start: int = 0):
+    """Yields (row number, name, owner, channel, role) from a v2 export,
+    starting after the first `start` rows"""
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        next(reader, None)  # header
+        for number, row in enumerate(reader, 1):
+            if number <= start or not row:
+                continue
+            name, owner, channel, role = (value.strip() for value in row[:4])
+            # Some v2 clubs were left without an owner
+            yield number, name, int(owner) if owner else None, int(channel), int(role)
+
+
+async def _bulk(collection, operations) -> int:
+    """Writes `operations` in chunks, returning how many documents changed"""
+    changed = 0
+    for i in range(0, len(operations), WRITE_SIZE):
+        result = await collection.bulk_write(
+            operations[i : i + WRITE_SIZE], ordered=False
+        )
+        changed += result.modified_count + result.upserted_count
+    return changed
+
+
+async def _import_batch(guild: discord.Guild, rows) -> tuple[int, int, int, int]:
+    now = datetime.utcnow()
+    present = []
+    for _, name, owner, channel, role in rows:
+        if owner is None:
+            print(f"[MIGRATE]: Skipping {name}, it has no owner")
+        elif not guild.get_channel(channel) or not guild.get_role(role):
+            print(f"[MIGRATE]: Skipping {name}, its channel or role is gone")
+        else:
+            present.append((name, owner, channel, role))
+    if not present:
+        return 0, len(rows), 0, 0
+
+    # Channels are unique, so they key the upsert and reruns are idempotent
+    await db.clubs.bulk_write(
+        [
+            UpdateOne(
+                {"channel": channel},
+                touch(
+                    {
+                        "$set": {
+                            "guild": guild.id,
+                            "name": name,
+                            "owner": owner,
+                            "role": role,
+                            "verified": True,
+                        },
+                        "$setOnInsert": {
+                            "topic": "",
+                            "mods": [],
+                            "mod_perms": [],
+                            "bubble": None,
+                            "created_at": now,
+                        },
+                    }
+                ),
+                upsert=True,
+            )
+            for name, owner, channel, role in present
+        ],
+        ordered=False,
+    )
+    ids = {
+        club["channel"]: club["_id"]
+        async for club in db.clubs.find(
+            {"channel": {"$in": [channel for _, _, channel, _ in present]}},
+            projection={"channel": 1},
+        )
+    }
+
+    club_roles = {ids[channel]: guild.get_role(role) for _, _, channel, role in present}
+    # Memberships already in the database, from a v3 join or an earlier run
+    joined = {club_id: set() for club_id in club_roles}
+    async for user in db.users.find(
+        {"clubs": {"$in": list(club_roles)}}, projection={"clubs": 1}
+    ):
+        for club_id in joined.keys() & set(user["clubs"]):
+            joined[club_id].add(user["_id"])
+
+    operations, missing, memberships = [], [], 0
+    for _, owner, channel, _ in present:
+        club_id = ids[channel]
+        role = club_roles[club_id]
+        holders = {member.id for member in role.members}
+        new = (holders | {owner}) - joined[club_id]
+        memberships += len(new)
+        operations.extend(
+            UpdateOne(
+                {"_id": user_id},
+                touch({"$addToSet": {"clubs": club_id}}),
+                upsert=True,
+            )
+            for user_id in new - {owner}
+        )
+        operations.append(
+            UpdateOne(
+                {"_id": owner},
+                touch({"$addToSet": {"clubs": club_id, "owns_club_in": guild.id}}),
+                upsert=True,
+            )
+        )
+        # The owner, and anyone who joined in the database, needs the role too
+        for user_id in (joined[club_id] | {owner}) - holders:
+            if member := guild.get_member(user_id):
+                missing.append((member, role))
+
+    await _bulk(db.users, operations)
+    # Wait for this batch's roles so the checkpoint covers them, and so the
+    # queue never holds more than one batch
+    results = await asyncio.gather(
+        *(
+            actions.add_roles(
+                member, role, priority=BACKGROUND, reason="Club migration"
+            )
+            for member, role in missing
+        ),
+        return_exceptions=True,
+    )
+    assigned = sum(not isinstance(result, Exception) for result in results)
+    return len(present), len(rows) - len(present), memberships, assigned
+
+
+async def import_clubs(
+    guild: discord.Guild, path: Path = CLUBS_CSV, restart: bool = False
+) -> ImportResult:
+    """Imports clubs from a Club Bot v2 export, resuming an interrupted run.
+
+    Args:
+        guild (discord.Guild): The guild the clubs' channels and roles are in.
+        path (Path): The CSV export, with name, owner, channel and role ids.
+        restart (bool): Import every row again instead of resuming.
+
+    Returns:
+        ImportResult: What this run imported.
+    """
+    async with _lock:
+        state = await db.meta.find_one({"_id": "migration"}) or {}
+        start = 0 if restart or state.get("path") != str(path) else state.get("rows", 0)
+        totals = [0, 0, 0, 0]
+
+        rows = read_rows(path, start)
+        while batch := list(itertools.islice(rows, BATCH_SIZE)):
+            counts = await _import_batch(guild, batch)
+            totals = [total + count for total, count in zip(totals, counts)]
+            await db.meta.update_one(
+                {"_id": "migration"},
+                {"$set": {"path": str(path), "rows": batch[-1][0]}},
+                upsert=True,
+            )
+            print(f"[MIGRATE]: Imported {batch[-1][0]} rows of {path.name}")
+
+        return ImportResult(*totals, resumed_from=start)
@@ -0,0 +1,161 @@
+import sys
+
+from bson import ObjectId
+
+from utils.permissions import ClubPermission, table
+
+# Club id -> the one instance of it the caches share. Every user document
+# holds its own copies of the ids of the clubs it's in, so without this the
+# same 12 bytes are kept once per member. ObjectIds can't be weakly
+# referenced, so ids are released when their club leaves the registry.
+_ids = {}
+
+
+def intern_id(club_id) -> ObjectId:
+    """The shared instance of a club id, which may be given as a str"""
+    if isinstance(club_id, str):
+        club_id = ObjectId(club_id)
+    return _ids.setdefault(club_id, club_id)
+
+
+def as_id(club_id) -> ObjectId:
+    """A club id as an ObjectId, shared if it's interned. Unlike `intern_id`
+    this doesn't intern ids that are only looked up."""
+    if isinstance(club_id, str):
+        club_id = ObjectId(club_id)
+    return _ids.get(club_id, club_id)
+
+
+def release_id(club_id):
+    """Stops sharing the id of a club that was deleted"""
+    _ids.pop(club_id, None)
+
+
+def retain_ids(club_ids):
+    """Releases every id but `club_ids`, after a full reload"""
+    kept = {club_id: _ids.get(club_id, club_id) for club_id in club_ids}
+    _ids.clear()
+    _ids.update(kept)
+
+
+def _interned(values) -> frozenset:
+    return frozenset(map(intern_id, values))
+
+
+class Club:
+    """A cached club. Built from its document with `Club.from_document` and
+    never changed in place, writes cache a new one instead."""
+
+    __slots__ = (
+        "id",
+        "guild",
+        "name",
+        "topic",
+        "owner",
+        "role",
+        "channel",
+        "verified",
+        "mods",
+        "mod_perms",
+        "bubble",
+        "permissions",
+    )
+
+    def __init__(
+        self,
+        id: ObjectId,
+        guild: int | None,
+        name: str,
+        owner: int,
+        topic: str = "",
+        role: int | None = None,
+        channel: int | None = None,
+        verified: bool = False,
+        mods: tuple[int, ...] = (),
+        mod_perms: frozenset[str] = frozenset(),
+        bubble: int | None = None,
+        permissions: dict[int, ClubPermission] | None = None,
+    ):
+        self.id = id
+        self.guild = guild
+        self.name = name
+        self.topic = topic
+        self.owner = owner
+        self.role = role
+        self.channel = channel
+        self.verified = verified
+        self.mods = mods
+        self.mod_perms = mod_perms
+        self.bubble = bubble
+        # Computed once per change to the mods, moderation checks are a lookup
+        if permissions is None:
+            permissions = table(owner, mods, mod_perms)
+        self.permissions = permissions
+
+    @classmethod
+    def from_document(cls, document) -> "Club":
+        return cls(
+            intern_id(document["_id"]),
+            document.get("guild"),
+            document["name"],
+            document["owner"],
+            document.get("topic") or "",
+            document.get("role"),
+            document.get("channel"),
+            bool(document.get("verified")),
+            tuple(document.get("mods") or ()),
+            # Only a handful of distinct permissions, share the strings
+            frozenset(map(sys.intern, document.get("mod_perms") or ())),
+            document.get("bubble"),
+        )
+
+    def replace(self, **changes) -> "Club":
+        """A copy of the club with `changes` applied, for caching after a write"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        if not changes.keys().isdisjoint(("owner", "mods", "mod_perms")):
+            del fields["permissions"]
+        return Club(**{**fields, **changes})
+
+    def permissions_of(self, user_id: int) -> ClubPermission:
+        """What a user may do in the club, as its owner or one of its mods"""
+        return self.permissions.get(user_id, ClubPermission.NONE)
+
+    def __repr__(self):
+        return f"Club(id={self.id!r}, name={self.name!r}, guild={self.guild!r})"
+
+
+class UserRecord:
+    """A cached user: the clubs they're in, the guilds they own a club in, and
+    the clubs they're banned or muted in"""
+
+    __slots__ = ("id", "clubs", "owns_club_in", "bans", "mutes")
+
+    def __init__(
+        self,
+        id: int,
+        clubs: frozenset = frozenset(),
+        owns_club_in: frozenset = frozenset(),
+        bans: frozenset = frozenset(),
+        mutes: frozenset = frozenset(),
+    ):
+        self.id = id
+        self.clubs = clubs
+        self.owns_club_in = owns_club_in
+        self.bans = bans
+        self.mutes = mutes
+
+    @classmethod
+    def from_document(cls, user_id: int, document, sanctions=()) -> "UserRecord":
+        """Builds a user from their document, None if they have none, and
+        their active sanctions"""
+        document = document or {}
+        return cls(
+            user_id,
+            _interned(document.get("clubs", ())),
+            frozenset(document.get("owns_club_in", ())),
+            _interned(s["club"] for s in sanctions if s["kind"] == "ban"),
+            _interned(s["club"] for s in sanctions if s["kind"] == "mute"),
+        )
+
+    def __repr__(self):
+        return f"UserRecord(id={self.id!r}, clubs={len(self.clubs)})"
@@ -0,0 +1,68 @@
+from enum import IntFlag
+
+import discord
+
+from utils import guilds
+
+
+class ClubPermission(IntFlag):
+    """What a member may do in a club, see `Club.permissions_of` and `resolve`"""
+
+    NONE = 0
+    DELETE = 1
+    PIN = 2
+    MUTE = 4
+    BAN = 8
+    # Club mods and the owner can't be muted or banned in the club
+    MODERATOR = 16
+    OWNER = 32
+    # Server mods can't be muted or banned in any club
+    SERVER_MOD = 64
+    # Club admins can moderate every club and can't be moderated themselves
+    CLUB_ADMIN = 128
+
+
+# The permissions an owner can give their mods, by name in `mod_perms`
+MOD_PERMS = {
+    "delete": ClubPermission.DELETE,
+    "pin": ClubPermission.PIN,
+    "mute": ClubPermission.MUTE,
+    "ban": ClubPermission.BAN,
+}
+OWNER_PERMS = (
+    ClubPermission.DELETE
+    | ClubPermission.PIN
+    | ClubPermission.MUTE
+    | ClubPermission.BAN
+    | ClubPermission.MODERATOR
+    | ClubPermission.OWNER
+)
+# Everything an owner can do except manage the club itself, which stays with
+# its owner
+CLUB_ADMIN_PERMS = (OWNER_PERMS & ~ClubPermission.OWNER) | ClubPermission.CLUB_ADMIN
+# Members other moderators can't act against
+PROTECTED = (
+    ClubPermission.MODERATOR | ClubPermission.SERVER_MOD | ClubPermission.CLUB_ADMIN
+)
+
+
+def table(owner: int, mods, mod_perms) -> dict[int, ClubPermission]:
+    """Each of a club's moderators' permissions, keyed by user id. Everyone
+    else has none."""
+    granted = ClubPermission.MODERATOR
+    for name in mod_perms:
+        granted |= MOD_PERMS.get(name, ClubPermission.NONE)
+    permissions = dict.fromkeys(mods, granted)
+    permissions[owner] = OWNER_PERMS
+    return permissions
+
+
+def resolve(club, member: discord.Member) -> ClubPermission:
+    """A member's permissions in a club, including the ones that come from
+    their server roles"""
+    permissions = club.permissions_of(member.id)
+    if guilds.is_mod(member.guild, member):
+        permissions |= ClubPermission.SERVER_MOD
+    if guilds.is_club_admin(member.guild, member):
+        permissions |= CLUB_ADMIN_PERMS
+    return permissions
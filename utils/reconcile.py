@@ -0,0 +1,282 @@
+import asyncio
+import os
+
+from typing import Awaitable, Callable, NamedTuple
+
+import discord
+
+from bson import ObjectId
+
+from utils import guilds
+from utils.actions import BACKGROUND, actions
+from utils.cache import cache
+from utils.db import db, edit_club, load_user, load_users
+from utils.models import Club
+
+SLICE_SIZE = 50  # clubs checked per cycle
+BATCH_SIZE = 20  # repairs in flight at once
+# Set RECONCILE_DRY_RUN to only log the repairs that would be made
+DRY_RUN = bool(os.environ.get("RECONCILE_DRY_RUN"))
+
+# Guild id -> _id of the last club checked, the next cycle starts after it
+_cursors = {}
+
+
+class Repair(NamedTuple):
+    club_id: ObjectId
+    kind: str  # e.g. "add_role"
+    detail: str
+    run: Callable[[], Awaitable]
+    # Rate limit bucket of the Discord call, None for database-only fixes
+    bucket: tuple | None
+    # The member whose club roles are fixed, loaded with the rest of the batch
+    user_id: int | None = None
+
+
+def _rebuild(
+    guild: discord.Guild, club: Club, role, channel, members: set[int]
+) -> Callable[[], Awaitable]:
+    """Recreates whichever of a club's role and channel are gone, like
+    `utils.db.verify_club` does for a new club. A new role is given to the
+    club's `members` straight away rather than on a later pass."""
+
+    async def run():
+        nonlocal role, channel
+        if role is None:
+            role = await guild.create_role(
+                name=f"{club.name} Member", reason="Club role was deleted"
+            )
+            if channel is not None:
+                await channel.set_permissions(
+                    role,
+                    overwrite=discord.PermissionOverwrite(
+                        send_messages=True, view_channel=True
+                    ),
+                    reason="Club role was deleted",
+                )
+            for user_id in members:
+                if member := guild.get_member(user_id):
+                    # Not awaited, the roles bucket may be waiting on this one
+                    actions.add_roles(
+                        member,
+                        role,
+                        priority=BACKGROUND,
+                        reason="Club role was deleted",
+                    )
+        if channel is None:
+            overwrites = {
+                role: discord.PermissionOverwrite(
+                    send_messages=True, view_channel=True
+                ),
+                guild.default_role: discord.PermissionOverwrite(
+                    send_messages=False, view_channel=False
+                ),
+            }
+            if mute := guilds.role(guild, "MUTE"):
+                overwrites[mute] = discord.PermissionOverwrite(
+                    send_messages=False, send_messages_in_threads=False
+                )
+            if owner := guild.get_member(club.owner):
+                overwrites[owner] = discord.PermissionOverwrite(
+                    manage_messages=True, manage_webhooks=True
+                )
+            channel = await guild.create_text_channel(
+                name=club.name,
+                category=guilds.category(guild),
+                topic=club.topic,
+                overwrites=overwrites,
+                reason="Club channel was deleted",
+            )
+        await edit_club(club.id, role=role.id, channel=channel.id)
+
+    return run
+
+
+def _overwrite(channel, target, **permissions) -> Callable[[], Awaitable]:
+    async def run():
+        # Read at run time so other changes to the overwrite aren't lost
+        overwrite = channel.overwrites_for(target)
+        overwrite.update(**permissions)
+        await channel.set_permissions(
+            target, overwrite=overwrite, reason="Reconciled club permissions"
+        )
+
+    return run
+
+
+def _membership(member, role, club_id, add: bool) -> Callable[[], Awaitable]:
+    async def run():
+        # The member may have joined or left since the plan was made, the
+        # cache is updated as soon as they do. `apply` loads the batch's
+        # members up front, this only reads if they've been evicted since.
+        await load_user(member.id)
+        if (club_id in cache["users"].clubs(member.id)) != add:
+            return
+        if add:
+            await member.add_roles(role, reason="Reconciled club membership")
+        else:
+            await member.remove_roles(role, reason="Reconciled club membership")
+
+    return run
+
+
+def plan_club(guild: discord.Guild, club: Club, joined: set[int]) -> list[Repair]:
+    """Diffs one club's document against the guild.
+
+    Args:
+        guild (discord.Guild): The guild, as cached by discord.py.
+        club (Club): The club, as stored in the database.
+        joined (set[int]): The users whose documents list the club.
+
+    Returns:
+        list[Repair]: What to change to bring the guild and database in line.
+    """
+    club_id = club.id
+    role = guild.get_role(club.role or 0)
+    channel = guild.get_channel(club.channel or 0)
+    if not isinstance(channel, discord.TextChannel):
+        channel = None
+    if role is None or channel is None:
+        # Anything else can wait until there's a role and channel to check
+        missing = " and ".join(
+            name for name, value in (("role", role), ("channel", channel)) if not value
+        )
+        return [
+            Repair(
+                club_id,
+                "rebuild",
+                f"{club.name}'s {missing} is gone",
+                _rebuild(guild, club, role, channel, joined | {club.owner}),
+                ("guild", guild.id),
+            )
+        ]
+
+    repairs = []
+    overwrite = channel.overwrites_for(role)
+    if not overwrite.send_messages or not overwrite.view_channel:
+        repairs.append(
+            Repair(
+                club_id,
+                "overwrite",
+                f"{role.name} can't talk in #{channel.name}",
+                _overwrite(channel, role, send_messages=True, view_channel=True),
+                ("channel", channel.id),
+            )
+        )
+    owner = guild.get_member(club.owner)
+    if owner and not channel.overwrites_for(owner).manage_messages:
+        repairs.append(
+            Repair(
+                club_id,
+                "overwrite",
+                f"{owner.name} can't manage #{channel.name}",
+                _overwrite(channel, owner, manage_messages=True, manage_webhooks=True),
+                ("channel", channel.id),
+            )
+        )
+
+    if not guild.chunked:
+        # Without every member cached, absent members look like they've left
+        return repairs
+
+    mods = [mod for mod in club.mods if guild.get_member(mod)]
+    if len(mods) != len(club.mods):
+        repairs.append(
+            Repair(
+                club_id,
+                "mods",
+                f"{len(club.mods) - len(mods)} of {club.name}'s mods left",
+                lambda: edit_club(club_id, mods=mods),
+                None,
+            )
+        )
+
+    # The database is the record of who's in a club, roles follow it
+    holders = {member.id for member in role.members}
+    for user_id in (joined | {club.owner}) - holders:
+        if member := guild.get_member(user_id):
+            repairs.append(
+                Repair(
+                    club_id,
+                    "add_role",
+                    f"{member.name} is missing {role.name}",
+                    _membership(member, role, club_id, True),
+                    ("roles", guild.id),
+                    member.id,
+                )
+            )
+    for user_id in holders - joined - {club.owner}:
+        member = guild.get_member(user_id)
+        if member and not member.bot:
+            repairs.append(
+                Repair(
+                    club_id,
+                    "remove_role",
+                    f"{member.name} has {role.name} without being in the club",
+                    _membership(member, role, club_id, False),
+                    ("roles", guild.id),
+                    member.id,
+                )
+            )
+    return repairs
+
+
+async def plan(guild: discord.Guild, size: int = SLICE_SIZE) -> list[Repair]:
+    """Diffs the guild's next `size` clubs, wrapping around after the last one"""
+    query = {"guild": guild.id, "verified": True}
+    if cursor := _cursors.get(guild.id):
+        query["_id"] = {"$gt": cursor}
+    documents = await db.clubs.find(query).sort("_id").limit(size).to_list(length=None)
+    clubs = [Club.from_document(document) for document in documents]
+    _cursors[guild.id] = clubs[-1].id if len(clubs) == size else None
+    if not clubs:
+        return []
+
+    joined = {club.id: set() for club in clubs}
+    async for user in db.users.find(
+        {"clubs": {"$in": list(joined)}}, projection={"clubs": 1}
+    ):
+        for club_id in joined.keys() & set(user["clubs"]):
+            joined[club_id].add(user["_id"])
+
+    return [
+        repair for club in clubs for repair in plan_club(guild, club, joined[club.id])
+    ]
+
+
+async def apply(repairs: list[Repair], batch_size: int = BATCH_SIZE) -> int:
+    """Makes the repairs `batch_size` at a time, Discord calls going through
+    the action queue. Returns how many failed."""
+    failed = 0
+    for i in range(0, len(repairs), batch_size):
+        batch = repairs[i : i + batch_size]
+        await load_users(repair.user_id for repair in batch if repair.user_id)
+        results = await asyncio.gather(
+            *(
+                (
+                    actions.submit(
+                        repair.run,
+                        repair.bucket,
+                        BACKGROUND,
+                        f"RECONCILE {repair.kind}",
+                    )
+                    if repair.bucket
+                    else repair.run()
+                )
+                for repair in batch
+            ),
+            return_exceptions=True,
+        )
+        failed += sum(isinstance(result, Exception) for result in results)
+    return failed
+
+
+async def reconcile(guild: discord.Guild, size: int = SLICE_SIZE) -> list[Repair]:
+    """Checks the next slice of clubs for drift and repairs it"""
+    repairs = await plan(guild, size)
+    for repair in repairs:
+        print(f"[RECONCILE]: {repair.kind}: {repair.detail}")
+    if repairs and not DRY_RUN:
+        failed = await apply(repairs)
+        print(f"[RECONCILE]: Made {len(repairs) - failed} of {len(repairs)} repairs")
+    return repairs
@@ -0,0 +1,175 @@
+import re
+
+from bisect import bisect_left, insort
+from collections import Counter
+
+# Discord rejects autocomplete responses with more choices than this
+MAX_CHOICES = 25
+# Shorter queries match too many trigrams for the fuzzy pass to be worth it
+MIN_FUZZY_LENGTH = 3
+# Words scored per query word in the fuzzy pass, the ones sharing the most
+# trigrams with it
+MAX_FUZZY_WORDS = 5
+# Names a search looks at before giving up on filling the limit, so a
+# predicate that rejects almost everything can't make it scan every name
+MAX_SCANNED = 500
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Ranked name search for autocomplete.
+
+    Matches are returned in this order, each group alphabetically:
+    1. Names starting with the query
+    2. Names with a later word starting with the query
+    3. Names with a word sharing at least half of the trigrams of a query
+       word (typos, infixes), most similar first
+
+    Trigrams are indexed per distinct word rather than per name, club names
+    share most of their vocabulary so this keeps rebuilds cheap. Only the
+    closest few words are scored in the fuzzy pass, and a search gives up
+    after looking at `MAX_SCANNED` names.
+    """
+
+    def __init__(self, entries=()):
+        # Ids are mapped to small ints internally, they hash and compare faster
+        self._slots = {}  # id -> slot
+        self._ids = []  # slot -> id
+        self._free = []  # slots of removed ids, reused by the next add
+        self._names = {}  # slot -> normalized name
+        self._prefixes = []  # sorted (name, slot)
+        self._words = []  # sorted (name from each later word onwards, slot)
+        self._word_slots = {}  # word -> slots
+        self._grams = {}  # trigram -> words
+
+        for item_id, name in entries:
+            self._add(item_id, name)
+        self._prefixes.sort()
+        self._words.sort()
+
+    def _add(self, item_id, name, insert=list.append):
+        if item_id in self._slots:
+            self.remove(item_id)
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = item_id
+        else:
+            slot = len(self._ids)
+            self._ids.append(item_id)
+        self._slots[item_id] = slot
+
+        name = normalize(name)
+        self._names[slot] = name
+        insert(self._prefixes, (name, slot))
+        for suffix in _word_suffixes(name):
+            insert(self._words, (suffix, slot))
+        for word in set(_WORD.findall(name)):
+            if word not in self._word_slots:
+                self._word_slots[word] = set()
+                for gram in trigrams(word):
+                    self._grams.setdefault(gram, set()).add(word)
+            self._word_slots[word].add(slot)
+
+    def add(self, item_id, name):
+        self._add(item_id, name, insort)
+
+    def remove(self, item_id):
+        slot = self._slots.pop(item_id, None)
+        if slot is None:
+            return
+        self._ids[slot] = None
+        self._free.append(slot)
+        name = self._names.pop(slot)
+        _discard(self._prefixes, (name, slot))
+        for suffix in _word_suffixes(name):
+            _discard(self._words, (suffix, slot))
+        for word in set(_WORD.findall(name)):
+            slots = self._word_slots[word]
+            slots.discard(slot)
+            if slots:
+                continue
+            del self._word_slots[word]
+            for gram in trigrams(word):
+                words = self._grams[gram]
+                words.discard(word)
+                if not words:
+                    del self._grams[gram]
+
+    def __len__(self):
+        return len(self._names)
+
+    def search(self, query: str, predicate=None, limit: int = MAX_CHOICES) -> list:
+        """Returns up to `limit` ids whose name matches `query`, best first.
+
+        `predicate` filters ids before they count towards the limit.
+        """
+        query = normalize(query)
+        results = []
+        seen = set()
+
+        def take(slot) -> bool:
+            """Whether the search is done after looking at `slot`"""
+            if slot not in seen:
+                seen.add(slot)
+                item_id = self._ids[slot]
+                if predicate is None or predicate(item_id):
+                    results.append(item_id)
+            return len(results) >= limit or len(seen) >= MAX_SCANNED
+
+        # Every name starts with an empty query, so the word pass has nothing
+        # left to add
+        for keys in (self._prefixes, self._words) if query else (self._prefixes,):
+            for i in range(bisect_left(keys, (query,)), len(keys)):
+                key, slot = keys[i]
+                if not key.startswith(query):
+                    break
+                if take(slot):
+                    return results
+
+        scores = Counter()
+        for query_word in _WORD.findall(query):
+            if len(query_word) < MIN_FUZZY_LENGTH:
+                continue
+            grams = trigrams(query_word)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._grams.get(gram, ()))
+            for word, count in shared.most_common(MAX_FUZZY_WORDS):
+                if count < len(grams) / 2:
+                    break
+                for slot in self._word_slots[word]:
+                    scores[slot] += count / len(grams)
+
+        # Few distinct scores, only the best ones' names need sorting
+        by_score = {}
+        for slot, score in scores.items():
+            by_score.setdefault(score, []).append(slot)
+        for score in sorted(by_score, reverse=True):
+            for slot in sorted(by_score[score], key=self._names.__getitem__):
+                if take(slot):
+                    return results
+        return results
+
+
+def _word_suffixes(name: str):
+    """Yields `name` starting from each word after the first"""
+    start = name.find(" ")
+    while start != -1:
+        yield name[start + 1 :]
+        start = name.find(" ", start + 1)
+
+
+def _discard(keys, key):
+    i = bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
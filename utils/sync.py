@@ -0,0 +1,196 @@
+import asyncio
+import os
+
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from utils import guilds
+from utils.cache import ClubRegistry, cache, club_cache
+from utils.db import db
+from utils.models import Club, retain_ids
+
+# "stream" uses change streams and falls back to polling if the server doesn't
+# support them (standalone mongod). "poll" skips straight to polling.
+SYNC_MODE = os.environ.get("CACHE_SYNC", "stream")
+POLL_INTERVAL = 5  # seconds
+RETRY_INTERVAL = 10  # seconds
+# `updated_at` is stamped by the writer before the write commits, so writes
+# can land out of order by this much. Polls look back over it.
+POLL_MARGIN = timedelta(minutes=1)
+
+# $changeStream is only supported on replica sets / not allowed on this server
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324, 303}
+# The resume token is older than the oplog, so changes were missed
+CHANGE_STREAM_HISTORY_LOST = {286, 280}
+
+COLLECTIONS = ("clubs", "users", "sanctions", "guilds")
+
+_buffer = None
+# Reloads share `_buffer`, so only one may run at a time
+_reload_lock = asyncio.Lock()
+_tasks = []
+_last_updated = {}  # collection -> latest updated_at loaded by `reload`
+# Server time from just before the last `reload` read its snapshot. Streams
+# opened without a resume token start here, so nothing written between the
+# snapshot and the stream opening is missed. None on standalone servers.
+_snapshot_time = None
+
+
+def apply_document(collection, document):
+    match collection:
+        case "clubs":
+            club = Club.from_document(document)
+            cache["clubs"].upsert(club)
+            club_cache.refresh(club)
+        case "users":
+            cache["users"].upsert(document)
+        case "sanctions":
+            cache["users"].apply_sanction(document)
+        case "guilds":
+            guilds.configs[document["_id"]] = document
+
+
+def apply_change(collection, change):
+    """Applies one change stream event to the cache"""
+    if _buffer is not None:
+        # A full reload is in flight, replay this once it has been swapped in
+        _buffer.append((collection, change))
+
+    match change["operationType"]:
+        case "insert" | "update" | "replace":
+            # fullDocument is None if the document was deleted before the lookup
+            if document := change.get("fullDocument"):
+                apply_document(collection, document)
+        case "delete":
+            # Sanctions are never deleted, lifted ones are kept as history
+            document_id = change["documentKey"]["_id"]
+            if collection == "clubs":
+                club = cache["clubs"].get(document_id)
+                club_cache.discard(document_id, club.channel if club else None)
+                cache["clubs"].remove(document_id)
+            elif collection == "users":
+                cache["users"].remove(document_id)
+            elif collection == "guilds":
+                guilds.configs.pop(document_id, None)
+
+
+async def reload():
+    """Reloads every club and guild config into the cache. Users are loaded
+    on demand by `utils.db.load_user`, so they're dropped to be loaded again."""
+    async with _reload_lock:
+        await _reload()
+
+
+async def _reload():
+    global _buffer, _snapshot_time
+    _buffer = []
+    try:
+        # Only replica sets report an operationTime, and only they have streams
+        snapshot_time = (await db.command("ping")).get("operationTime")
+        clubs_data = await db.clubs.find().to_list(length=None)
+        guilds_data = await db.guilds.find().to_list(length=None)
+
+        # Build the new indexes first and swap them in together, so lookups
+        # never see a half-built registry
+        clubs = ClubRegistry(map(Club.from_document, clubs_data))
+        cache.update(clubs=clubs, timestamp=datetime.now(timezone.utc))
+        retain_ids(club.id for club in clubs)
+        cache["users"].clear()
+        guilds.configs.clear()
+        guilds.configs.update((doc["_id"], doc) for doc in guilds_data)
+        # Clubs may have been deleted without us seeing it
+        club_cache.clear()
+        for collection, documents in (
+            ("clubs", clubs_data),
+            ("guilds", guilds_data),
+        ):
+            _last_updated[collection] = max(
+                (doc["updated_at"] for doc in documents if doc.get("updated_at")),
+                default=datetime.min,
+            )
+        # Nothing is cached from before now, so there's no need to poll for
+        # older changes
+        _last_updated["users"] = _last_updated["sanctions"] = datetime.utcnow()
+
+        _snapshot_time = snapshot_time
+        # The snapshot may predate changes that arrived while it was loading
+        buffered, _buffer = _buffer, None
+        for collection, change in buffered:
+            apply_change(collection, change)
+    finally:
+        _buffer = None
+
+
+async def watch(collection):
+    resume_token = None
+    while True:
+        try:
+            async with db[collection].watch(
+                full_document="updateLookup",
+                resume_after=resume_token,
+                # Without a token, replay what the last snapshot didn't see
+                start_at_operation_time=None if resume_token else _snapshot_time,
+            ) as stream:
+                print(f"[SYNC]: Watching {collection} for changes")
+                async for change in stream:
+                    apply_change(collection, change)
+                    resume_token = stream.resume_token
+
+                    if change["operationType"] in ("drop", "invalidate"):
+                        resume_token = None
+                        await reload()
+                        break
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                print(f"[SYNC]: Change streams unavailable ({e}), polling instead")
+                return await poll(collection)
+            if e.code in CHANGE_STREAM_HISTORY_LOST:
+                print(f"[SYNC]: Missed changes to {collection}, reloading cache")
+                resume_token = None
+                await reload()
+                continue
+            print(f"[SYNC]: Change stream for {collection} failed: {e}")
+            await asyncio.sleep(RETRY_INTERVAL)
+        except PyMongoError as e:
+            print(f"[SYNC]: Change stream for {collection} failed: {e}")
+            await asyncio.sleep(RETRY_INTERVAL)
+
+
+async def poll(collection):
+    """Fetches documents by `updated_at` since the last poll, looking back
+    `POLL_MARGIN` for writes that committed late.
+
+    Deletes aren't visible to the poll; our own deletes update the cache
+    directly and anything else is caught by the periodic full reload.
+    """
+    since = _last_updated.get(collection, datetime.min)
+    # _id -> updated_at of the documents applied within the margin, so the
+    # ones fetched again aren't applied again
+    recent = {}
+    while True:
+        try:
+            start = since - POLL_MARGIN if since - datetime.min > POLL_MARGIN else since
+            cursor = db[collection].find({"updated_at": {"$gte": start}})
+            async for document in cursor:
+                updated_at = document["updated_at"]
+                if recent.get(document["_id"]) != updated_at:
+                    apply_document(collection, document)
+                    recent[document["_id"]] = updated_at
+                since = max(since, updated_at)
+            recent = {
+                document_id: updated_at
+                for document_id, updated_at in recent.items()
+                if updated_at >= since - POLL_MARGIN
+            }
+        except PyMongoError as e:
+            print(f"[SYNC]: Polling {collection} failed: {e}")
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def start():
+    """Starts keeping the cache in sync, if it isn't already"""
+    if any(not task.done() for task in _tasks):
+        return
+    sync = watch if SYNC_MODE == "stream" else poll
+    _tasks[:] = [asyncio.create_task(sync(name)) for name in COLLECTIONS]
@@ -0,0 +1,251 @@
+import os
+import time
+
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import NamedTuple
+
+# Set DB_TRACE to log the database operations behind every command
+TRACING = bool(os.environ.get("DB_TRACE"))
+# The same query this many times in one interaction is probably a loop that
+# should have been one query
+N_PLUS_ONE_THRESHOLD = 3
+
+_current = ContextVar("trace", default=None)
+recent = deque(maxlen=100)  # the latest traces with any operations
+
+
+class Operation(NamedTuple):
+    collection: str
+    op: str  # e.g. "find_one"
+    shape: str  # the filter with its values left out
+    duration: float  # seconds
+    documents: int  # returned by reads, affected by writes
+    indexed: bool
+
+
+class Trace:
+    """The database operations issued while handling one interaction"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.operations = []
+        self.start = time.perf_counter()
+
+    def warnings(self) -> list[str]:
+        warnings = []
+        repeats = Counter((op.collection, op.op, op.shape) for op in self.operations)
+        for (collection, op, shape), count in repeats.items():
+            if count >= N_PLUS_ONE_THRESHOLD:
+                warnings.append(f"N+1: {collection}.{op}{shape} x{count}")
+        unindexed = {
+            f"{op.collection}.{op.op}{op.shape}"
+            for op in self.operations
+            if not op.indexed
+        }
+        warnings.extend(f"Unindexed: {query}" for query in sorted(unindexed))
+        return warnings
+
+    def summary(self) -> str:
+        database = sum(op.duration for op in self.operations)
+        lines = [
+            f"{self.name}: {len(self.operations)} ops, {database * 1000:.1f}ms in the "
+            f"database of {(time.perf_counter() - self.start) * 1000:.1f}ms"
+        ]
+        lines.extend(
+            f"  {op.collection}.{op.op}{op.shape} {op.duration * 1000:.1f}ms, "
+            f"{op.documents} docs"
+            for op in self.operations
+        )
+        lines.extend(f"  ! {warning}" for warning in self.warnings())
+        return "\n".join(lines)
+
+
+def begin(interaction) -> None:
+    """Starts tracing the database operations made for `interaction`"""
+    if not TRACING:
+        return
+    command = interaction.command
+    trace = Trace(f"/{command.qualified_name}" if command else "interaction")
+    # discord.py dispatches completion events in new tasks, which only see
+    # the contextvar as it was when they were created, so keep it here too
+    interaction.extras["trace"] = trace
+    _current.set(trace)
+
+
+def end(interaction) -> Trace | None:
+    """Logs the summary of `interaction`'s trace, if it was traced"""
+    trace = interaction.extras.pop("trace", None)
+    if trace is None:
+        return None
+    if trace.operations:
+        recent.append(trace)
+        print(f"[TRACE]: {trace.summary()}")
+    return trace
+
+
+def shape(query) -> str:
+    """Returns a filter's structure without its values,
+    e.g. {'_id': ?, 'expiration': {'$lte': ?}}"""
+
+    def strip(value):
+        if isinstance(value, dict):
+            return {key: strip(item) for key, item in sorted(value.items())}
+        if isinstance(value, list) and value and isinstance(value[0], dict):
+            # $or / $and clauses
+            return [strip(item) for item in value]
+        return "?"
+
+    return str(strip(query or {})).replace("'?'", "?")
+
+
+def uses_index(query, indexes) -> bool:
+    """Whether some index could serve `query`.
+
+    An index is usable if the query constrains its first key, and for a
+    partial index, also the fields of its filter. Every clause of an $or
+    needs an index of its own.
+    """
+    query = query or {}
+    if not query:
+        # A full scan is intentional, e.g. loading the cache
+        return True
+    if "$or" in query:
+        return all(uses_index(clause, indexes) for clause in query["$or"])
+
+    fields = {key for key in query if not key.startswith("$")}
+    if "_id" in fields:
+        return True
+    for index in indexes:
+        document = index.document
+        first = next(iter(document["key"]))
+        partial = document.get("partialFilterExpression", {})
+        if first in fields and all(field in fields for field in partial):
+            return True
+    return False
+
+
+class TracedCursor:
+    def __init__(self, cursor, collection, query):
+        self._cursor = cursor
+        self._collection = collection
+        self._query = query
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if name in ("sort", "limit", "skip", "batch_size", "hint"):
+            # Keep the chain traced
+            def chain(*args, **kwargs):
+                attribute(*args, **kwargs)
+                return self
+
+            return chain
+        return attribute
+
+    async def to_list(self, length=None):
+        start = time.perf_counter()
+        documents = await self._cursor.to_list(length=length)
+        self._collection._record("find", self._query, start, len(documents))
+        return documents
+
+    async def _iterate(self):
+        start = time.perf_counter()
+        count = 0
+        try:
+            async for document in self._cursor:
+                count += 1
+                yield document
+        finally:
+            # Includes the time spent by the consumer between batches
+            self._collection._record("find", self._query, start, count)
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class TracedCollection:
+    """Wraps a Motor collection to record its operations in the current trace.
+
+    Operations outside of a traced interaction are passed straight through.
+    """
+
+    def __init__(self, collection, indexes=()):
+        self._collection = collection
+        self._indexes = list(indexes)
+        self.name = collection.name
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def _record(self, op, query, start, documents) -> None:
+        trace = _current.get()
+        if trace is None:
+            return
+        trace.operations.append(
+            Operation(
+                self.name,
+                op,
+                shape(query),
+                time.perf_counter() - start,
+                documents,
+                uses_index(query, self._indexes),
+            )
+        )
+
+    def find(self, query=None, *args, **kwargs):
+        return TracedCursor(self._collection.find(query, *args, **kwargs), self, query)
+
+    async def find_one(self, query=None, *args, **kwargs):
+        start = time.perf_counter()
+        document = await self._collection.find_one(query, *args, **kwargs)
+        self._record("find_one", query, start, int(document is not None))
+        return document
+
+    async def find_one_and_update(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        document = await self._collection.find_one_and_update(query, *args, **kwargs)
+        self._record("find_one_and_update", query, start, int(document is not None))
+        return document
+
+    async def count_documents(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        count = await self._collection.count_documents(query, *args, **kwargs)
+        self._record("count_documents", query, start, count)
+        return count
+
+    async def insert_one(self, document, *args, **kwargs):
+        start = time.perf_counter()
+        result = await self._collection.insert_one(document, *args, **kwargs)
+        self._record("insert_one", None, start, 1)
+        return result
+
+    async def _write(self, op, query, *args, **kwargs):
+        start = time.perf_counter()
+        result = await getattr(self._collection, op)(query, *args, **kwargs)
+        affected = getattr(result, "modified_count", None)
+        if affected is None:
+            affected = getattr(result, "deleted_count", 0)
+        self._record(
+            op, query, start, affected + bool(getattr(result, "upserted_id", None))
+        )
+        return result
+
+    async def update_one(self, query, *args, **kwargs):
+        return await self._write("update_one", query, *args, **kwargs)
+
+    async def update_many(self, query, *args, **kwargs):
+        return await self._write("update_many", query, *args, **kwargs)
+
+    async def delete_one(self, query, *args, **kwargs):
+        return await self._write("delete_one", query, *args, **kwargs)
+
+    async def delete_many(self, query, *args, **kwargs):
+        return await self._write("delete_many", query, *args, **kwargs)
+
+    async def bulk_write(self, requests, *args, **kwargs):
+        start = time.perf_counter()
+        result = await self._collection.bulk_write(requests, *args, **kwargs)
+        # One round trip, shaped by its first filter
+        query = getattr(requests[0], "_filter", None) if requests else None
+        self._record("bulk_write", query, start, result.modified_count)
+        return result